@@ -0,0 +1,64 @@
+import sys
+import os
+import argparse
+import datetime
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import duckdb
+from utils.reader import DatasetReader, year_frame
+from utils.sina_flow import FLOW_FIELDS
+from utils.panel_store import PanelStore
+from utils.security_master import register_sid_macros
+
+# 面板字段 → 年度 K 线上的表达式；adj_close 为后复权收盘价
+PANEL_FIELDS = {
+    "close": "k.close",
+    "adj_close": "k.close * k.adjustFactor",
+    "volume": "k.volume",
+    "amount": "k.amount",
+    "turn": "k.turn",
+    "total_mv": "k.total_mv",
+    "float_mv": "k.float_mv",
+    "peTTM": "k.peTTM",
+    "pbMRQ": "k.pbMRQ",
+}
+
+
+def main():
+    """
+    年度 K 线 / 资金流 Parquet → date × code 的 memmap 面板：
+    python scripts/build_panel.py --source output --panel-dir panel
+    面板已存在时从末日所在年份起重写该年已有交易日并追加新交易日
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default="output", help="年度 Parquet 所在目录，或 HF 数据集 repo_id")
+    parser.add_argument("--panel-dir", default="panel")
+    parser.add_argument("--start-year", type=int, default=2005, help="首次构建的起始年份")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    store = PanelStore(args.panel_dir, fields=list(PANEL_FIELDS) + list(FLOW_FIELDS.values()))
+    start_year = int(str(store.dates[-1])[:4]) if len(store.dates) else args.start_year
+    print(f"🧱 Building panel in {args.panel_dir} from {start_year} ({len(store.dates):,} dates × {len(store.sids):,} securities)")
+
+    reader = DatasetReader(args.source)
+    con = duckdb.connect()
+    register_sid_macros(con)
+
+    for year in range(start_year, datetime.date.today().year + 1):
+        k_paths = reader.resolve("kline", f"{year}-01-01", f"{year}-12-31")
+        if not k_paths:
+            continue
+        f_paths = reader.resolve("money_flow", f"{year}-01-01", f"{year}-12-31")
+        df = year_frame(con, k_paths[0], f_paths[0] if f_paths else None, PANEL_FIELDS).to_pandas()
+        fields = [c for c in df.columns if c not in ("sid", "date")]
+        written, new_days = store.append(df["date"], df["sid"].values, {c: df[c].values for c in fields})
+        print(f"   {year}: {written:,} rows, +{new_days} dates")
+
+    print(f"✅ Panel ready: {len(store.dates):,} dates × {len(store.sids):,} securities × {len(store.fields)} fields in {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import sys
+import os
+import argparse
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import duckdb
+import numpy as np
+from utils.reader import DatasetReader, year_frame
+from utils.security_master import decode_sids, register_sid_macros
+
+# Qlib 字段名 → 年度 K 线上的表达式。价格按后复权因子还原为复权价，$factor = 复权价 / 原始价
+KLINE_FIELDS = {
+    "open": "k.open * k.adjustFactor",
+    "high": "k.high * k.adjustFactor",
+    "low": "k.low * k.adjustFactor",
+    "close": "k.close * k.adjustFactor",
+    "vwap": "CASE WHEN k.volume > 0 THEN k.amount / (k.volume * 100) * k.adjustFactor END",
+    "volume": "k.volume / k.adjustFactor",
+    "amount": "k.amount",
+    "factor": "k.adjustFactor",
+    "change": "k.pctChg / 100",
+    "turn": "k.turn",
+    "pe_ttm": "k.peTTM",
+    "pb_mrq": "k.pbMRQ",
+    "ps_ttm": "k.psTTM",
+    "pcf_ttm": "k.pcfTTM",
+    "eps_ttm": "k.epsTTM",
+    "total_mv": "k.total_mv",
+    "float_mv": "k.float_mv",
+    "is_st": "k.isST",
+}
+INDEX_FIELDS = {
+    "open": "k.open", "high": "k.high", "low": "k.low", "close": "k.close",
+    "volume": "k.volume", "amount": "k.amount", "factor": "1.0", "change": "k.pctChg / 100",
+}
+
+
+def load_calendar(qlib_dir):
+    path = os.path.join(qlib_dir, "calendars", "day.txt")
+    if not os.path.exists(path):
+        return np.array([], dtype="datetime64[D]")
+    with open(path, "r", encoding="utf-8") as f:
+        return np.array([line.strip() for line in f if line.strip()], dtype="datetime64[D]")
+
+
+def load_instruments(qlib_dir):
+    path = os.path.join(qlib_dir, "instruments", "all.txt")
+    out = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split("\t")
+                if len(parts) == 3:
+                    out[parts[0]] = [parts[1], parts[2]]
+    return out
+
+
+def save_meta(qlib_dir, calendar, instruments):
+    os.makedirs(os.path.join(qlib_dir, "calendars"), exist_ok=True)
+    os.makedirs(os.path.join(qlib_dir, "instruments"), exist_ok=True)
+    with open(os.path.join(qlib_dir, "calendars", "day.txt"), "w", encoding="utf-8") as f:
+        f.write("".join(f"{d}\n" for d in calendar.astype(str)))
+    with open(os.path.join(qlib_dir, "instruments", "all.txt"), "w", encoding="utf-8") as f:
+        f.write("".join(f"{k}\t{v[0]}\t{v[1]}\n" for k, v in sorted(instruments.items())))
+
+
+def append_bin(path, start, values):
+    """
+    Qlib .bin：首个 float32 为起始日历下标，其后为逐交易日取值。
+    已存在时从文件末端续写：重叠部分跳过，中间缺口以 NaN 补齐；重复执行结果不变
+    """
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            head = int(np.frombuffer(f.read(4), dtype="<f4")[0])
+        nxt = head + os.path.getsize(path) // 4 - 1
+        if start + len(values) <= nxt:
+            return
+        if start < nxt:
+            values = values[nxt - start:]
+            start = nxt
+        with open(path, "ab") as f:
+            np.concatenate([np.full(start - nxt, np.nan, dtype="<f4"), values.astype("<f4")]).tofile(f)
+    else:
+        with open(path, "wb") as f:
+            np.concatenate([np.array([start], dtype="<f4"), values.astype("<f4")]).tofile(f)
+
+
+def dump_table(table, calendar, qlib_dir, instruments, workers):
+    """按标的并行续写 .bin：每只标的一次性构造 [首日, 末日] 的稠密矩阵，每个字段一次顺序写"""
+    if table.num_rows == 0:
+        return 0
+    sid = table["sid"].to_numpy()
+    days = table["date"].to_numpy().astype("datetime64[D]")
+    pos = np.searchsorted(calendar, days)
+    ok = (pos < len(calendar)) & (calendar[np.minimum(pos, len(calendar) - 1)] == days)
+    fields = [n for n in table.column_names if n not in ("sid", "date")]
+    values = np.column_stack([table[n].to_numpy(zero_copy_only=False).astype("<f4") for n in fields])[ok]
+    sid, pos, days = sid[ok], pos[ok], days[ok]
+
+    bounds = np.flatnonzero(np.diff(sid)) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(sid)]])
+    names = decode_sids(sid[starts], "tdx")
+
+    def write_one(i):
+        s, e = starts[i], ends[i]
+        p0 = pos[s]
+        block = np.full((pos[e - 1] - p0 + 1, len(fields)), np.nan, dtype="<f4")
+        block[pos[s:e] - p0] = values[s:e]
+        inst_dir = os.path.join(qlib_dir, "features", names[i])
+        os.makedirs(inst_dir, exist_ok=True)
+        for j, field in enumerate(fields):
+            append_bin(os.path.join(inst_dir, f"{field}.day.bin"), int(p0), block[:, j])
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(write_one, range(len(starts))))
+
+    for i, name in enumerate(names):
+        first, last = str(days[starts[i]]), str(days[ends[i] - 1])
+        key = name.upper()
+        if key in instruments:
+            first = min(first, instruments[key][0])
+            last = max(last, instruments[key][1])
+        instruments[key] = [first, last]
+    return len(starts)
+
+
+def main():
+    """
+    已发布的年度 K 线 / 资金流 Parquet → Qlib 二进制目录（calendars / instruments / features）：
+    python scripts/export_qlib.py --source output --qlib-dir qlib_data/cn_data
+    目录已存在时只读取日历末日所在年份起的文件，并仅向 .bin 追加新交易日
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default="output", help="年度 Parquet 所在目录，或 HF 数据集 repo_id")
+    parser.add_argument("--qlib-dir", default="qlib_data/cn_data")
+    parser.add_argument("--start-year", type=int, default=2005, help="首次全量导出的起始年份")
+    parser.add_argument("--workers", type=int, default=16, help="按标的并行写文件的线程数")
+    parser.add_argument("--with-index", action="store_true", help="同时导出指数日线（基准）")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    calendar = load_calendar(args.qlib_dir)
+    instruments = load_instruments(args.qlib_dir)
+    start_year = int(str(calendar[-1])[:4]) if len(calendar) else args.start_year
+    mode = "incremental" if len(calendar) else "full"
+    print(f"📦 Qlib export ({mode}) from {start_year} into {args.qlib_dir}")
+
+    reader = DatasetReader(args.source)
+    con = duckdb.connect()
+    register_sid_macros(con)
+
+    total = 0
+    for year in range(start_year, datetime.date.today().year + 1):
+        k_paths = reader.resolve("kline", f"{year}-01-01", f"{year}-12-31")
+        if not k_paths:
+            continue
+        f_paths = reader.resolve("money_flow", f"{year}-01-01", f"{year}-12-31")
+        table = year_frame(con, k_paths[0], f_paths[0] if f_paths else None, KLINE_FIELDS)
+
+        # 日历以个股交易日为准，只在末端追加新日期
+        new_days = np.unique(table["date"].to_numpy().astype("datetime64[D]"))
+        if len(calendar):
+            new_days = new_days[new_days > calendar[-1]]
+        calendar = np.concatenate([calendar, new_days])
+
+        n = dump_table(table, calendar, args.qlib_dir, instruments, args.workers)
+        if args.with_index:
+            i_paths = reader.resolve("index_kline", f"{year}-01-01", f"{year}-12-31")
+            if i_paths:
+                n += dump_table(year_frame(con, i_paths[0], None, INDEX_FIELDS), calendar, args.qlib_dir, instruments, args.workers)
+        total += table.num_rows
+        print(f"   {year}: {table.num_rows:,} bars, {n:,} instruments, calendar → {calendar[-1] if len(calendar) else '-'}")
+
+    save_meta(args.qlib_dir, calendar, instruments)
+    print(f"✅ Qlib export done: {total:,} bars, {len(instruments):,} instruments, {len(calendar):,} trading days in {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
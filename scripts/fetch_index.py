@@ -6,7 +6,11 @@ import requests
 import json
 import datetime
 import time
-import subprocess
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.tdx_client import read_engine_output, TdxEngineClient
+from utils.security_master import encode_codes
+from utils.data_types import to_date32
 
 # 已剔除 19 只不稳定指数，保留 37 只高冗余稳健核心指数
 INDEX_LIST = {
@@ -36,29 +40,20 @@ for _ in range(3):
 
 def fetch_from_go_engine(codes_str, is_incremental=False):
     """使用 Go 版 TDX 引擎获取指数K线"""
-    csv_out = "temp_index_kline.csv"
-    go_cmd = ["./tdx_fetcher", "-mode=index", f"-codes={codes_str}", f"-out={csv_out}"]
+    arrow_out = "temp_index_kline.arrow"
     
     try:
-        result = subprocess.run(go_cmd, check=True, capture_output=True, text=True, timeout=120)
-        if not os.path.exists(csv_out):
+        with TdxEngineClient(timeout=120) as engine:
+            engine.fetch_index(codes_str.split(","), arrow_out, fmt="arrow")
+        if not os.path.exists(arrow_out):
             return [], None
         
-        df = pd.read_csv(csv_out)
+        df = read_engine_output(arrow_out)
         if df.empty:
             return [], None
         
-        bars = []
-        for _, row in df.iterrows():
-            bars.append({
-                "datetime": row["date"],
-                "open": float(row["open"]),
-                "high": float(row["high"]),
-                "low": float(row["low"]),
-                "close": float(row["close"]),
-                "vol": float(row["volume"]),
-                "amount": float(row["amount"])
-            })
+        df = df.rename(columns={"date": "datetime", "volume": "vol"})
+        bars = df[["code", "datetime", "open", "high", "low", "close", "vol", "amount"]].to_dict("records")
         return bars, "🚀 Go-TDX"
     except Exception as e:
         print(f"⚠️ Go engine failed: {e}")
@@ -111,9 +106,9 @@ def main():
     is_incremental = "--incremental" in sys.argv or "-i" in sys.argv
     print(f"📥 Starting Index Fetcher (Mode: {'Incremental' if is_incremental else 'Full History'})...")
     
-    # 构建指数代码字符串（逗号分隔，去除点号）
+    # 构建指数代码字符串（逗号分隔，保留点号，Go 引擎原样回填到 code 列）
     all_codes = list(INDEX_LIST.keys())
-    codes_str = ",".join([c.replace(".", "") for c in all_codes])
+    codes_str = ",".join(all_codes)
     
     all_rows = []
     success_records = []
@@ -126,7 +121,7 @@ def main():
     if bars:
         print(f"✅ Go-TDX Success: {len(bars)} rows")
         for b in bars:
-            # 需要反查 code，Go 输出的 CSV 包含 code 列
+            # Go 输出自带 code 列
             all_rows.append({
                 "date": b['datetime'][:10], "code": b.get('code', ''), "open": float(b['open']),
                 "high": float(b['high']), "low": float(b['low']), "close": float(b['close']),
@@ -170,10 +165,8 @@ def main():
         sys.exit(1)
         
     df = pd.DataFrame(all_rows)
-    df['date_dt'] = pd.to_datetime(df['date'], errors='coerce')
-    df = df.dropna(subset=['date_dt'])
-    df['date'] = df['date_dt'].dt.strftime('%Y-%m-%d')
-    df = df.drop(columns=['date_dt'])
+    df['date'] = to_date32(df['date']).values
+    df = df.dropna(subset=['date'])
     
     df = df.drop_duplicates(subset=['date', 'code'], keep='last')
     df = df.sort_values(['code', 'date'])
@@ -183,6 +176,7 @@ def main():
     
     for col in ['open', 'high', 'low', 'close', 'pctChg']: df[col] = df[col].astype('float32')
     for col in ['volume', 'amount']: df[col] = df[col].astype('float64')
+    df['sid'] = encode_codes(df['code'])
     
     os.makedirs("temp_parts", exist_ok=True)
     out_path = "temp_parts/index_kline_all.parquet"
@@ -10,6 +10,8 @@ sys.path.append(os.getcwd())
 from utils.cf_proxy import EastMoneyProxy
 from utils.cleaner import DataCleaner
 from utils.sector_catalog_builder import build_sector_catalog
+from utils.security_master import encode_codes
+from utils.data_types import to_date32
 
 OUTPUT_DIR = "temp_parts"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -139,13 +141,16 @@ def main():
         full_k = full_k[(full_k['date_dt'] <= today_dt) & (full_k['date_dt'].notnull())]
         full_k = full_k.drop(columns=['date_dt'])
         full_k = cleaner.clean_sector_kline(full_k)
+        full_k['sid'] = encode_codes(full_k['code'])
         full_k.to_parquet(f"{OUTPUT_DIR}/sector_kline_full.parquet", index=False)
         print(f"[+] K线数据存储成功: {len(full_k)} 行")
 
     if all_c_flat:
         full_c = pd.DataFrame(all_c_flat)
-        full_c['date'] = today_dt.strftime('%Y-%m-%d')
+        full_c['date'] = to_date32([today_dt] * len(full_c)).values
         full_c = full_c.drop_duplicates(subset=['sector_code', 'stock_code'])
+        full_c['sector_sid'] = encode_codes(full_c['sector_code'])
+        full_c['stock_sid'] = encode_codes(full_c['stock_code'])
         full_c.to_parquet(f"{OUTPUT_DIR}/sector_constituents_latest.parquet", index=False)
         print(f"[+] 成份股关系存储成功: {len(full_c)} 条")
 
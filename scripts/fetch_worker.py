@@ -3,53 +3,16 @@ import os
 import argparse
 import json
 import datetime
-import requests
-import time
-import subprocess
 
 # 向系统注册项目根目录，确保多层级目录下导入 utils 模块不报错
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import pandas as pd
-from tqdm import tqdm
-from concurrent.futures import ProcessPoolExecutor, as_completed
 from utils.cleaner import DataCleaner
-
-HEADERS = {'User-Agent': 'Mozilla/5.0'}
-
-# ==============================
-# 新浪资金流 (保持不变)
-# ==============================
-def fetch_sina_flow(code, start, end):
-    symbol = code.replace(".", "")
-    url = f"https://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/MoneyFlow.ssl_qsfx_lscjfb?page=1&num=10000&sort=opendate&asc=0&daima={symbol}"
-    for attempt in range(3): 
-        try:
-            r = requests.get(url, headers=HEADERS, timeout=10)
-            if r.status_code != 200: continue
-            data = r.json()
-            if not data: return pd.DataFrame() 
-            df = pd.DataFrame(data)
-            rename_map = {
-                'opendate': 'date', 'netamount': 'net_amount',
-                'r0_net': 'main_net', 'r1_net': 'super_net',
-                'r2_net': 'large_net', 'r3_net': 'medium_net',
-                'r4_net': 'small_net'
-            }
-            df.rename(columns=rename_map, inplace=True)
-            df = df[(df['date'] >= start) & (df['date'] <= end)].copy()
-            if not df.empty: df['code'] = code
-            return df
-        except:
-            time.sleep(1)
-    return pd.DataFrame()
-
-def process_flow(code, start, end):
-    try:
-        df_f = fetch_sina_flow(code, start, end)
-        return code, df_f, ""
-    except Exception as e:
-        return code, None, str(e)
+from utils.tdx_client import TdxEngineClient
+from utils.kline_pipeline import build_kline_part
+from utils.sina_flow import fetch_flows, load_flow_store, merge_flow_store
+from utils.security_master import encode_codes
 
 # ==============================
 # 主函数
@@ -73,77 +36,58 @@ def main():
 
     print(f"Job {args.index}: {len(codes)} stocks ({start}~{end})")
 
-    # 1. 编译并调用 Go 引擎极速获取 K 线
-    csv_out = f"temp_kline_{args.index}.csv"
+    # 1. 调用常驻 Go 引擎极速获取 K 线
+    # Arrow IPC 列式输出：类型已与 Schema 对齐，省去 CSV 字符串格式化与反解析
+    kline_out = f"temp_kline_{args.index}.arrow"
     print("🚀 Invoking TDX Go Engine for K-lines...")
-    go_cmd = ["./tdx_fetcher", f"-codes={','.join(codes)}", f"-out={csv_out}"]
-    subprocess.run(go_cmd, check=True)
-
-    # 2. Python 处理 K 线并补全 Schema
-    df_k_all = pd.DataFrame()
-    if os.path.exists(csv_out):
-        df_k_all = pd.read_csv(csv_out)
-        if not df_k_all.empty:
-            
-            # 🚀 强力自愈清洗门禁：使用 errors='coerce' 强制进行 datetime 转换，自动识别并优雅剔除一切畸变脏日期行（如 200846-07-02）
-            df_k_all['date_dt'] = pd.to_datetime(df_k_all['date'], errors='coerce')
-            df_k_all = df_k_all.dropna(subset=['date_dt'])
-            df_k_all['date'] = df_k_all['date_dt'].dt.strftime('%Y-%m-%d')
-            df_k_all = df_k_all.drop(columns=['date_dt'])
-
-            # 🚀 扩容：强转所有新引入的股本市值数值列为 numeric 浮点数，确保没有字符串混入
-            num_cols = [
-                'open', 'high', 'low', 'close', 'volume', 'amount', 'adjustFactor',
-                'turn', 'total_shares', 'float_shares', 'total_mv', 'float_mv'
-            ]
-            for col in num_cols:
-                if col in df_k_all.columns:
-                    df_k_all[col] = pd.to_numeric(df_k_all[col], errors='coerce')
-
-            # 过滤年份
-            df_k_all = df_k_all[(df_k_all['date'] >= start) & (df_k_all['date'] <= end)].copy()
-            
-            # 计算衍生指标
-            df_k_all = df_k_all.sort_values(['code', 'date'])
-            df_k_all['pctChg'] = df_k_all.groupby('code')['close'].pct_change() * 100
-            df_k_all['pctChg'] = df_k_all['pctChg'].fillna(0.0)
-            
-            # 🚀 降维占位：peTTM 与 pbMRQ 属于基本面，留在 finalize 阶段通过 DuckDB 结合东财财报全量 ASOF 注入
-            df_k_all['peTTM'] = 0.0
-            df_k_all['pbMRQ'] = 0.0
-            
-            # 标记 ST
-            st_map = {}
-            if os.path.exists("stock_list_master.json"):
-                with open("stock_list_master.json", "r", encoding="utf-8") as f:
-                    m_list = json.load(f)
-                    for x in m_list:
-                        st_map[x['code']] = 1 if "ST" in x['code_name'] else 0
-            df_k_all['isST'] = df_k_all['code'].map(st_map).fillna(0).astype(int)
+    # 多主站换站重试后仍失败的代码落盘为 JSON 列表，由 merge 阶段汇总进 QC 报告
+    os.makedirs("temp_parts", exist_ok=True)
+    fetch_kwargs = dict(failed_out=f"temp_parts/kline_failed_{args.index}.json")
+    if args.year == 0:
+        # 日常增量：凭上次运行的断点只拉取年初以来的尾部 K 线，断点文件缺失时 Go 端自动回退全量
+        fetch_kwargs.update(since=start, state="kline_state.json", state_out=f"temp_parts/kline_state_{args.index}.json")
+    # 优先使用代码索引的二进制 GBBQ 缓存，仅解码本分片需要的股票
+    gbbq_path = "gbbq.bin" if os.path.exists("gbbq.bin") else "gbbq_clean.csv"
+    # 逐码耗时/行数/尝试次数回流到 code_stats.json，供下次 prepare_matrix 的成本模型分片
+    code_stats = {}
+
+    def on_code(ev):
+        code_stats[ev["code"]] = {"kline_ms": ev.get("ms", 0), "kline_rows": ev.get("rows", 0), "attempts": ev.get("attempts", 1)}
+
+    with TdxEngineClient(gbbq=gbbq_path) as engine:
+        summary = engine.fetch_klines(codes, kline_out, fmt="arrow", on_code=on_code, **fetch_kwargs)
+    print(f"   Go Engine: {summary.get('rows', 0)} rows, {summary.get('retried', 0)} retries, {len(summary.get('failed') or [])} failed codes")
+
+    # 2. Polars 惰性流水线：日期门禁、年份过滤、去重、单次排序、pctChg、ST 标记与类型对齐一次完成并直接落盘
+    os.makedirs("temp_parts", exist_ok=True)
+    k_rows = build_kline_part(kline_out, start, end, f"temp_parts/kline_part_{args.index}.parquet")
+    print(f"   K-line part: {k_rows} rows")
 
-    # 3. 并发获取 Sina 资金流
+    # 3. asyncio 并发获取 Sina 资金流（共享 keep-alive 连接池，结果直接累加为列式批次）
     print("🚀 Fetching Sina Money Flow...")
-    res_f = []
-    with ProcessPoolExecutor(max_workers=min(8, os.cpu_count())) as executor:
-        futures = [executor.submit(process_flow, c, start, end) for c in codes]
-        for future in tqdm(as_completed(futures), total=len(codes)):
-            c, f, err = future.result()
-            if f is not None and not f.empty:
-                res_f.append(f)
-
-    # 4. 数据清洗与落盘
-    os.makedirs("temp_parts", exist_ok=True)
-    cleaner = DataCleaner()
+    # 日常增量：以已发布的当年资金流文件为水位，只抓取水位日之后的小页数据，再与已入库数据拼回全年分片
+    df_f_stored, flow_watermarks = pd.DataFrame(), {}
+    if args.year == 0:
+        df_f_stored, flow_watermarks = load_flow_store(f"stock_money_flow_{curr_year}.parquet", codes, start, end)
+        print(f"   Flow watermarks: {len(flow_watermarks)}/{len(codes)} codes resume incrementally")
+    flow_stats = {}
+    df_f_all, flow_failed = fetch_flows(codes, start, end, watermarks=flow_watermarks, stats=flow_stats)
+    if flow_failed:
+        print(f"⚠️ Money flow failed for {len(flow_failed)} codes after retries")
+
+    # 4. 资金流清洗与落盘
+    if not df_f_all.empty:
+        df_f_all = DataCleaner().clean_money_flow(df_f_all)
+    df_f_all = merge_flow_store(df_f_stored, df_f_all)
+    if not df_f_all.empty:
+        df_f_all["sid"] = encode_codes(df_f_all["code"])
+        df_f_all.to_parquet(f"temp_parts/flow_part_{args.index}.parquet", index=False)
 
-    if not df_k_all.empty:
-        df_k_all = cleaner.clean_stock_kline(df_k_all)
-        df_k_all.to_parquet(f"temp_parts/kline_part_{args.index}.parquet", index=False)
+    for code, stat in flow_stats.items():
+        code_stats.setdefault(code, {}).update(stat)
+    with open(f"temp_parts/code_stats_{args.index}.json", "w", encoding="utf-8") as f:
+        json.dump(code_stats, f)
 
-    if res_f:
-        df_f_all = pd.concat(res_f)
-        df_f_all = cleaner.clean_money_flow(df_f_all)
-        df_f_all.to_parquet(f"temp_parts/flow_part_{args.index}.parquet", index=False)
-        
     print(f"✅ Job {args.index} Finished.")
 
 if __name__ == "__main__":
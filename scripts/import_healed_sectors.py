@@ -1,4 +1,5 @@
 import os
+import sys
 import zipfile
 import glob
 import json
@@ -6,6 +7,9 @@ import polars as pl
 from datetime import datetime
 import shutil
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.security_master import encode_codes
+
 def main():
     zip_path = "Full_Sector_Klines.zip"
     extract_dir = "extracted_sectors"
@@ -83,7 +87,7 @@ def main():
     # 转换为 Polars DataFrame，严格对齐 stockA 历史 Parquet Schema
     df_k = pl.DataFrame(kline_rows)
     df_k = df_k.with_columns([
-        pl.col("date").cast(pl.Utf8),
+        pl.col("date").str.to_date("%Y-%m-%d", strict=False),
         pl.col("open").cast(pl.Float32),
         pl.col("close").cast(pl.Float32),
         pl.col("high").cast(pl.Float32),
@@ -98,6 +102,7 @@ def main():
     
     # 全局去重 & 升序排序
     df_k = df_k.unique(subset=["date", "code"], keep="last").sort(["code", "date"])
+    df_k = df_k.with_columns(pl.Series("sid", encode_codes(df_k["code"].to_numpy()), dtype=pl.Int32))
     
     # 写入 Parquet (采用 zstd 高性能无损压缩)
     kline_out_path = os.path.join(output_dir, "sector_kline_full.parquet")
@@ -126,13 +131,17 @@ def main():
                 df_c = pl.DataFrame(transformed_comp)
                 today_str = datetime.now().strftime('%Y-%m-%d')
                 df_c = df_c.with_columns([
-                    pl.lit(today_str).alias("date"),
+                    pl.lit(today_str).str.to_date("%Y-%m-%d").alias("date"),
                     pl.col("sector_code").cast(pl.Utf8),
                     pl.col("stock_code").cast(pl.Utf8),
                     pl.col("sector_name").cast(pl.Utf8)
                 ])
                 # 基于板块与个股关系去重
                 df_c = df_c.unique(subset=["sector_code", "stock_code"], keep="last").sort(["sector_code", "stock_code"])
+                df_c = df_c.with_columns(
+                    pl.Series("sector_sid", encode_codes(df_c["sector_code"].to_numpy()), dtype=pl.Int32),
+                    pl.Series("stock_sid", encode_codes(df_c["stock_code"].to_numpy()), dtype=pl.Int32),
+                )
                 
                 const_out_path = os.path.join(output_dir, "sector_constituents_latest.parquet")
                 df_c.write_parquet(const_out_path, compression="zstd")
@@ -10,10 +10,20 @@ import datetime
 import argparse
 import shutil
 import json
-import numpy as np
 import pandas as pd
 from utils.hf_manager import HFManager
 from utils.qc import QualityControl
+from utils.shard_planner import load_code_stats, update_code_stats
+from utils.merge_manifest import MergeManifest, MANIFEST_NAME, fingerprint, fingerprint_by
+from utils.security_master import register_sid_macros, build_security_master
+from utils.data_types import DATE_COLUMNS, to_date32
+from utils.publisher import Publisher, HFBackend, LocalBackend
+from utils.fundamentals import CUMULATIVE_FIELDS
+from utils.pit_store import PitStore, PIT_STORE_NAME, append_snapshot, load_pit_store, save_pit_store
+from utils.row_index import cluster_row_groups, update_row_index, row_index_name
+
+# 按年分区的数据集：K 线、资金流、板块 K 线、指数 K 线
+YEAR_TEMPLATES = ["stock_kline_{}.parquet", "stock_money_flow_{}.parquet", "sector_kline_{}.parquet", "index_kline_{}.parquet"]
 
 def get_stock_list_with_names():
     print("📋 Loading stock list metadata from JSON...")
@@ -29,8 +39,8 @@ def get_stock_list_with_names():
             print(f"⚠️ Failed to parse stock JSON: {e}")
     return pd.DataFrame()
 
-def calculate_ttm_net_profit(f10_parquet_path):
-    print("🧮 Calculating Trailing Twelve Months (TTM) Net Profit (Vectorized)...")
+def calculate_ttm_net_profit(f10_parquet_path, pit_path):
+    print("🧮 Appending F10 snapshot to point-in-time store and building as-of timeline (Vectorized)...")
     if not os.path.exists(f10_parquet_path):
         print("⚠️ Warning: F10 raw parquet not found! PE/PB will fall back to 0.0.")
         return pd.DataFrame()
@@ -39,108 +49,209 @@ def calculate_ttm_net_profit(f10_parquet_path):
     if df.empty:
         return pd.DataFrame()
 
-    # 1. 基础时序准备与对齐
-    df = df.sort_values(['code', 'report_date'])
-    df['month_day'] = df['report_date'].str[-5:]
-    df['year'] = df['report_date'].str[:4].astype(int)
-
-    # 提取前一年Q4（12-31）的归母利润快照
-    df_q4 = df[df['month_day'] == '12-31'][['code', 'year', 'parent_netprofit']].copy()
-    df_q4['prev_year'] = df_q4['year']
-    df_q4.rename(columns={'parent_netprofit': 'q4_prev_profit'}, inplace=True)
-
-    # 提取前一年同期的累计归母利润
-    df_prev = df.copy()
-    df_prev['prev_year'] = df_prev['year']
-    df_prev.rename(columns={'parent_netprofit': 'prev_cum_profit'}, inplace=True)
-
-    df['prev_year'] = df['year'] - 1
-    df = pd.merge(df, df_q4[['code', 'prev_year', 'q4_prev_profit']], on=['code', 'prev_year'], how='left')
-    df = pd.merge(df, df_prev[['code', 'prev_year', 'month_day', 'prev_cum_profit']], on=['code', 'prev_year', 'month_day'], how='left')
-
-    q_num_map = {'03-31': 1, '06-30': 2, '09-30': 3, '12-31': 4}
-    df['q_num'] = df['month_day'].map(q_num_map).fillna(4)
-
-    # -------------------------------------------------------------------------
-    # 🚀 极致性能提速：使用 Numpy 矩阵条件判断，彻底干掉 .iterrows() 逐行循环
-    # -------------------------------------------------------------------------
-    cum = df['parent_netprofit'].values
-    q4_prev = df['q4_prev_profit'].values
-    prev_cum = df['prev_cum_profit'].values
-    q_num = df['q_num'].values
-
-    # 定义三种业务场景的并行代数运算公式
-    cond_q4 = (df['month_day'] == '12-31').values
-    cond_fallback = (df_q4['q4_prev_profit'].isnull().reindex(df.index, fill_value=True).values) | \
-                    (df_prev['prev_cum_profit'].isnull().reindex(df.index, fill_value=True).values)
-
-    # 公式 1: 如果是年报，TTM 直接等于年报累计数值
-    expr_q4 = cum
-    # 公式 2: 如果上年同期或Q4缺失，采用线性估算公式推演
-    expr_fallback = cum * 4.0 / q_num
-    # 公式 3: 标准滚动 TTM 差分计算
-    expr_normal = cum + q4_prev - prev_cum
-
-    # 矩阵级别条件判定
-    ttm_net_profit = np.select(
-        [cond_q4, cond_fallback],
-        [expr_q4, expr_fallback],
-        default=expr_normal
-    )
-
-    # 将计算结果写回
-    df['ttm_net_profit'] = ttm_net_profit
-    # 如果财务原始归母净利润为空值，强制对齐为空
-    df.loc[df['parent_netprofit'].isnull(), 'ttm_net_profit'] = np.nan
-    
-    f10_clean = df[['code', 'name', 'report_date', 'notice_date', 'bps', 'ttm_net_profit']].copy()
+    # 快照只追加新报告期 / 修订版本，历史交易日始终看到当时可得的那一版数据
+    store = append_snapshot(load_pit_store(pit_path), df, datetime.date.today())
+    save_pit_store(store, pit_path)
+    timeline = PitStore(store).timeline
+    timeline['ttm_net_profit'] = timeline['parent_netprofit_ttm']
+
+    ttm_cols = [f"{f}_ttm" for f in CUMULATIVE_FIELDS]
+    f10_clean = timeline[['code', 'sid', 'name', 'report_date', 'notice_date', 'avail_date', 'bps', 'ttm_net_profit'] + ttm_cols].copy()
+    for c in ['report_date', 'notice_date', 'avail_date']:
+        f10_clean[c] = to_date32(f10_clean[c]).values
     os.makedirs("temp_parts", exist_ok=True)
     clean_f10_path = "temp_parts/f10_ttm_clean.parquet"
     f10_clean.to_parquet(clean_f10_path, index=False)
-    print(f"✅ F10 TTM 矩阵计算完毕，瞬时生成完毕。")
+    print(f"✅ F10 PIT 时间线构建完毕：{len(store):,} 个版本 → {len(f10_clean):,} 个状态点。")
     return f10_clean
 
+def mount_view(con, name, source):
+    """
+    挂载会话级源视图：缺少 sid 列的来源（历史分片、财报/主营/预告小表）按 code 即时补齐；
+    v1 字符串日期列统一 TRY_CAST 为 DATE（空串、畸变日期为 NULL），下游比较与 ASOF 均走原生日期
+    """
+    schema = dict((c[0], c[1]) for c in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall())
+    casts = [f"TRY_CAST({c} AS DATE) AS {c}" for c in DATE_COLUMNS if schema.get(c) == "VARCHAR"]
+    replace = f" REPLACE ({', '.join(casts)})" if casts else ""
+    extra = "" if "sid" in schema else ", code_sid(code) AS sid"
+    con.execute(f"CREATE OR REPLACE TEMP VIEW {name} AS SELECT *{replace}{extra} FROM {source}")
+
+def materialize_kline(con, refresh_days=0):
+    """
+    v_kline → 按 (sid, date) 排序的物化表 kline；传入 --db 时该表随库落盘，可供离线 SQL 复用。
+    refresh_days > 0 且库中已有同结构的 kline 表时，只对截止日之后的 K 线重算联表，之前的行原样沿用；否则全量重建
+    """
+    cols = [c[:2] for c in con.execute("DESCRIBE v_kline").fetchall()]
+    exists = con.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = 'kline' AND NOT temporary").fetchone()[0] > 0
+    if refresh_days > 0 and exists and [c[:2] for c in con.execute("DESCRIBE kline").fetchall()] == cols:
+        cutoff = (datetime.date.today() - datetime.timedelta(days=refresh_days)).strftime("%Y-%m-%d")
+        print(f"🧊 Refreshing kline table from {cutoff} (trailing {refresh_days} days)...")
+        con.execute(f"""
+            CREATE OR REPLACE TABLE kline AS
+            SELECT * FROM (
+                SELECT * FROM kline WHERE date < '{cutoff}'
+                UNION ALL
+                SELECT * FROM v_kline WHERE date >= '{cutoff}'
+            ) ORDER BY sid, date
+        """)
+    else:
+        if refresh_days > 0:
+            print("🧊 No reusable kline table in the database, falling back to full rebuild")
+        print("🧊 Materializing kline table...")
+        con.execute("CREATE OR REPLACE TABLE kline AS SELECT * FROM v_kline ORDER BY sid, date")
+    # 写回主库文件：进程退出时未 close 也不会把新表留在 .wal 中，缓存单个 .duckdb 即可
+    con.execute("CHECKPOINT")
+    print(f"   kline: {con.execute('SELECT count(*) FROM kline').fetchone()[0]:,} rows")
+
+def export_year_partitions(con, view_name, years, name_tpl, manifest, force=False):
+    """
+    视图只求值一次：物化为带年份键的临时表，一次分组扫描算出各年指纹，
+    再只对内容有变化的年份从临时表逐年写出 output/{name_tpl}（年内按 (sid, date) 排序）。
+    没有数据的年份不产生文件，自然跳过。返回 ([(路径, 文件名, 指纹, 年份)], [未变化文件名])
+    """
+    y_lo, y_hi = min(years), max(years)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE t_part AS
+        SELECT *, CAST(year(date) AS INTEGER) AS _year
+        FROM {view_name}
+        WHERE date >= '{y_lo}-01-01' AND date <= '{y_hi}-12-31'
+    """)
+    fps = fingerprint_by(con, "t_part", "_year")
+
+    changed, unchanged = [], []
+    for y in years:
+        if y not in fps:
+            continue
+        if not force and manifest.unchanged(name_tpl.format(y), fps[y]):
+            print(f"⏭️ {name_tpl.format(y)} unchanged ({fps[y]['rows']:,} rows), skip rewrite & upload")
+            unchanged.append(name_tpl.format(y))
+        else:
+            changed.append(y)
+    if not changed:
+        return [], unchanged
+
+    # 分区 COPY（PARTITION_BY）不保证分区内沿用 ORDER BY 的顺序：变化年份逐年单独 COPY，年内按 (sid, date) 排序
+    written = []
+    for y in changed:
+        out_name = name_tpl.format(y)
+        out_path = f"output/{out_name}"
+        con.execute(f"""
+            COPY (SELECT * EXCLUDE (_year) FROM t_part WHERE _year = {y} ORDER BY sid, date)
+            TO '{out_path}' (FORMAT 'PARQUET', COMPRESSION 'ZSTD')
+        """)
+        written.append((out_path, out_name, fps[y], y))
+    con.execute("DROP TABLE IF EXISTS t_part")
+    return written, unchanged
+
+def plan_sid_buckets(con, sources, n):
+    """
+    按 sid 把全市场切成 n 个代码数相近的连续区间 [(lo, hi))：区间内各自按 (sid, date) 排序，
+    拼接时按区间顺序首尾相接即整体有序，无需再做全局排序
+    """
+    union = " UNION ".join(f"SELECT DISTINCT sid FROM {s}" for s in sources)
+    sids = [r[0] for r in con.execute(f"SELECT sid FROM ({union}) ORDER BY sid").fetchall()]
+    if not sids:
+        return []
+    n = max(1, min(n, len(sids)))
+    cuts = [sids[len(sids) * i // n] for i in range(1, n)]
+    edges = [-2**31] + sorted(set(cuts)) + [2**31 - 1]
+    return list(zip(edges[:-1], edges[1:]))
+
+def export_year_partitions_bucketed(con, view_name, years, name_tpl, manifest, buckets, force=False):
+    """
+    分桶导出：每次只让一个 sid 区间的数据经过联表与排序，逐年排序落盘到暂存目录，
+    峰值内存只与单桶规模相关；随后逐年按桶序流式拼接并计算指纹（与 export_year_partitions 口径一致）。
+    返回值同 export_year_partitions
+    """
+    y_lo, y_hi = min(years), max(years)
+    stage_dir = f"temp_parts/export_{view_name}"
+    shutil.rmtree(stage_dir, ignore_errors=True)
+    os.makedirs(stage_dir, exist_ok=True)
+    for i, (lo, hi) in enumerate(buckets):
+        print(f"   🪣 bucket {i + 1}/{len(buckets)}: sid [{lo}, {hi})")
+        # 单桶联表结果先物化，再逐年单独 COPY 并排序（PARTITION_BY 不保证分区内顺序）
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE t_bucket AS
+            SELECT *, CAST(year(date) AS INTEGER) AS _year
+            FROM {view_name}
+            WHERE sid >= {lo} AND sid < {hi}
+              AND date >= '{y_lo}-01-01' AND date <= '{y_hi}-12-31'
+        """)
+        for (y,) in con.execute("SELECT DISTINCT _year FROM t_bucket ORDER BY 1").fetchall():
+            con.execute(f"""
+                COPY (SELECT * EXCLUDE (_year) FROM t_bucket WHERE _year = {y} ORDER BY sid, date)
+                TO '{stage_dir}/{y}_b{i:04d}.parquet' (FORMAT 'PARQUET', COMPRESSION 'ZSTD')
+            """)
+    con.execute("DROP TABLE IF EXISTS t_bucket")
+
+    written, unchanged = [], []
+    for y in years:
+        files = [f"{stage_dir}/{y}_b{i:04d}.parquet" for i in range(len(buckets)) if os.path.exists(f"{stage_dir}/{y}_b{i:04d}.parquet")]
+        if not files:
+            continue
+        out_name = name_tpl.format(y)
+        src = f"SELECT * FROM read_parquet({files}, hive_partitioning=false)"
+        fp = fingerprint(con, src)
+        if not force and manifest.unchanged(out_name, fp):
+            print(f"⏭️ {out_name} unchanged ({fp['rows']:,} rows), skip rewrite & upload")
+            unchanged.append(out_name)
+            continue
+        out_path = f"output/{out_name}"
+        con.execute(f"COPY ({src}) TO '{out_path}' (FORMAT 'PARQUET', COMPRESSION 'ZSTD')")
+        written.append((out_path, out_name, fp, y))
+    shutil.rmtree(stage_dir, ignore_errors=True)
+    return written, unchanged
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode", type=str, default="hf", choices=["hf", "release", "local"])
     parser.add_argument("--year", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="忽略分区清单，全部重写并上传")
+    parser.add_argument("--db", type=str, default=":memory:", help="DuckDB 库路径；默认内存库（溢写到 temp_directory），指定文件时物化的 kline 表随库保留")
+    parser.add_argument("--refresh-days", type=int, default=0, help=">0 时仅重算 --db 库中 kline 表最近 N 天的联表结果（库需跨运行保留）")
+    parser.add_argument("--publish-dir", type=str, default="", help="非 HF 模式下发布到本地目录（离线基准/联调）")
+    parser.add_argument("--workers", type=int, default=8, help="发布时的哈希与上传并发数")
+    parser.add_argument("--buckets", type=int, default=0, help=">0 时按 sid 分桶逐桶联表导出 K 线与资金流，峰值内存不随历史长度增长")
+    parser.add_argument("--memory-limit", type=str, default="4GB", help="DuckDB 内存上限")
     args = parser.parse_args()
     
     qc = QualityControl()
+
+    # 已发布分区的内容指纹清单、F10 点时库与各数据集行组索引：HF 模式从数据集拉取，release/local 模式沿用 output/ 下的上一版
+    os.makedirs("output", exist_ok=True)
+    manifest_path = f"output/{MANIFEST_NAME}"
+    hf = None
+    row_index_names = [row_index_name(t) for t in YEAR_TEMPLATES]
+    for state_name in (MANIFEST_NAME, PIT_STORE_NAME, *row_index_names):
+        if args.mode == "hf" and os.getenv("HF_TOKEN"):
+            hf = hf or HFManager(os.getenv("HF_TOKEN"), os.getenv("HF_REPO"))
+            hf.download_file(state_name, local_dir="output")
+        elif args.publish_dir and os.path.exists(os.path.join(args.publish_dir, state_name)):
+            shutil.copyfile(os.path.join(args.publish_dir, state_name), f"output/{state_name}")
+    manifest = MergeManifest(manifest_path)
+    pending, skipped = {}, []
     
     print("🦆 Initializing DuckDB Engine...")
-    con = duckdb.connect()
-    con.execute("SET memory_limit='4GB'")
+    con = duckdb.connect(args.db)
+    con.execute(f"SET memory_limit='{args.memory_limit}'")
     con.execute("SET temp_directory='duckdb_temp.tmp'")
+    register_sid_macros(con)
     
     k_files = glob.glob("all_artifacts/kline_part_*.parquet")
     f_files = glob.glob("all_artifacts/flow_part_*.parquet")
     sec_k_files = glob.glob("all_artifacts/sector_kline_full.parquet")
     idx_source = glob.glob("all_artifacts/index_kline_all.parquet")
 
-    if k_files:
-        con.execute(f"CREATE OR REPLACE VIEW v_kline_raw AS SELECT * FROM read_parquet({k_files}, union_by_name=True)")
-    else:
-        con.execute("CREATE OR REPLACE VIEW v_kline_raw AS SELECT * FROM (SELECT '' as date, '' as code) WHERE 1=0")
-
-    if idx_source:
-        con.execute(f"CREATE OR REPLACE VIEW v_index_raw AS SELECT * FROM read_parquet('{idx_source[0]}')")
-    else:
-        con.execute("CREATE OR REPLACE VIEW v_index_raw AS SELECT * FROM (SELECT '' as date, '' as code) WHERE 1=0")
-
-    if f_files:
-        con.execute(f"CREATE OR REPLACE VIEW v_flow AS SELECT * FROM read_parquet({f_files}, union_by_name=True)")
-    else:
-        con.execute("CREATE OR REPLACE VIEW v_flow AS SELECT * FROM (SELECT '' as date, '' as code) WHERE 1=0")
-
-    if sec_k_files:
-        con.execute(f"CREATE OR REPLACE VIEW v_sec_k AS SELECT * FROM read_parquet('{sec_k_files[0]}')")
-    else:
-        con.execute("CREATE OR REPLACE VIEW v_sec_k AS SELECT * FROM (SELECT '' as date, '' as code) WHERE 1=0")
+    empty_source = "(SELECT '' as date, '' as code) WHERE 1=0"
+    mount_view(con, "v_kline_raw", f"read_parquet({k_files}, union_by_name=True)" if k_files else empty_source)
+    mount_view(con, "v_index_raw", f"read_parquet('{idx_source[0]}')" if idx_source else empty_source)
+    mount_view(con, "v_flow", f"read_parquet({f_files}, union_by_name=True)" if f_files else empty_source)
+    mount_view(con, "v_sec_k", f"read_parquet('{sec_k_files[0]}')" if sec_k_files else empty_source)
 
     # 1. 载入 F10 财务指标计算 valuation
     f10_raw_path = "output/all_stocks_f10_raw.parquet"
-    f10_ttm_df = calculate_ttm_net_profit(f10_raw_path)
+    pit_path = f"output/{PIT_STORE_NAME}"
+    f10_ttm_df = calculate_ttm_net_profit(f10_raw_path, pit_path)
     
     # 2. 载入雪球主营业务明细数据
     mainbus_raw_path = "output/all_stocks_mainbus_raw.parquet"
@@ -151,49 +262,51 @@ def main():
     has_event = os.path.exists(event_raw_path)
     
     if not f10_ttm_df.empty:
-        con.execute("CREATE OR REPLACE VIEW v_f10 AS SELECT * FROM read_parquet('temp_parts/f10_ttm_clean.parquet')")
+        mount_view(con, "v_f10", "read_parquet('temp_parts/f10_ttm_clean.parquet')")
         
         # 利用东财 notice_date 给雪球主营业务打上物理公告披露时间戳，去未来化
         if has_mainbus:
             print("🧱 Building Look-ahead-bias-free Product Mapping View...")
-            con.execute(f"CREATE OR REPLACE VIEW v_mainbus_raw AS SELECT * FROM read_parquet('{mainbus_raw_path}')")
+            mount_view(con, "v_mainbus_raw", f"read_parquet('{mainbus_raw_path}')")
             
-            # 建立 (code, report_date) -> notice_date 的安全发布日期映射字典
+            # 建立 (sid, report_date) -> 首次可得日 的安全发布日期映射字典（取 PIT 库首个版本）
+            mount_view(con, "v_f10_pit", f"read_parquet('{pit_path}')")
             con.execute("""
-                CREATE OR REPLACE VIEW v_notice_map AS
-                SELECT DISTINCT code, report_date, notice_date
-                FROM v_f10
-                WHERE notice_date IS NOT NULL AND notice_date != '';
+                CREATE OR REPLACE TEMP VIEW v_notice_map AS
+                SELECT sid, report_date, min(avail_date) AS notice_date
+                FROM v_f10_pit
+                GROUP BY sid, report_date;
             """)
             
             # 筛选“产品级”主营构成明细并合并公告日，再使用 STRING_AGG 强行降维拼接至每股每季度 1 行
             con.execute("""
-                CREATE OR REPLACE VIEW v_mainbus_flat AS
+                CREATE OR REPLACE TEMP VIEW v_mainbus_flat AS
                 SELECT 
-                    m.code,
+                    m.sid,
                     map.notice_date,
                     STRING_AGG(m.item_name || ':' || ROUND(m.income_ratio, 1), '|') as product_ratios
                 FROM v_mainbus_raw m
                 INNER JOIN v_notice_map map
-                   ON m.code = map.code
+                   ON m.sid = map.sid
                   AND m.report_date = map.report_date
                 WHERE m.item_type = 2  -- 2 代表产品级明细
-                GROUP BY m.code, map.notice_date;
+                GROUP BY m.sid, map.notice_date;
             """)
             
         # 📢 创建事件库 DuckDB 视图
         if has_event:
             print("📢 Mounting Performance Forecast Event View...")
-            con.execute(f"CREATE OR REPLACE VIEW v_event_forecast AS SELECT * FROM read_parquet('{event_raw_path}')")
+            mount_view(con, "v_event_forecast", f"read_parquet('{event_raw_path}')")
         
         print("⚡ Performing Look-ahead-bias-free ASOF JOIN via DuckDB...")
         
         # 组装最终带产业链产品暴露因子、业绩公告因子的最终 K 线联表
         join_sql = """
-            CREATE OR REPLACE VIEW v_kline AS
+            CREATE OR REPLACE TEMP VIEW v_kline AS
             SELECT 
                 k.date,
                 k.code,
+                k.sid,
                 k.open,
                 k.high,
                 k.low,
@@ -213,6 +326,15 @@ def main():
                     WHEN f.bps IS NULL OR f.bps <= 0 THEN 0.0
                     ELSE CAST(k.close / f.bps AS FLOAT)
                 END as pbMRQ,
+                CASE 
+                    WHEN f.total_operate_income_ttm IS NULL OR f.total_operate_income_ttm <= 0 OR k.total_mv IS NULL OR k.total_mv <= 0 THEN 0.0
+                    ELSE CAST(k.total_mv / f.total_operate_income_ttm AS FLOAT)
+                END as psTTM,
+                CASE 
+                    WHEN f.mgjyxjje_ttm IS NULL OR f.mgjyxjje_ttm <= 0 THEN 0.0
+                    ELSE CAST(k.close / f.mgjyxjje_ttm AS FLOAT)
+                END as pcfTTM,
+                CAST(COALESCE(f.basic_eps_ttm, 0.0) AS FLOAT) as epsTTM,
                 k.adjustFactor,
                 k.isST,
                 k.total_shares,
@@ -236,14 +358,14 @@ def main():
         join_sql += """
             FROM v_kline_raw k
             ASOF LEFT JOIN v_f10 f
-                ON SUBSTR(k.code, 4) = f.code
-               AND k.date >= f.notice_date
+                ON k.sid = f.sid
+               AND k.date >= f.avail_date
         """
         
         if has_mainbus:
             join_sql += """
             ASOF LEFT JOIN v_mainbus_flat mb
-                ON SUBSTR(k.code, 4) = mb.code
+                ON k.sid = mb.sid
                AND k.date >= mb.notice_date
             """
             
@@ -251,14 +373,23 @@ def main():
         if has_event:
             join_sql += """
             ASOF LEFT JOIN v_event_forecast evt
-                ON SUBSTR(k.code, 4) = evt.code
+                ON k.sid = evt.sid
                AND k.date >= evt.notice_date
             """
             
         con.execute(join_sql)
     else:
         print("⚠️ Warning: F10 TTM View could not be created. PE/PB remains 0.0.")
-        con.execute("CREATE OR REPLACE VIEW v_kline AS SELECT * FROM v_kline_raw")
+        con.execute("CREATE OR REPLACE TEMP VIEW v_kline AS SELECT * FROM v_kline_raw")
+
+    # ASOF 联表只求值一次，物化为按 (sid, date) 排序的表，后续导出与 QC 均读此表；
+    # 分桶模式下不做全量物化，联表随各桶导出按需求值
+    buckets = []
+    if args.buckets > 0:
+        buckets = plan_sid_buckets(con, ["v_kline_raw", "v_flow"], args.buckets)
+        print(f"🪣 Bucketed mode: {len(buckets)} sid buckets under memory_limit={args.memory_limit}")
+    else:
+        materialize_kline(con, args.refresh_days)
 
     os.makedirs("output", exist_ok=True)
     targets = {}
@@ -274,26 +405,25 @@ def main():
     if os.path.exists(raw_f10_p):
         targets[raw_f10_p] = "all_stocks_f10_raw.parquet"
         try:
-            df_f10_raw = pd.read_parquet(raw_f10_p)
-            qc.check_dataframe(
-                df_f10_raw, 
+            qc.check_parquet(
+                raw_f10_p,
                 "all_stocks_f10_raw.parquet", 
-                ["code", "report_date"], 
-                file_path=raw_f10_p
+                ["code", "report_date"]
             )
         except Exception as e:
             print(f"⚠️ QC check failed for f10 raw: {e}")
         
+    if os.path.exists(pit_path):
+        targets[pit_path] = PIT_STORE_NAME
+
     raw_mainbus_p = "output/all_stocks_mainbus_raw.parquet"
     if os.path.exists(raw_mainbus_p):
         targets[raw_mainbus_p] = "all_stocks_mainbus_raw.parquet"
         try:
-            df_mb_raw = pd.read_parquet(raw_mainbus_p)
-            qc.check_dataframe(
-                df_mb_raw, 
+            qc.check_parquet(
+                raw_mainbus_p,
                 "all_stocks_mainbus_raw.parquet", 
-                ["item_name", "income_ratio", "report_date"], 
-                file_path=raw_mainbus_p
+                ["item_name", "income_ratio", "report_date"]
             )
         except Exception as e:
             print(f"⚠️ QC check failed for mainbus raw: {e}")
@@ -302,12 +432,10 @@ def main():
     if has_event:
         targets[event_raw_path] = "event_earnings_forecast.parquet"
         try:
-            df_evt = pd.read_parquet(event_raw_path)
-            qc.check_dataframe(
-                df_evt,
+            qc.check_parquet(
+                event_raw_path,
                 "event_earnings_forecast.parquet",
-                ["code", "notice_date", "forecast_yoy_mid"],
-                file_path=event_raw_path
+                ["code", "notice_date", "forecast_yoy_mid"]
             )
         except Exception as e:
             print(f"⚠️ QC check failed for event forecast: {e}")
@@ -316,7 +444,7 @@ def main():
         p = 'output/sector_list.parquet'
         con.execute(f"COPY (SELECT DISTINCT code, name, type FROM v_sec_k ORDER BY type, code) TO '{p}' (FORMAT 'PARQUET')")
         targets[p] = "sector_list.parquet"
-        qc.check_dataframe(pd.read_parquet(p), "sector_list.parquet", ["name"], file_path=p)
+        qc.check_parquet(p, "sector_list.parquet", ["name"])
 
     index_meta = [
         {"code": "sh.000001", "name": "上证指数"}, {"code": "sz.399001", "name": "深证成指"},
@@ -345,6 +473,14 @@ def main():
     targets[idx_p] = "index_list.parquet"
     qc.check_dataframe(df_idx_meta, "index_list.parquet", ["name"], file_path=idx_p)
 
+    # 统一证券主表：个股 / 指数 / 板块 → int32 sid 与三种代码形态的对照
+    df_sectors = con.execute("SELECT DISTINCT code, name FROM v_sec_k").df() if sec_k_files else None
+    df_master = build_security_master(df_stocks, df_idx_meta, df_sectors)
+    master_p = "output/security_master.parquet"
+    df_master.to_parquet(master_p, index=False)
+    targets[master_p] = "security_master.parquet"
+    qc.check_dataframe(df_master, "security_master.parquet", ["sid", "name"], file_path=master_p)
+
     if args.year == 9999:
         years = range(2005, datetime.datetime.now().year + 1)
     elif args.year > 0:
@@ -352,53 +488,60 @@ def main():
     else:
         years = [datetime.datetime.now().year]
 
-    for y in years:
-        print(f"🔪 Merging & Splitting Data for Year {y}...")
-        start_date, end_date = f"{y}-01-01", f"{y}-12-31"
-        
-        # 📢 动态升级 K 线质检列，增加业绩预告事件因子的完整性检验
-        kline_qc_cols = ["close", "volume", "peTTM", "pbMRQ", "total_mv", "turn"]
-        if has_mainbus:
-            kline_qc_cols.append("product_ratios")
-        if has_event:
-            kline_qc_cols.extend(["forecast_yoy", "is_forecast_good", "is_forecast_bad"])
-            
-        tasks = [
-            ("v_kline", f"stock_kline_{y}.parquet", kline_qc_cols),
-            ("v_flow", f"stock_money_flow_{y}.parquet", ["net_amount"]),
-            ("v_sec_k", f"sector_kline_{y}.parquet", ["close"]),
-            ("v_index_raw", f"index_kline_{y}.parquet", ["close", "volume"])
-        ]
-        
-        for view_name, out_name, check_cols in tasks:
-            out_path = f"output/{out_name}"
-            try:
-                count = con.execute(f"SELECT count(*) FROM {view_name} WHERE date >= '{start_date}' AND date <= '{end_date}'").fetchone()[0]
-                if count == 0:
-                    continue
-
-                con.execute(f"""
-                    COPY (
-                        SELECT * FROM {view_name} 
-                        WHERE date >= '{start_date}' AND date <= '{end_date}' 
-                        ORDER BY code, date
-                    ) TO '{out_path}' (FORMAT 'PARQUET', COMPRESSION 'ZSTD')
-                """)
-                
-                if os.path.exists(out_path):
-                    df_check = pd.read_parquet(out_path)
-                    qc.check_dataframe(df_check, out_name, check_cols, file_path=out_path)
-                    targets[out_path] = out_name
-            except Exception as e:
-                print(f"❌ Error merging {out_name}: {e}")
-
-        # 板块成分股关系复制
-        sec_c_files = glob.glob("all_artifacts/sector_constituents_latest.parquet")
-        if sec_c_files:
-            c_out = f"output/sector_constituents_{y}.parquet"
+    # 📢 动态升级 K 线质检列，增加业绩预告事件因子的完整性检验
+    kline_qc_cols = ["close", "volume", "peTTM", "pbMRQ", "total_mv", "turn"]
+    if has_mainbus:
+        kline_qc_cols.append("product_ratios")
+    if has_event:
+        kline_qc_cols.extend(["forecast_yoy", "is_forecast_good", "is_forecast_bad"])
+
+    # 第 4 项：是否参与分桶（个股级大表分桶，板块 / 指数小表整体导出）
+    kline_tpl, flow_tpl, sector_tpl, index_tpl = YEAR_TEMPLATES
+    tasks = [
+        ("v_kline" if buckets else "kline", kline_tpl, kline_qc_cols, True),
+        ("v_flow", flow_tpl, ["net_amount"], True),
+        ("v_sec_k", sector_tpl, ["close"], False),
+        ("v_index_raw", index_tpl, ["close", "volume"], False)
+    ]
+
+    # 每个视图只物化一次，全部年份在一次 PARTITION_BY 写出中落盘
+    for view_name, name_tpl, check_cols, bucketed in tasks:
+        print(f"🔪 Merging & Splitting {view_name} for {min(years)}~{max(years)} in one pass...")
+        try:
+            if bucketed and buckets:
+                written, unchanged = export_year_partitions_bucketed(con, view_name, years, name_tpl, manifest, buckets, args.force)
+            else:
+                written, unchanged = export_year_partitions(con, view_name, years, name_tpl, manifest, args.force)
+        except Exception as e:
+            print(f"❌ Error merging {view_name}: {e}")
+            continue
+        skipped.extend(unchanged)
+        row_indexes = {}
+        for out_path, out_name, fp, y in written:
+            # 行组按代码边界重切并产出 sid → 行组索引，读取端可直接定位单只代码
+            row_indexes[y] = cluster_row_groups(out_path)
+            # 流式质检：直接对落盘 Parquet 聚合，不把整年数据读入 pandas
+            qc.check_parquet(out_path, out_name, check_cols)
+            targets[out_path] = out_name
+            pending[out_name] = fp
+        index_name = row_index_name(name_tpl)
+        if update_row_index(f"output/{index_name}", row_indexes):
+            targets[f"output/{index_name}"] = index_name
+
+    # 板块成分股关系复制：各年份为同一份快照，指纹只算一次
+    sec_c_files = glob.glob("all_artifacts/sector_constituents_latest.parquet")
+    if sec_c_files:
+        c_fp = fingerprint(con, f"SELECT * FROM read_parquet('{sec_c_files[0]}')", date_col=None)
+        for y in years:
+            c_name = f"sector_constituents_{y}.parquet"
+            c_out = f"output/{c_name}"
+            if not args.force and manifest.unchanged(c_name, c_fp):
+                skipped.append(c_name)
+                continue
             try:
                 shutil.copy(sec_c_files[0], c_out)
-                targets[c_out] = f"sector_constituents_{y}.parquet"
+                targets[c_out] = c_name
+                pending[c_name] = c_fp
             except:
                 pass
 
@@ -417,16 +560,75 @@ def main():
         except:
             pass
 
+    # 汇总各分片的 K 线增量断点，供下次日常运行续接；以上一版为底，本次未出现的代码沿用旧断点
+    state_files = glob.glob("all_artifacts/kline_state_*.json")
+    merged_state = {}
+    for f_path in ["kline_state.json"] + state_files:
+        if not os.path.exists(f_path):
+            continue
+        try:
+            with open(f_path, 'r', encoding="utf-8") as f:
+                merged_state.update(json.load(f))
+        except:
+            pass
+    if merged_state:
+        with open("kline_state.json", "w", encoding="utf-8") as f:
+            json.dump(merged_state, f)
+
+    # 汇总各分片换主站重试后仍失败的 K 线代码
+    kline_failed = set()
+    for f_path in glob.glob("all_artifacts/kline_failed_*.json"):
+        try:
+            with open(f_path, 'r', encoding="utf-8") as f:
+                kline_failed.update(json.load(f))
+        except:
+            pass
+
+    # 各分片逐码耗时统计与历史做指数滑动平均，供下次 prepare_matrix 成本模型分片
+    run_stats = {}
+    for f_path in glob.glob("all_artifacts/code_stats_*.json"):
+        try:
+            with open(f_path, 'r', encoding="utf-8") as f:
+                run_stats.update(json.load(f))
+        except:
+            pass
+    if run_stats:
+        with open("code_stats.json", "w", encoding="utf-8") as f:
+            json.dump(update_code_stats(load_code_stats("code_stats.json"), run_stats), f)
+
     with open("output/qc_summary.md", "a", encoding="utf-8") as f:
         f.write("\n## 🛡️ 数据源监控与自愈报告\n")
         f.write(f"- **复权因子异常拦截：** 今日拦截并强制重试了 **{len(all_retried_codes)}** 只存在复权因子错乱的股票。\n")
-
-    if args.mode == "hf" and os.getenv("HF_TOKEN"):
-        print("🚀 Uploading Consolidations to Hugging Face...")
-        hf = HFManager(os.getenv("HF_TOKEN"), os.getenv("HF_REPO"))
-        for local, remote in targets.items():
-            hf.upload_file(local, remote)
+        if merged_state:
+            f.write(f"- **增量断点：** 已为 **{len(merged_state)}** 只股票保存 K 线续接断点。\n")
+        f.write(f"- **K 线抓取失败：** 多主站重试后仍有 **{len(kline_failed)}** 只股票未能获取。\n")
+        if kline_failed:
+            f.write(f"  - `{', '.join(sorted(kline_failed))}`\n")
+        f.write(f"- **增量发布：** **{len(pending)}** 个分区内容有变化并重写，**{len(skipped)}** 个分区与已发布版本一致、跳过重写与上传。\n")
+
+    # 发布后端：HF 数据集，或 --publish-dir 指定的本地目录（离线基准与联调）
+    publisher = None
+    journal_path = "output/.publish_journal.json"
+    if hf:
+        publisher = Publisher(HFBackend(os.getenv("HF_TOKEN"), os.getenv("HF_REPO"), max_workers=args.workers), journal_path, max_workers=args.workers)
+    elif args.publish_dir:
+        publisher = Publisher(LocalBackend(args.publish_dir, max_workers=args.workers), journal_path, max_workers=args.workers)
+
+    if publisher:
+        print(f"🚀 Publishing Consolidations to {publisher.backend.name}...")
+        try:
+            publisher.publish(targets, f"Update {len(targets)} files ({datetime.date.today()})")
+        finally:
+            # 提交成功或与远端一致的分区才登记指纹：中途失败重跑时，已发布的分区会被识别为未变化
+            for name in publisher.done & pending.keys():
+                manifest.record(name, pending[name])
+            manifest.save()
+            publisher.publish({manifest_path: MANIFEST_NAME}, "Update merge manifest")
     else:
+        # release/local 模式由外部步骤发布 output/，清单随分区文件一并上传
+        for name, fp in pending.items():
+            manifest.record(name, fp)
+        manifest.save()
         print(f"\n{'='*50}")
         print(f"✅ Data Preparation Success!")
         print(f"📂 Location: {os.path.abspath('output/')}")
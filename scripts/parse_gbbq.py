@@ -1,30 +1,34 @@
 import sys
 import os
 import pandas as pd
-from pytdx.reader import GbbqReader
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.gbbq import decode_gbbq, write_gbbq_cache
 
 def main():
     gbbq_path = "gbbq.dat"
     out_path = "gbbq_clean.csv"
+    bin_path = "gbbq.bin"
     if len(sys.argv) > 1:
         gbbq_path = sys.argv[1]
     if len(sys.argv) > 2:
         out_path = sys.argv[2]
+    if len(sys.argv) > 3:
+        bin_path = sys.argv[3]
         
-    print(f"📖 Parsing {gbbq_path} using PyTDX GbbqReader...")
+    print(f"📖 Decoding {gbbq_path} with vectorized GBBQ decoder...")
     if not os.path.exists(gbbq_path):
         print(f"❌ Error: {gbbq_path} not found!")
         sys.exit(1)
         
-    reader = GbbqReader()
     try:
-        df = reader.get_df(gbbq_path)
+        df = decode_gbbq(gbbq_path)
     except Exception as e:
-        print(f"❌ PyTDX Reader failed with error: {e}")
+        print(f"❌ GBBQ decoder failed with error: {e}")
         sys.exit(1)
         
     if df is None:
-        print("❌ Error: PyTDX returned None!")
+        print("❌ Error: GBBQ decoder returned None!")
         sys.exit(1)
         
     print("📊 Successfully parsed GBBQ DataFrame!")
@@ -43,5 +47,9 @@ def main():
     df.to_csv(out_path, index=False)
     print(f"✅ Saved clean GBBQ to {out_path}")
 
+    # 按 (code, date) 排序的二进制缓存：Go 引擎与 Python 只按代码索引取所需记录，免去全量 CSV 解析
+    write_gbbq_cache(df, bin_path)
+    print(f"✅ Saved GBBQ cache to {bin_path}")
+
 if __name__ == "__main__":
     main()
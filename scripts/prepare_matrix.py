@@ -1,14 +1,25 @@
 import json
-import math
-import random
-import subprocess
+import argparse
 import os
+import sys
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.tdx_client import TdxEngineClient
+from utils.shard_planner import load_code_stats, plan_shards
+
+# 分片数上限：与 Actions 并发 job 配额对齐
 NUM_CHUNKS = 19
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stats", type=str, default="code_stats.json", help="历次运行的逐码耗时/行数统计")
+    parser.add_argument("--target-seconds", type=float, default=600, help="单分片目标墙钟时间")
+    parser.add_argument("--max-chunks", type=int, default=NUM_CHUNKS)
+    args = parser.parse_args()
+
     print("🚀 Invoking Go Engine to fetch Master Stock List via TDX...")
-    subprocess.run(["./tdx_fetcher", "-mode=list"], check=True)
+    with TdxEngineClient(concurrency=1) as engine:
+        engine.list_stocks(out="stock_list_master.json")
     
     if not os.path.exists("stock_list_master.json"):
         print("❌ Go Engine failed to produce stock_list_master.json")
@@ -21,14 +32,17 @@ def main():
     valid_stocks = [x['code'] for x in master_list]
     print(f"✅ Total valid A-shares from TDX: {len(valid_stocks)}")
 
-    random.shuffle(valid_stocks)
-    chunk_size = math.ceil(len(valid_stocks) / NUM_CHUNKS)
-    chunks = []
-    
-    for i in range(NUM_CHUNKS):
-        subset = valid_stocks[i * chunk_size : (i + 1) * chunk_size]
-        if subset:
-            chunks.append({"index": i, "codes": subset})
+    stats = load_code_stats(args.stats)
+    if stats:
+        # 成本模型 + LPT 装箱：分片数由目标墙钟时间推出，最小化最慢分片
+        shards, est = plan_shards(valid_stocks, stats, args.target_seconds, args.max_chunks)
+        print(f"📐 Planned {len(shards)} shards from {len(stats)} code stats, est. makespan {max(est):.0f}s")
+    else:
+        # 首次运行无历史统计：各代码成本相同，按代码顺序轮流放入各分片（结果可复现）
+        shards, _ = plan_shards(valid_stocks, {}, float("inf"), args.max_chunks, min_shards=args.max_chunks)
+        print(f"📐 No code stats yet, evenly split into {len(shards)} shards")
+
+    chunks = [{"index": i, "codes": subset} for i, subset in enumerate(shards) if subset]
 
     with open("stock_matrix.json", "w", encoding="utf-8") as f:
         json.dump(chunks, f, ensure_ascii=False)
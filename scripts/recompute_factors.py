@@ -0,0 +1,48 @@
+import sys
+import os
+import argparse
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from utils.adjust import compute_equity_columns, EQUITY_OUTPUT_COLUMNS
+
+
+def main():
+    """
+    GBBQ 修订后离线重算全市场复权因子、股本、市值、换手率，无需重新下载 K 线：
+    python scripts/recompute_factors.py stock_kline_2024.parquet --gbbq gbbq.bin
+    注意：复权因子是全历史累乘，输入需覆盖每只股票自上市以来的完整日线
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", nargs="+", help="K 线 Parquet 文件（同一批股票的全部年份）")
+    parser.add_argument("--gbbq", default="gbbq.bin", help="gbbq.bin / gbbq.dat / gbbq_clean.csv")
+    parser.add_argument("--suffix", default="", help="输出文件名后缀，为空则原地覆盖")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    frames, columns = [], {}
+    for path in args.inputs:
+        part = pd.read_parquet(path)
+        columns[path] = list(part.columns)
+        part["_src"] = path
+        frames.append(part)
+    df = pd.concat(frames, ignore_index=True)
+    if "adjustFactor" in df.columns:
+        df["_old_adj"] = df["adjustFactor"]
+    print(f"📖 Loaded {len(df):,} bars from {len(args.inputs)} files")
+
+    out = compute_equity_columns(df, args.gbbq)
+    changed = (out["adjustFactor"] != out["_old_adj"]).sum() if "_old_adj" in out.columns else len(out)
+    print(f"🧮 Recomputed {EQUITY_OUTPUT_COLUMNS} in {time.time() - t0:.1f}s, adjustFactor changed on {changed:,} bars")
+
+    for path, part in out.groupby("_src", sort=False):
+        root, ext = os.path.splitext(path)
+        out_path = f"{root}{args.suffix}{ext}"
+        part[columns[path]].to_parquet(out_path, index=False)
+        print(f"💾 Saved {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,28 @@
 package main
 
 import (
+	"bufio"
+	"encoding/binary"
 	"encoding/csv"
 	"encoding/json"
 	"flag"
 	"fmt"
 	"io"
+	"math"
 	"os"
 	"sort"
 	"strconv"
 	"strings"
 	"sync"
+	"time"
 
+	"github.com/apache/arrow-go/v18/arrow"
+	"github.com/apache/arrow-go/v18/arrow/array"
+	"github.com/apache/arrow-go/v18/arrow/ipc"
+	"github.com/apache/arrow-go/v18/arrow/memory"
+	"github.com/apache/arrow-go/v18/parquet"
+	"github.com/apache/arrow-go/v18/parquet/compress"
+	"github.com/apache/arrow-go/v18/parquet/pqarrow"
 	"github.com/injoyai/tdx"
 	"github.com/injoyai/tdx/protocol"
 )
@@ -34,22 +45,74 @@ type EquityEventOrdered struct {
 	TotalShares float64
 }
 
+// KlineRow 单根 K 线的强类型记录，指数模式下股本/市值相关字段不输出
+type KlineRow struct {
+	Code         string
+	Date         string
+	Open         float64
+	High         float64
+	Low          float64
+	Close        float64
+	Volume       float64
+	Amount       float64
+	AdjustFactor float64
+	TotalShares  float64
+	FloatShares  float64
+	TotalMV      float64
+	FloatMV      float64
+	Turn         float64
+}
+
+// KlineState 个股增量断点：记录 since 之前最后一根 K 线收盘后的复权与股本状态
+type KlineState struct {
+	LastDate     int     `json:"last_date"`
+	LastClose    float64 `json:"last_close"`
+	AdjustFactor float64 `json:"adjust_factor"`
+	TotalShares  float64 `json:"total_shares"`
+	FloatShares  float64 `json:"float_shares"`
+}
+
 func main() {
-	modeFlag := flag.String("mode", "fetch", "Mode: 'list', 'fetch', or 'index'")
+	modeFlag := flag.String("mode", "fetch", "Mode: 'list', 'fetch', 'index', or 'serve'")
 	codesFlag := flag.String("codes", "", "Comma separated stock/index codes")
-	gbbqPath := flag.String("gbbq", "gbbq_clean.csv", "Local clean GBBQ CSV file path")
-	outFlag := flag.String("out", "temp_kline.csv", "Output CSV path")
+	gbbqPath := flag.String("gbbq", "gbbq_clean.csv", "Local GBBQ file: clean CSV or .bin cache from utils/gbbq.py")
+	outFlag := flag.String("out", "temp_kline.csv", "Output file path")
+	formatFlag := flag.String("format", "csv", "Output format: 'csv', 'arrow' (IPC file) or 'parquet'")
+	sinceFlag := flag.String("since", "", "Incremental start date (YYYY-MM-DD), requires -state")
+	stateFlag := flag.String("state", "", "Per-code incremental state JSON path")
+	stateOutFlag := flag.String("state-out", "", "Updated state JSON path (default: same as -state)")
+	failedOutFlag := flag.String("failed-out", "", "JSON path for codes that still failed after retries")
+	hostsFlag := flag.String("hosts", "", "Comma separated TDX hosts (ip:port); default: built-in list")
+	concurrencyFlag := flag.Int("concurrency", poolOpts.MaxConns, "Max concurrent TDX connections (adaptive)")
+	retriesFlag := flag.Int("retries", poolOpts.Retries, "Per-code retries on a different host")
 	flag.Parse()
 
+	if *hostsFlag != "" {
+		for _, h := range strings.Split(*hostsFlag, ",") {
+			if h = strings.TrimSpace(h); h != "" {
+				poolOpts.Hosts = append(poolOpts.Hosts, h)
+			}
+		}
+	}
+	poolOpts.MaxConns = *concurrencyFlag
+	poolOpts.Retries = *retriesFlag
+
+	stateOut := *stateOutFlag
+	if stateOut == "" {
+		stateOut = *stateFlag
+	}
+
 	switch *modeFlag {
 	case "list":
 		runFetchList()
 	case "fetch":
-		runFetchKlinesWithLocalCSV(*codesFlag, *gbbqPath, *outFlag)
+		runFetchKlinesWithLocalCSV(*codesFlag, *gbbqPath, *outFlag, *formatFlag, *sinceFlag, *stateFlag, stateOut, *failedOutFlag)
 	case "index":
-		runFetchIndex(*codesFlag, *outFlag)
+		runFetchIndex(*codesFlag, *outFlag, *formatFlag, *failedOutFlag)
+	case "serve":
+		runServe(*gbbqPath)
 	default:
-		fmt.Println("Unknown mode. Use: list, fetch, or index")
+		fmt.Println("Unknown mode. Use: list, fetch, index, or serve")
 		os.Exit(1)
 	}
 }
@@ -62,6 +125,22 @@ func isIndex(code string) bool {
 		strings.HasPrefix(code, "bj899")
 }
 
+// gbbqTdxCode 纯数字代码补全交易所前缀
+func gbbqTdxCode(codeStr string) string {
+	prefix := "sz"
+	if strings.HasPrefix(codeStr, "60") || strings.HasPrefix(codeStr, "68") {
+		prefix = "sh"
+	} else if strings.HasPrefix(codeStr, "43") || strings.HasPrefix(codeStr, "83") || strings.HasPrefix(codeStr, "87") || strings.HasPrefix(codeStr, "88") || strings.HasPrefix(codeStr, "92") {
+		prefix = "bj"
+	}
+	return prefix + codeStr
+}
+
+// isEquityCategory 股本变动类 GBBQ 类别
+func isEquityCategory(category int) bool {
+	return category == 2 || category == 3 || category == 5 || category == 7 || category == 8 || category == 9 || category == 10
+}
+
 // LoadGbbqCSV 加载 GBBQ 数据
 func LoadGbbqCSV(filePath string) (map[string]map[int]GbbqEvent, map[string][]EquityEventOrdered, error) {
 	file, err := os.Open(filePath)
@@ -96,13 +175,7 @@ func LoadGbbqCSV(filePath string) (map[string]map[int]GbbqEvent, map[string][]Eq
 		songGu, _ := strconv.ParseFloat(record[6], 64)
 		peiGu, _ := strconv.ParseFloat(record[7], 64)
 
-		prefix := "sz"
-		if strings.HasPrefix(codeStr, "60") || strings.HasPrefix(codeStr, "68") {
-			prefix = "sh"
-		} else if strings.HasPrefix(codeStr, "43") || strings.HasPrefix(codeStr, "83") || strings.HasPrefix(codeStr, "87") || strings.HasPrefix(codeStr, "88") || strings.HasPrefix(codeStr, "92") {
-			prefix = "bj"
-		}
-		tdxCode := prefix + codeStr
+		tdxCode := gbbqTdxCode(codeStr)
 
 		if category == 1 {
 			if _, ok := gbbqMap[tdxCode]; !ok {
@@ -114,7 +187,7 @@ func LoadGbbqCSV(filePath string) (map[string]map[int]GbbqEvent, map[string][]Eq
 				SongGu:  songGu,
 				PeiGu:   peiGu,
 			}
-		} else if category == 2 || category == 3 || category == 5 || category == 7 || category == 8 || category == 9 || category == 10 {
+		} else if isEquityCategory(category) {
 			equityMap[tdxCode] = append(equityMap[tdxCode], EquityEventOrdered{
 				Date:        date,
 				FloatShares: songGu * 10000.0,
@@ -123,8 +196,9 @@ func LoadGbbqCSV(filePath string) (map[string]map[int]GbbqEvent, map[string][]Eq
 		}
 	}
 
+	// 稳定排序：同日多条股本变动保持文件顺序，与二进制缓存的结果一致
 	for code := range equityMap {
-		sort.Slice(equityMap[code], func(i, j int) bool {
+		sort.SliceStable(equityMap[code], func(i, j int) bool {
 			return equityMap[code][i].Date < equityMap[code][j].Date
 		})
 	}
@@ -132,14 +206,808 @@ func LoadGbbqCSV(filePath string) (map[string]map[int]GbbqEvent, map[string][]Eq
 	return gbbqMap, equityMap, nil
 }
 
-// runFetchList 获取股票列表
-func runFetchList() {
-	fmt.Println("[Go Engine] Mode: LIST - Fetching A-shares list...")
-	cli, err := tdx.DialDefault()
+// parseDateInt 将 YYYY-MM-DD 转为 20060102 形式的整数日期，空串返回 0
+func parseDateInt(dateStr string) int {
+	if dateStr == "" {
+		return 0
+	}
+	dateInt, err := strconv.Atoi(strings.ReplaceAll(dateStr, "-", ""))
 	if err != nil {
-		panic(err)
+		panic(fmt.Sprintf("Invalid date: %s", dateStr))
+	}
+	return dateInt
+}
+
+// LoadKlineState 加载增量断点，文件不存在时视为首次全量运行
+func LoadKlineState(filePath string) (map[string]KlineState, error) {
+	stateMap := make(map[string]KlineState)
+	if filePath == "" {
+		return stateMap, nil
+	}
+	data, err := os.ReadFile(filePath)
+	if os.IsNotExist(err) {
+		return stateMap, nil
+	}
+	if err != nil {
+		return nil, err
+	}
+	if err := json.Unmarshal(data, &stateMap); err != nil {
+		return nil, err
+	}
+	return stateMap, nil
+}
+
+// SaveKlineState 写出增量断点
+func SaveKlineState(filePath string, stateMap map[string]KlineState) error {
+	file, err := os.Create(filePath)
+	if err != nil {
+		return err
+	}
+	defer file.Close()
+	return json.NewEncoder(file).Encode(stateMap)
+}
+
+// KlineSink K 线输出端，调用方负责加锁串行写入
+type KlineSink interface {
+	Write(rows []KlineRow) error
+	Close() error
+}
+
+// NewKlineSink 按格式创建输出端；withEquity=false 时为指数精简列
+func NewKlineSink(format, outPath string, withEquity bool) (KlineSink, error) {
+	file, err := os.Create(outPath)
+	if err != nil {
+		return nil, err
+	}
+	switch format {
+	case "csv":
+		return newCSVSink(file, withEquity), nil
+	case "arrow", "parquet":
+		return newArrowSink(file, format, withEquity)
+	default:
+		file.Close()
+		return nil, fmt.Errorf("unknown output format: %s", format)
+	}
+}
+
+// csvSink 兼容旧版的 CSV 输出
+type csvSink struct {
+	file       *os.File
+	writer     *csv.Writer
+	withEquity bool
+}
+
+func newCSVSink(file *os.File, withEquity bool) *csvSink {
+	writer := csv.NewWriter(file)
+	header := []string{"code", "date", "open", "high", "low", "close", "volume", "amount"}
+	if withEquity {
+		header = append(header, "adjustFactor", "total_shares", "float_shares", "total_mv", "float_mv", "turn")
+	}
+	writer.Write(header)
+	return &csvSink{file: file, writer: writer, withEquity: withEquity}
+}
+
+func (s *csvSink) Write(rows []KlineRow) error {
+	for _, r := range rows {
+		record := []string{
+			r.Code,
+			r.Date,
+			fmt.Sprintf("%.3f", r.Open),
+			fmt.Sprintf("%.3f", r.High),
+			fmt.Sprintf("%.3f", r.Low),
+			fmt.Sprintf("%.3f", r.Close),
+			fmt.Sprintf("%.0f", r.Volume),
+			fmt.Sprintf("%.3f", r.Amount),
+		}
+		if s.withEquity {
+			record = append(record,
+				fmt.Sprintf("%.6f", r.AdjustFactor),
+				fmt.Sprintf("%.0f", r.TotalShares),
+				fmt.Sprintf("%.0f", r.FloatShares),
+				fmt.Sprintf("%.3f", r.TotalMV),
+				fmt.Sprintf("%.3f", r.FloatMV),
+				fmt.Sprintf("%.4f", r.Turn),
+			)
+		}
+		if err := s.writer.Write(record); err != nil {
+			return err
+		}
+	}
+	return nil
+}
+
+func (s *csvSink) Close() error {
+	s.writer.Flush()
+	if err := s.writer.Error(); err != nil {
+		s.file.Close()
+		return err
+	}
+	return s.file.Close()
+}
+
+// arrowBatchRows 每累计多少行落一个 RecordBatch / Parquet RowGroup
+const arrowBatchRows = 65536
+
+// arrowSink 列式输出：列类型与 AShareDataSchema.get_stock_kline_schema() 对齐，
+// 不做字符串格式化，Python 端可直接 memory-map 读取
+type arrowSink struct {
+	file       *os.File
+	schema     *arrow.Schema
+	builder    *array.RecordBuilder
+	ipcWriter  *ipc.FileWriter
+	pqWriter   *pqarrow.FileWriter
+	withEquity bool
+	pending    int
+}
+
+func klineArrowSchema(withEquity bool) *arrow.Schema {
+	fields := []arrow.Field{
+		{Name: "code", Type: arrow.BinaryTypes.String},
+		{Name: "date", Type: arrow.BinaryTypes.String},
+		{Name: "open", Type: arrow.PrimitiveTypes.Float32},
+		{Name: "high", Type: arrow.PrimitiveTypes.Float32},
+		{Name: "low", Type: arrow.PrimitiveTypes.Float32},
+		{Name: "close", Type: arrow.PrimitiveTypes.Float32},
+		{Name: "volume", Type: arrow.PrimitiveTypes.Float64},
+		{Name: "amount", Type: arrow.PrimitiveTypes.Float64},
+	}
+	if withEquity {
+		fields = append(fields,
+			arrow.Field{Name: "adjustFactor", Type: arrow.PrimitiveTypes.Float32},
+			arrow.Field{Name: "total_shares", Type: arrow.PrimitiveTypes.Float64},
+			arrow.Field{Name: "float_shares", Type: arrow.PrimitiveTypes.Float64},
+			arrow.Field{Name: "total_mv", Type: arrow.PrimitiveTypes.Float64},
+			arrow.Field{Name: "float_mv", Type: arrow.PrimitiveTypes.Float64},
+			arrow.Field{Name: "turn", Type: arrow.PrimitiveTypes.Float32},
+		)
+	}
+	return arrow.NewSchema(fields, nil)
+}
+
+func newArrowSink(file *os.File, format string, withEquity bool) (*arrowSink, error) {
+	mem := memory.DefaultAllocator
+	schema := klineArrowSchema(withEquity)
+	s := &arrowSink{
+		file:       file,
+		schema:     schema,
+		builder:    array.NewRecordBuilder(mem, schema),
+		withEquity: withEquity,
+	}
+	var err error
+	if format == "arrow" {
+		s.ipcWriter, err = ipc.NewFileWriter(file, ipc.WithSchema(schema), ipc.WithAllocator(mem))
+	} else {
+		props := parquet.NewWriterProperties(parquet.WithCompression(compress.Codecs.Zstd))
+		s.pqWriter, err = pqarrow.NewFileWriter(schema, file, props, pqarrow.DefaultWriterProps())
+	}
+	if err != nil {
+		s.builder.Release()
+		file.Close()
+		return nil, err
+	}
+	return s, nil
+}
+
+func (s *arrowSink) Write(rows []KlineRow) error {
+	b := s.builder
+	codeB := b.Field(0).(*array.StringBuilder)
+	dateB := b.Field(1).(*array.StringBuilder)
+	openB := b.Field(2).(*array.Float32Builder)
+	highB := b.Field(3).(*array.Float32Builder)
+	lowB := b.Field(4).(*array.Float32Builder)
+	closeB := b.Field(5).(*array.Float32Builder)
+	volB := b.Field(6).(*array.Float64Builder)
+	amtB := b.Field(7).(*array.Float64Builder)
+	for _, r := range rows {
+		codeB.Append(r.Code)
+		dateB.Append(r.Date)
+		openB.Append(float32(r.Open))
+		highB.Append(float32(r.High))
+		lowB.Append(float32(r.Low))
+		closeB.Append(float32(r.Close))
+		volB.Append(r.Volume)
+		amtB.Append(r.Amount)
+	}
+	if s.withEquity {
+		adjB := b.Field(8).(*array.Float32Builder)
+		tsB := b.Field(9).(*array.Float64Builder)
+		fsB := b.Field(10).(*array.Float64Builder)
+		tmvB := b.Field(11).(*array.Float64Builder)
+		fmvB := b.Field(12).(*array.Float64Builder)
+		turnB := b.Field(13).(*array.Float32Builder)
+		for _, r := range rows {
+			adjB.Append(float32(r.AdjustFactor))
+			tsB.Append(r.TotalShares)
+			fsB.Append(r.FloatShares)
+			tmvB.Append(r.TotalMV)
+			fmvB.Append(r.FloatMV)
+			turnB.Append(float32(r.Turn))
+		}
+	}
+	s.pending += len(rows)
+	if s.pending >= arrowBatchRows {
+		return s.flush()
+	}
+	return nil
+}
+
+func (s *arrowSink) flush() error {
+	if s.pending == 0 {
+		return nil
+	}
+	rec := s.builder.NewRecord()
+	defer rec.Release()
+	s.pending = 0
+	if s.ipcWriter != nil {
+		return s.ipcWriter.Write(rec)
+	}
+	return s.pqWriter.Write(rec)
+}
+
+func (s *arrowSink) Close() error {
+	defer s.builder.Release()
+	if err := s.flush(); err != nil {
+		s.file.Close()
+		return err
+	}
+	var err error
+	if s.ipcWriter != nil {
+		err = s.ipcWriter.Close()
+	} else {
+		err = s.pqWriter.Close()
+	}
+	// pqarrow.FileWriter.Close 会顺带关闭底层文件，这里忽略重复关闭的错误
+	s.file.Close()
+	return err
+}
+
+// logOut 引擎日志输出；serve 模式下 stdout 专用于协议帧，日志改走 stderr
+var logOut io.Writer = os.Stdout
+
+// defaultConcurrency 自适应并发的起始连接数
+const defaultConcurrency = 8
+
+// defaultTdxHosts 内置行情主站列表（-hosts 为空时使用），启动时测速排序
+var defaultTdxHosts = []string{
+	"180.153.18.170:7709",
+	"180.153.18.171:7709",
+	"202.108.253.130:7709",
+	"202.108.253.131:7709",
+	"60.191.117.167:7709",
+	"115.238.56.198:7709",
+	"218.75.126.9:7709",
+	"115.238.90.165:7709",
+	"124.160.88.183:7709",
+	"60.12.136.250:7709",
+	"14.17.75.71:7709",
+	"119.147.212.81:7709",
+	"221.231.141.60:7709",
+	"101.227.73.20:7709",
+	"14.215.128.18:7709",
+	"59.173.18.140:7709",
+}
+
+// hostProbeTimeout 单个主站测速拨号超时；maxRankedHosts 参与分摊的最快主站数
+const (
+	hostProbeTimeout = 3 * time.Second
+	maxRankedHosts   = 6
+)
+
+// PoolOptions 连接池配置，由命令行参数填充
+type PoolOptions struct {
+	Hosts    []string // 候选主站，空则使用 defaultTdxHosts
+	MaxConns int      // 自适应并发上限
+	Retries  int      // 单只代码失败后换主站重试的次数
+}
+
+var poolOpts = PoolOptions{MaxConns: 32, Retries: 3}
+
+// GbbqData 解析后的除权除息事件与股本变动序列
+// CSV 来源时全量展开为 map；二进制缓存来源时只建代码索引，按需解码单只代码
+type GbbqData struct {
+	Events   map[string]map[int]GbbqEvent
+	Equities map[string][]EquityEventOrdered
+	bin      *gbbqBin
+}
+
+// Lookup 取单只代码的除权除息事件（按日期）与按日期升序的股本变动
+func (g *GbbqData) Lookup(tcode string) (map[int]GbbqEvent, []EquityEventOrdered) {
+	if g.bin != nil {
+		return g.bin.decode(tcode)
+	}
+	return g.Events[tcode], g.Equities[tcode]
+}
+
+// LoadGbbqData 加载 GBBQ 并打包为 GbbqData：.bin 走二进制缓存（utils/gbbq.py 生成），其余按 CSV 解析
+func LoadGbbqData(filePath string) (*GbbqData, error) {
+	if strings.HasSuffix(strings.ToLower(filePath), ".bin") {
+		bin, err := LoadGbbqBin(filePath)
+		if err != nil {
+			return nil, err
+		}
+		return &GbbqData{bin: bin}, nil
+	}
+	gbbqMap, equityMap, err := LoadGbbqCSV(filePath)
+	if err != nil {
+		return nil, err
+	}
+	return &GbbqData{Events: gbbqMap, Equities: equityMap}, nil
+}
+
+// gbbq 二进制缓存布局（小端）：
+// 文件头 16 字节：magic "GBBQ" | version u32 | n_codes u32 | n_records u32
+// 索引表 n_codes × 16 字节：code [8]byte | offset u32 | count u32（按代码排序）
+// 记录区 n_records × 24 字节：date i32 | category i32 | 4 × float32（按 code、date 稳定排序）
+const (
+	gbbqBinVersion    = 1
+	gbbqBinHeaderSize = 16
+	gbbqBinIndexSize  = 16
+	gbbqBinRecordSize = 24
+)
+
+type gbbqBin struct {
+	data       []byte
+	recordsOff int
+	slots      map[string][2]uint32 // code → (offset, count)
+}
+
+// LoadGbbqBin 读入二进制缓存并只解析代码索引表，记录留到 Lookup 时再解码
+func LoadGbbqBin(filePath string) (*gbbqBin, error) {
+	data, err := os.ReadFile(filePath)
+	if err != nil {
+		return nil, err
+	}
+	if len(data) < gbbqBinHeaderSize || string(data[:4]) != "GBBQ" {
+		return nil, fmt.Errorf("%s is not a gbbq cache", filePath)
+	}
+	if v := binary.LittleEndian.Uint32(data[4:8]); v != gbbqBinVersion {
+		return nil, fmt.Errorf("unsupported gbbq cache version %d", v)
+	}
+	nCodes := int(binary.LittleEndian.Uint32(data[8:12]))
+	nRecords := int(binary.LittleEndian.Uint32(data[12:16]))
+	recordsOff := gbbqBinHeaderSize + nCodes*gbbqBinIndexSize
+	if len(data) < recordsOff+nRecords*gbbqBinRecordSize {
+		return nil, fmt.Errorf("%s is truncated", filePath)
+	}
+
+	slots := make(map[string][2]uint32, nCodes)
+	for i := 0; i < nCodes; i++ {
+		entry := data[gbbqBinHeaderSize+i*gbbqBinIndexSize:]
+		code := strings.TrimRight(string(entry[:8]), "\x00")
+		slots[code] = [2]uint32{binary.LittleEndian.Uint32(entry[8:12]), binary.LittleEndian.Uint32(entry[12:16])}
+	}
+	return &gbbqBin{data: data, recordsOff: recordsOff, slots: slots}, nil
+}
+
+// decode 解码单只代码的记录，分类规则与 LoadGbbqCSV 一致；
+// float32 直接提升为 float64，与 CSV（pytdx 输出的 float32 精确十进制）解析结果逐位相同
+func (b *gbbqBin) decode(tcode string) (map[int]GbbqEvent, []EquityEventOrdered) {
+	slot, ok := b.slots[tcode]
+	if !ok {
+		return nil, nil
+	}
+
+	var events map[int]GbbqEvent
+	var equities []EquityEventOrdered
+	for i := 0; i < int(slot[1]); i++ {
+		rec := b.data[b.recordsOff+(int(slot[0])+i)*gbbqBinRecordSize:]
+		date := int(int32(binary.LittleEndian.Uint32(rec[0:4])))
+		category := int(int32(binary.LittleEndian.Uint32(rec[4:8])))
+		fenHong := float64(math.Float32frombits(binary.LittleEndian.Uint32(rec[8:12])))
+		peiJia := float64(math.Float32frombits(binary.LittleEndian.Uint32(rec[12:16])))
+		songGu := float64(math.Float32frombits(binary.LittleEndian.Uint32(rec[16:20])))
+		peiGu := float64(math.Float32frombits(binary.LittleEndian.Uint32(rec[20:24])))
+
+		if category == 1 {
+			if events == nil {
+				events = make(map[int]GbbqEvent)
+			}
+			events[date] = GbbqEvent{
+				FenHong: fenHong,
+				PeiJia:  peiJia,
+				SongGu:  songGu,
+				PeiGu:   peiGu,
+			}
+		} else if isEquityCategory(category) {
+			equities = append(equities, EquityEventOrdered{
+				Date:        date,
+				FloatShares: songGu * 10000.0,
+				TotalShares: peiGu * 10000.0,
+			})
+		}
+	}
+	return events, equities
+}
+
+// dialHost 拨号指定主站，host 为空时走库内默认主站选择
+func dialHost(host string) (*tdx.Client, error) {
+	if host == "" {
+		return tdx.DialDefault()
+	}
+	return tdx.Dial(host)
+}
+
+// probeHosts 并发测速候选主站，按建连耗时升序返回可达主站（最多 maxRankedHosts 个）
+func probeHosts(hosts []string) []string {
+	type probe struct {
+		host    string
+		latency time.Duration
+	}
+	results := make(chan probe, len(hosts))
+	for _, h := range hosts {
+		go func(host string) {
+			done := make(chan error, 1)
+			start := time.Now()
+			go func() {
+				cli, err := tdx.Dial(host)
+				if err == nil {
+					cli.Close()
+				}
+				done <- err
+			}()
+			select {
+			case err := <-done:
+				if err != nil {
+					results <- probe{host: host, latency: -1}
+					return
+				}
+				results <- probe{host: host, latency: time.Since(start)}
+			case <-time.After(hostProbeTimeout):
+				results <- probe{host: host, latency: -1}
+			}
+		}(h)
+	}
+
+	var alive []probe
+	for range hosts {
+		if r := <-results; r.latency >= 0 {
+			alive = append(alive, r)
+		}
+	}
+	sort.Slice(alive, func(i, j int) bool { return alive[i].latency < alive[j].latency })
+
+	var ranked []string
+	for i, r := range alive {
+		if i >= maxRankedHosts {
+			break
+		}
+		fmt.Fprintf(logOut, "[Go Engine] Host %s: %v\n", r.host, r.latency.Round(time.Millisecond))
+		ranked = append(ranked, r.host)
+	}
+	return ranked
+}
+
+// adaptiveLimiter AIMD 并发控制：请求成功且延迟平稳时逐步加并发，
+// 出错或延迟显著劣化（超过基线 3 倍）时按 3/4 收缩
+type adaptiveLimiter struct {
+	mu        sync.Mutex
+	cond      *sync.Cond
+	limit     int
+	minLimit  int
+	maxLimit  int
+	inFlight  int
+	successes int
+	baseline  float64 // 成功请求延迟的指数滑动平均（毫秒）
+}
+
+func newAdaptiveLimiter(initial, maxLimit int) *adaptiveLimiter {
+	if initial > maxLimit {
+		initial = maxLimit
+	}
+	l := &adaptiveLimiter{limit: initial, minLimit: 1, maxLimit: maxLimit}
+	l.cond = sync.NewCond(&l.mu)
+	return l
+}
+
+func (l *adaptiveLimiter) Acquire() {
+	l.mu.Lock()
+	for l.inFlight >= l.limit {
+		l.cond.Wait()
+	}
+	l.inFlight++
+	l.mu.Unlock()
+}
+
+func (l *adaptiveLimiter) Release(latency time.Duration, failed bool) {
+	l.mu.Lock()
+	defer l.mu.Unlock()
+	l.inFlight--
+
+	ms := float64(latency) / float64(time.Millisecond)
+	if failed || (l.baseline > 0 && ms > 3*l.baseline) {
+		l.limit = l.limit * 3 / 4
+		if l.limit < l.minLimit {
+			l.limit = l.minLimit
+		}
+		l.successes = 0
+	} else {
+		l.successes++
+		if l.successes >= l.limit && l.limit < l.maxLimit {
+			l.limit++
+			l.successes = 0
+		}
+	}
+	if !failed {
+		if l.baseline == 0 {
+			l.baseline = ms
+		} else {
+			l.baseline = 0.9*l.baseline + 0.1*ms
+		}
+	}
+	l.cond.Broadcast()
+}
+
+func (l *adaptiveLimiter) Limit() int {
+	l.mu.Lock()
+	defer l.mu.Unlock()
+	return l.limit
+}
+
+// poolConn 连接槽位：绑定一个主站，cli 为空表示待拨号
+type poolConn struct {
+	cli  *tdx.Client
+	host string
+}
+
+// ClientPool 多主站 TDX 长连接池：槽位按测速排名轮流绑定主站，连接在任务间复用，
+// 出错的连接在下次取用时重新拨号；并发度由 adaptiveLimiter 在 [1, MaxConns] 内自适应
+type ClientPool struct {
+	slots   chan *poolConn
+	hosts   []string
+	size    int
+	retries int
+	limiter *adaptiveLimiter
+
+	mu       sync.Mutex
+	nextHost int
+}
+
+// NewClientPool 测速候选主站并建立连接池，预热起始并发数的连接，其余槽位用时再拨号
+func NewClientPool(opts PoolOptions) *ClientPool {
+	size := opts.MaxConns
+	if size < 1 {
+		size = 1
+	}
+	candidates := opts.Hosts
+	if len(candidates) == 0 {
+		candidates = defaultTdxHosts
+	}
+	hosts := probeHosts(candidates)
+	if len(hosts) == 0 {
+		fmt.Fprintln(logOut, "[Go Engine] Warning: no probed host reachable, falling back to default dialer.")
+		hosts = []string{""}
+	}
+
+	p := &ClientPool{
+		slots:   make(chan *poolConn, size),
+		hosts:   hosts,
+		size:    size,
+		retries: opts.Retries,
+		limiter: newAdaptiveLimiter(defaultConcurrency, size),
+	}
+	for i := 0; i < size; i++ {
+		pc := &poolConn{host: hosts[i%len(hosts)]}
+		if i < p.limiter.Limit() {
+			if cli, err := dialHost(pc.host); err == nil {
+				pc.cli = cli
+			}
+		}
+		p.slots <- pc
+	}
+	fmt.Fprintf(logOut, "[Go Engine] Pool ready: %d hosts, up to %d connections.\n", len(hosts), size)
+	return p
+}
+
+func (p *ClientPool) Size() int {
+	return p.size
+}
+
+// rotateHost 为槽位换绑到下一个不同于 avoid 的主站
+func (p *ClientPool) rotateHost(avoid string) string {
+	p.mu.Lock()
+	defer p.mu.Unlock()
+	for range p.hosts {
+		h := p.hosts[p.nextHost%len(p.hosts)]
+		p.nextHost++
+		if h != avoid {
+			return h
+		}
+	}
+	return avoid
+}
+
+// Get 取出一条可用连接；avoid 非空时保证换到其他主站（用于失败重试），空槽位即时拨号
+func (p *ClientPool) Get(avoid string) (*poolConn, error) {
+	pc := <-p.slots
+	if avoid != "" && pc.host == avoid && len(p.hosts) > 1 {
+		if pc.cli != nil {
+			pc.cli.Close()
+			pc.cli = nil
+		}
+		pc.host = p.rotateHost(avoid)
+	}
+	if pc.cli != nil {
+		return pc, nil
+	}
+	cli, err := dialHost(pc.host)
+	if err != nil {
+		// 拨号失败的主站让出槽位，下次换下一个主站
+		if len(p.hosts) > 1 {
+			pc.host = p.rotateHost(pc.host)
+		}
+		p.slots <- pc
+		return nil, err
+	}
+	pc.cli = cli
+	return pc, nil
+}
+
+// Put 归还连接；broken=true 时关闭连接，槽位留空
+func (p *ClientPool) Put(pc *poolConn, broken bool) {
+	if broken && pc.cli != nil {
+		pc.cli.Close()
+		pc.cli = nil
+	}
+	p.slots <- pc
+}
+
+func (p *ClientPool) Close() {
+	for i := 0; i < p.size; i++ {
+		if pc := <-p.slots; pc.cli != nil {
+			pc.cli.Close()
+		}
+	}
+}
+
+// KlineJob 一次 K 线抓取任务（一次性模式与 serve 模式共用）
+type KlineJob struct {
+	Codes    []string `json:"codes"`
+	Out      string   `json:"out"`
+	Format   string   `json:"format"`
+	Since    string   `json:"since"`
+	State    string   `json:"state"`
+	StateOut string   `json:"state_out"`
+	// FailedOut 非空时把重试耗尽后仍失败的代码写成 JSON 列表
+	FailedOut string `json:"failed_out"`
+}
+
+// CodeResult 单只代码的处理结果，serve 模式下逐条回传
+type CodeResult struct {
+	Code     string `json:"code"`
+	Rows     int    `json:"rows"`
+	Attempts int    `json:"attempts"`
+	Ms       int64  `json:"ms"`
+	Error    string `json:"error,omitempty"`
+}
+
+// JobSummary 任务汇总
+type JobSummary struct {
+	Codes   int      `json:"codes"`
+	Rows    int      `json:"rows"`
+	Retried int      `json:"retried"`
+	Failed  []string `json:"failed"`
+}
+
+// parseCodes 支持 sh000001 和 sh.000001 两种格式，返回 TDX 代码及其到原始代码的映射
+func parseCodes(rawCodes []string) ([]string, map[string]string) {
+	var tdxCodes []string
+	codeMap := make(map[string]string)
+	for _, c := range rawCodes {
+		c = strings.TrimSpace(c)
+		if c == "" {
+			continue
+		}
+		tdxCode := strings.ReplaceAll(c, ".", "")
+		tdxCodes = append(tdxCodes, tdxCode)
+		codeMap[tdxCode] = c
+	}
+	return tdxCodes, codeMap
+}
+
+// codeTask 待处理代码；失败后携带上次所用主站重新入队，重试时换主站
+type codeTask struct {
+	tcode    string
+	attempt  int
+	lastHost string
+	elapsed  time.Duration // 累计耗时（含重试），供分片规划的成本模型使用
+}
+
+// runCodeWorkers 按自适应并发逐只处理代码，handle 返回写出的行数；
+// 失败的代码在 retries 预算内换主站重新入队，预算耗尽才计入 Failed
+func runCodeWorkers(pool *ClientPool, tdxCodes []string, codeMap map[string]string,
+	handle func(cli *tdx.Client, tcode string) (int, error), onResult func(CodeResult)) JobSummary {
+
+	summary := JobSummary{Codes: len(tdxCodes), Failed: []string{}}
+	if len(tdxCodes) == 0 {
+		return summary
+	}
+
+	var mu sync.Mutex
+	var wg sync.WaitGroup
+
+	// 队列容量等于代码数：任一时刻每只代码要么在队列中要么在处理中，重新入队不会阻塞
+	jobChan := make(chan codeTask, len(tdxCodes))
+	for _, c := range tdxCodes {
+		jobChan <- codeTask{tcode: c}
+	}
+	remaining := len(tdxCodes)
+
+	for i := 0; i < pool.Size(); i++ {
+		wg.Add(1)
+		go func() {
+			defer wg.Done()
+			for task := range jobChan {
+				pool.limiter.Acquire()
+				start := time.Now()
+				rows := 0
+				host := task.lastHost
+				pc, err := pool.Get(task.lastHost)
+				if err == nil {
+					host = pc.host
+					rows, err = handle(pc.cli, task.tcode)
+					pool.Put(pc, err != nil)
+				}
+				pool.limiter.Release(time.Since(start), err != nil)
+
+				task.attempt++
+				task.elapsed += time.Since(start)
+				mu.Lock()
+				if err != nil && task.attempt <= pool.retries {
+					summary.Retried++
+					task.lastHost = host
+					jobChan <- task
+					mu.Unlock()
+					continue
+				}
+
+				res := CodeResult{Code: codeMap[task.tcode], Rows: rows, Attempts: task.attempt, Ms: task.elapsed.Milliseconds()}
+				if err != nil {
+					res.Error = err.Error()
+					summary.Failed = append(summary.Failed, codeMap[task.tcode])
+					fmt.Fprintf(logOut, "[Go Engine] Failed %s after %d attempts: %v\n", codeMap[task.tcode], task.attempt, err)
+				} else {
+					summary.Rows += rows
+				}
+				if onResult != nil {
+					onResult(res)
+				}
+				remaining--
+				if remaining == 0 {
+					close(jobChan)
+				}
+				mu.Unlock()
+			}
+		}()
+	}
+
+	wg.Wait()
+	sort.Strings(summary.Failed)
+	fmt.Fprintf(logOut, "[Go Engine] %d codes, %d retries, %d failed, final concurrency %d.\n",
+		summary.Codes, summary.Retried, len(summary.Failed), pool.limiter.Limit())
+	return summary
+}
+
+// writeFailedCodes 把最终失败的代码写成 JSON 列表，供下游汇总
+func writeFailedCodes(outPath string, failed []string) error {
+	if outPath == "" || len(failed) == 0 {
+		return nil
+	}
+	file, err := os.Create(outPath)
+	if err != nil {
+		return err
+	}
+	defer file.Close()
+	return json.NewEncoder(file).Encode(failed)
+}
+
+// listStocks 获取沪深北 A 股列表
+func listStocks(pool *ClientPool) ([]StockMaster, error) {
+	pc, err := pool.Get("")
+	if err != nil {
+		return nil, err
 	}
-	defer cli.Close()
+	defer pool.Put(pc, false)
+	cli := pc.cli
 
 	var masterList []StockMaster
 	exchanges := []protocol.Exchange{protocol.ExchangeSH, protocol.ExchangeSZ, protocol.ExchangeBJ}
@@ -176,263 +1044,481 @@ func runFetchList() {
 			}
 		}
 	}
+	return masterList, nil
+}
 
-	file, _ := os.Create("stock_list_master.json")
-	json.NewEncoder(file).Encode(masterList)
-	file.Close()
-	fmt.Printf("[Go Engine] Master stock list resolved: %d stocks.\n", len(masterList))
+// writeStockList 写出 stock_list_master.json
+func writeStockList(outPath string, masterList []StockMaster) error {
+	file, err := os.Create(outPath)
+	if err != nil {
+		return err
+	}
+	defer file.Close()
+	return json.NewEncoder(file).Encode(masterList)
 }
 
-// runFetchKlinesWithLocalCSV 获取个股K线（含复权、股本计算）
-func runFetchKlinesWithLocalCSV(codesStr, gbbqPath, outPath string) {
-	if codesStr == "" {
-		return
+// runFetchList 获取股票列表
+func runFetchList() {
+	fmt.Fprintln(logOut, "[Go Engine] Mode: LIST - Fetching A-shares list...")
+	pool := NewClientPool(PoolOptions{Hosts: poolOpts.Hosts, MaxConns: 1, Retries: poolOpts.Retries})
+	defer pool.Close()
+
+	masterList, err := listStocks(pool)
+	if err != nil {
+		panic(err)
 	}
+	writeStockList("stock_list_master.json", masterList)
+	fmt.Fprintf(logOut, "[Go Engine] Master stock list resolved: %d stocks.\n", len(masterList))
+}
 
-	rawCodes := strings.Split(codesStr, ",")
-	var tdxCodes []string
-	codeMap := make(map[string]string)
+// buildKlineRows 逐 bar 推演复权因子、股本、市值与换手率
+// incremental=true 时从断点 state 续接，并跳过断点日及之前的 bar；
+// sinceInt>0 时额外返回 since 之前最后一根 bar 的状态作为新断点
+func buildKlineRows(code, tcode string, bars []*protocol.Kline, gbbq *GbbqData,
+	state KlineState, incremental bool, sinceInt int) ([]KlineRow, KlineState, bool) {
 
-	for _, c := range rawCodes {
-		c = strings.TrimSpace(c)
-		if c == "" {
+	events, equities := gbbq.Lookup(tcode)
+
+	records := make([]KlineRow, 0, len(bars))
+	adjustFactor := 1.0
+	var prevClose float64 = -1.0
+
+	var lastFloatShares float64 = 0.0
+	var lastTotalShares float64 = 0.0
+	if len(equities) > 0 {
+		lastFloatShares = equities[0].FloatShares
+		lastTotalShares = equities[0].TotalShares
+	}
+
+	// 从断点续接复权因子与股本
+	if incremental {
+		adjustFactor = state.AdjustFactor
+		prevClose = state.LastClose
+		lastTotalShares = state.TotalShares
+		lastFloatShares = state.FloatShares
+	}
+
+	var checkpoint KlineState
+	hasCheckpoint := false
+
+	isIdx := isIndex(tcode)
+	eqIdx := 0
+
+	for _, bar := range bars {
+		dateStr := bar.Time.Format("2006-01-02")
+		dateIntStr := bar.Time.Format("20060102")
+		dateInt, _ := strconv.Atoi(dateIntStr)
+		if incremental && dateInt <= state.LastDate {
 			continue
 		}
-		tdxCode := strings.ReplaceAll(c, ".", "")
-		tdxCodes = append(tdxCodes, tdxCode)
-		codeMap[tdxCode] = c
+
+		pOpen := float64(bar.Open) / 1000.0
+		pHigh := float64(bar.High) / 1000.0
+		pLow := float64(bar.Low) / 1000.0
+		pClose := float64(bar.Close) / 1000.0
+		pVolume := float64(bar.Volume)
+		pAmount := float64(bar.Amount) / 1000.0
+
+		var totalMV, floatMV, turn float64 = 0.0, 0.0, 0.0
+
+		if !isIdx {
+			if ev, ok := events[dateInt]; ok && prevClose > 0 {
+				fh := ev.FenHong / 10.0
+				sg := ev.SongGu / 10.0
+				pg := ev.PeiGu / 10.0
+				pj := ev.PeiJia
+
+				pEx := (prevClose - fh + pg*pj) / (1.0 + sg + pg)
+				if pEx > 0 {
+					adjustFactor *= (prevClose / pEx)
+				}
+			}
+
+			// 股本变动按日期升序，游标只进不退，避免每根 bar 都从头扫描
+			for eqIdx < len(equities) && equities[eqIdx].Date <= dateInt {
+				lastFloatShares = equities[eqIdx].FloatShares
+				lastTotalShares = equities[eqIdx].TotalShares
+				eqIdx++
+			}
+
+			totalMV = pClose * lastTotalShares
+			floatMV = pClose * lastFloatShares
+			if lastFloatShares > 0 {
+				turn = (pVolume * 10000.0 / lastFloatShares)
+			}
+		} else {
+			adjustFactor = 1.0
+			lastTotalShares = 0.0
+			lastFloatShares = 0.0
+		}
+
+		records = append(records, KlineRow{
+			Code:         code,
+			Date:         dateStr,
+			Open:         pOpen,
+			High:         pHigh,
+			Low:          pLow,
+			Close:        pClose,
+			Volume:       pVolume,
+			Amount:       pAmount,
+			AdjustFactor: adjustFactor,
+			TotalShares:  lastTotalShares,
+			FloatShares:  lastFloatShares,
+			TotalMV:      totalMV,
+			FloatMV:      floatMV,
+			Turn:         turn,
+		})
+		prevClose = pClose
+
+		if sinceInt > 0 && dateInt < sinceInt {
+			checkpoint = KlineState{
+				LastDate:     dateInt,
+				LastClose:    pClose,
+				AdjustFactor: adjustFactor,
+				TotalShares:  lastTotalShares,
+				FloatShares:  lastFloatShares,
+			}
+			hasCheckpoint = true
+		}
+	}
+
+	return records, checkpoint, hasCheckpoint
+}
+
+// fetchKlines 获取个股K线（含复权、股本计算）
+// since/state 非空时启用增量模式：已有断点（且早于 since）的个股只拉取断点之后的尾部 K 线，
+// 并从断点的收盘价、复权因子、股本继续推演，结果与全量计算一致；无断点的个股回退为全量拉取。
+// 运行结束后把每只股票在 since 之前最后一根 K 线的状态写入 StateOut，供下次运行续接。
+func fetchKlines(pool *ClientPool, gbbq *GbbqData, job KlineJob, onResult func(CodeResult)) (JobSummary, error) {
+	tdxCodes, codeMap := parseCodes(job.Codes)
+	if job.Format == "" {
+		job.Format = "csv"
+	}
+	stateOut := job.StateOut
+	if stateOut == "" {
+		stateOut = job.State
 	}
 
-	gbbqMap, equityMap, err := LoadGbbqCSV(gbbqPath)
+	sinceInt := parseDateInt(job.Since)
+	stateMap, err := LoadKlineState(job.State)
 	if err != nil {
-		panic(fmt.Sprintf("Failed to load clean GBBQ CSV: %v", err))
+		return JobSummary{}, fmt.Errorf("failed to load kline state: %v", err)
 	}
+	newStateMap := make(map[string]KlineState)
+	var incrementalCount int
 
-	outFile, err := os.Create(outPath)
+	sink, err := NewKlineSink(job.Format, job.Out, true)
 	if err != nil {
-		panic(err)
+		return JobSummary{}, err
 	}
-	defer outFile.Close()
 
-	csvWriter := csv.NewWriter(outFile)
-	csvWriter.Write([]string{
-		"code", "date", "open", "high", "low", "close", "volume", "amount", 
-		"adjustFactor", "total_shares", "float_shares", "total_mv", "float_mv", "turn",
-	})
 	var mu sync.Mutex
-	var wg sync.WaitGroup
+	var writeErr error
 
-	jobChan := make(chan string, len(tdxCodes))
-	for _, c := range tdxCodes {
-		jobChan <- c
-	}
-	close(jobChan)
+	handle := func(cli *tdx.Client, tcode string) (n int, err error) {
+		state, hasState := stateMap[tcode]
+		incremental := sinceInt > 0 && hasState && state.LastDate < sinceInt
+		// 拉取或写出失败时沿用旧断点：否则新状态文件丢失该码，下次运行只能回退为全量拉取
+		defer func() {
+			if err != nil && sinceInt > 0 && hasState {
+				mu.Lock()
+				newStateMap[tcode] = state
+				mu.Unlock()
+			}
+		}()
 
-	concurrency := 8
-	for i := 0; i < concurrency; i++ {
-		wg.Add(1)
-		go func() {
-			defer wg.Done()
-			workerCli, err := tdx.DialDefault()
-			if err != nil {
-				return
+		var resp *protocol.KlineResp
+		if incremental {
+			// 只向前翻页到断点日为止，避免下载 20 年历史
+			resp, err = cli.GetKlineDayUntil(tcode, func(k *protocol.Kline) bool {
+				dateInt, _ := strconv.Atoi(k.Time.Format("20060102"))
+				return dateInt <= state.LastDate
+			})
+		} else {
+			resp, err = cli.GetKlineDayAll(tcode)
+		}
+		if err != nil {
+			return 0, err
+		}
+		if resp == nil || len(resp.List) == 0 {
+			if incremental {
+				mu.Lock()
+				newStateMap[tcode] = state
+				mu.Unlock()
 			}
-			defer workerCli.Close()
+			return 0, nil
+		}
 
-			for tcode := range jobChan {
-				resp, err := workerCli.GetKlineDayAll(tcode)
-				if err != nil || resp == nil || len(resp.List) == 0 {
-					continue
-				}
+		records, checkpoint, hasCheckpoint := buildKlineRows(codeMap[tcode], tcode, resp.List, gbbq, state, incremental, sinceInt)
 
-				events := gbbqMap[tcode]
-				equities := equityMap[tcode]
-				
-				var records [][]string
-				adjustFactor := 1.0
-				var prevClose float64 = -1.0
-
-				var lastFloatShares float64 = 0.0
-				var lastTotalShares float64 = 0.0
-				if len(equities) > 0 {
-					lastFloatShares = equities[0].FloatShares
-					lastTotalShares = equities[0].TotalShares
-				}
+		mu.Lock()
+		defer mu.Unlock()
+		if err := sink.Write(records); err != nil {
+			writeErr = err
+			return 0, err
+		}
+		if sinceInt > 0 {
+			if hasCheckpoint {
+				newStateMap[tcode] = checkpoint
+			} else if incremental {
+				newStateMap[tcode] = state
+			}
+		}
+		if incremental {
+			incrementalCount++
+		}
+		return len(records), nil
+	}
 
-				isIdx := isIndex(tcode)
-
-				for _, bar := range resp.List {
-					dateStr := bar.Time.Format("2006-01-02")
-					dateIntStr := bar.Time.Format("20060102")
-					dateInt, _ := strconv.Atoi(dateIntStr)
-
-					pOpen := float64(bar.Open) / 1000.0
-					pHigh := float64(bar.High) / 1000.0
-					pLow := float64(bar.Low) / 1000.0
-					pClose := float64(bar.Close) / 1000.0
-					pVolume := float64(bar.Volume)
-					pAmount := float64(bar.Amount) / 1000.0
-
-					var totalMV, floatMV, turn float64 = 0.0, 0.0, 0.0
-
-					if !isIdx {
-						if ev, ok := events[dateInt]; ok && prevClose > 0 {
-							fh := ev.FenHong / 10.0
-							sg := ev.SongGu / 10.0
-							pg := ev.PeiGu / 10.0
-							pj := ev.PeiJia
-
-							pEx := (prevClose - fh + pg*pj) / (1.0 + sg + pg)
-							if pEx > 0 {
-								adjustFactor *= (prevClose / pEx)
-							}
-						}
-
-						for _, eq := range equities {
-							if eq.Date <= dateInt {
-								lastFloatShares = eq.FloatShares
-								lastTotalShares = eq.TotalShares
-							} else {
-								break
-							}
-						}
-
-						totalMV = pClose * lastTotalShares
-						floatMV = pClose * lastFloatShares
-						if lastFloatShares > 0 {
-							turn = (pVolume * 10000.0 / lastFloatShares)
-						}
-					} else {
-						adjustFactor = 1.0
-						lastTotalShares = 0.0
-						lastFloatShares = 0.0
-					}
-
-					records = append(records, []string{
-						codeMap[tcode],
-						dateStr,
-						fmt.Sprintf("%.3f", pOpen),
-						fmt.Sprintf("%.3f", pHigh),
-						fmt.Sprintf("%.3f", pLow),
-						fmt.Sprintf("%.3f", pClose),
-						fmt.Sprintf("%.0f", pVolume),
-						fmt.Sprintf("%.3f", pAmount),
-						fmt.Sprintf("%.6f", adjustFactor),
-						fmt.Sprintf("%.0f", lastTotalShares),
-						fmt.Sprintf("%.0f", lastFloatShares),
-						fmt.Sprintf("%.3f", totalMV),
-						fmt.Sprintf("%.3f", floatMV),
-						fmt.Sprintf("%.4f", turn),
-					})
-					prevClose = pClose
-				}
+	summary := runCodeWorkers(pool, tdxCodes, codeMap, handle, onResult)
+	if err := sink.Close(); err != nil {
+		return summary, fmt.Errorf("failed to finalize output: %v", err)
+	}
+	if writeErr != nil {
+		return summary, fmt.Errorf("failed to write klines: %v", writeErr)
+	}
+	if err := writeFailedCodes(job.FailedOut, summary.Failed); err != nil {
+		return summary, fmt.Errorf("failed to save failed codes: %v", err)
+	}
 
-				mu.Lock()
-				csvWriter.WriteAll(records)
-				mu.Unlock()
-			}
-		}()
+	if sinceInt > 0 && stateOut != "" {
+		if err := SaveKlineState(stateOut, newStateMap); err != nil {
+			return summary, fmt.Errorf("failed to save kline state: %v", err)
+		}
+		fmt.Fprintf(logOut, "[Go Engine] Incremental: %d/%d codes resumed from state, %d checkpoints saved.\n", incrementalCount, len(tdxCodes), len(newStateMap))
 	}
+	return summary, nil
+}
 
-	wg.Wait()
-	csvWriter.Flush()
-	fmt.Println("[Go Engine] Download completed.")
+// fetchIndex 获取指数K线（无复权、无股本计算）
+func fetchIndex(pool *ClientPool, job KlineJob, onResult func(CodeResult)) (JobSummary, error) {
+	tdxCodes, codeMap := parseCodes(job.Codes)
+	if job.Format == "" {
+		job.Format = "csv"
+	}
+
+	// 指数输出简化列：不含股本、市值、换手率
+	sink, err := NewKlineSink(job.Format, job.Out, false)
+	if err != nil {
+		return JobSummary{}, err
+	}
+
+	var mu sync.Mutex
+	var writeErr error
+
+	handle := func(cli *tdx.Client, tcode string) (int, error) {
+		resp, err := cli.GetKlineDayAll(tcode)
+		if err != nil {
+			return 0, err
+		}
+		if resp == nil || len(resp.List) == 0 {
+			fmt.Fprintf(logOut, "[Go Engine] Warning: Failed to fetch %s\n", tcode)
+			return 0, nil
+		}
+
+		records := make([]KlineRow, 0, len(resp.List))
+
+		for _, bar := range resp.List {
+			records = append(records, KlineRow{
+				Code:   codeMap[tcode],
+				Date:   bar.Time.Format("2006-01-02"),
+				Open:   float64(bar.Open) / 1000.0,
+				High:   float64(bar.High) / 1000.0,
+				Low:    float64(bar.Low) / 1000.0,
+				Close:  float64(bar.Close) / 1000.0,
+				Volume: float64(bar.Volume),
+				Amount: float64(bar.Amount) / 1000.0,
+			})
+		}
+
+		mu.Lock()
+		defer mu.Unlock()
+		if err := sink.Write(records); err != nil {
+			writeErr = err
+			return 0, err
+		}
+		return len(records), nil
+	}
+
+	summary := runCodeWorkers(pool, tdxCodes, codeMap, handle, onResult)
+	if err := sink.Close(); err != nil {
+		return summary, fmt.Errorf("failed to finalize output: %v", err)
+	}
+	if writeErr != nil {
+		return summary, fmt.Errorf("failed to write index klines: %v", writeErr)
+	}
+	if err := writeFailedCodes(job.FailedOut, summary.Failed); err != nil {
+		return summary, fmt.Errorf("failed to save failed codes: %v", err)
+	}
+	return summary, nil
 }
 
-// runFetchIndex 获取指数K线（无复权、无股本计算）
-func runFetchIndex(codesStr, outPath string) {
+// runFetchKlinesWithLocalCSV 一次性模式：获取个股K线（含复权、股本计算）
+func runFetchKlinesWithLocalCSV(codesStr, gbbqPath, outPath, format, sinceStr, statePath, stateOut, failedOut string) {
 	if codesStr == "" {
-		fmt.Println("[Go Engine] No index codes provided.")
 		return
 	}
 
-	rawCodes := strings.Split(codesStr, ",")
-	var tdxCodes []string
-	codeMap := make(map[string]string)
+	gbbq, err := LoadGbbqData(gbbqPath)
+	if err != nil {
+		panic(fmt.Sprintf("Failed to load clean GBBQ CSV: %v", err))
+	}
 
-	for _, c := range rawCodes {
-		c = strings.TrimSpace(c)
-		if c == "" {
-			continue
-		}
-		// 支持 sh000001 和 sh.000001 两种格式
-		tdxCode := strings.ReplaceAll(c, ".", "")
-		tdxCodes = append(tdxCodes, tdxCode)
-		codeMap[tdxCode] = c
+	pool := NewClientPool(poolOpts)
+	defer pool.Close()
+
+	job := KlineJob{
+		Codes:     strings.Split(codesStr, ","),
+		Out:       outPath,
+		Format:    format,
+		Since:     sinceStr,
+		State:     statePath,
+		StateOut:  stateOut,
+		FailedOut: failedOut,
+	}
+	if _, err := fetchKlines(pool, gbbq, job, nil); err != nil {
+		panic(err)
+	}
+	fmt.Fprintln(logOut, "[Go Engine] Download completed.")
+}
+
+// runFetchIndex 一次性模式：获取指数K线
+func runFetchIndex(codesStr, outPath, format, failedOut string) {
+	if codesStr == "" {
+		fmt.Fprintln(logOut, "[Go Engine] No index codes provided.")
+		return
 	}
 
-	fmt.Printf("[Go Engine] Mode: INDEX - Fetching %d indices...\n", len(tdxCodes))
+	job := KlineJob{Codes: strings.Split(codesStr, ","), Out: outPath, Format: format, FailedOut: failedOut}
+	fmt.Fprintf(logOut, "[Go Engine] Mode: INDEX - Fetching %d indices...\n", len(job.Codes))
+
+	pool := NewClientPool(poolOpts)
+	defer pool.Close()
 
-	outFile, err := os.Create(outPath)
+	summary, err := fetchIndex(pool, job, nil)
 	if err != nil {
 		panic(err)
 	}
-	defer outFile.Close()
+	fmt.Fprintf(logOut, "[Go Engine] Index download completed: %d codes.\n", summary.Codes)
+}
 
-	csvWriter := csv.NewWriter(outFile)
-	// 指数输出简化列：不含股本、市值、换手率
-	csvWriter.Write([]string{
-		"code", "date", "open", "high", "low", "close", "volume", "amount",
-	})
+// ServeRequest serve 模式请求帧（stdin 每行一个 JSON）
+type ServeRequest struct {
+	ID   int    `json:"id"`
+	Op   string `json:"op"`
+	Gbbq string `json:"gbbq"`
+	KlineJob
+}
 
-	var mu sync.Mutex
-	var wg sync.WaitGroup
+// ServeResponse serve 模式响应帧（stdout 每行一个 JSON）
+// event: code（单只代码完成）/ done（请求完成）/ error（请求失败）
+type ServeResponse struct {
+	ID       int           `json:"id"`
+	Event    string        `json:"event"`
+	Code     string        `json:"code,omitempty"`
+	Rows     int           `json:"rows,omitempty"`
+	Attempts int           `json:"attempts,omitempty"`
+	Ms       int64         `json:"ms,omitempty"`
+	Error    string        `json:"error,omitempty"`
+	Summary  *JobSummary   `json:"summary,omitempty"`
+	Stocks   []StockMaster `json:"stocks,omitempty"`
+}
 
-	jobChan := make(chan string, len(tdxCodes))
-	for _, c := range tdxCodes {
-		jobChan <- c
-	}
-	close(jobChan)
+// runServe 常驻模式：保持一组 TDX 温连接并缓存已解析的 GBBQ，
+// 逐行读取 stdin 上的 list/fetch/index/reload/shutdown 请求，按代码流式回传处理结果
+func runServe(gbbqPath string) {
+	logOut = os.Stderr
+	fmt.Fprintln(logOut, "[Go Engine] Mode: SERVE - probing TDX hosts...")
 
-	concurrency := 8
-	for i := 0; i < concurrency; i++ {
-		wg.Add(1)
-		go func() {
-			defer wg.Done()
-			workerCli, err := tdx.DialDefault()
-			if err != nil {
-				return
-			}
-			defer workerCli.Close()
+	pool := NewClientPool(poolOpts)
+	defer pool.Close()
 
-			for tcode := range jobChan {
-				resp, err := workerCli.GetKlineDayAll(tcode)
-				if err != nil || resp == nil || len(resp.List) == 0 {
-					fmt.Printf("[Go Engine] Warning: Failed to fetch %s\n", tcode)
-					continue
-				}
+	gbbqCache := make(map[string]*GbbqData)
+	loadGbbq := func(path string, reload bool) (*GbbqData, error) {
+		if data, ok := gbbqCache[path]; ok && !reload {
+			return data, nil
+		}
+		data, err := LoadGbbqData(path)
+		if err != nil {
+			return nil, err
+		}
+		gbbqCache[path] = data
+		return data, nil
+	}
+	if _, err := os.Stat(gbbqPath); err == nil {
+		if _, err := loadGbbq(gbbqPath, false); err != nil {
+			fmt.Fprintf(logOut, "[Go Engine] Warning: failed to preload GBBQ: %v\n", err)
+		}
+	}
 
-				var records [][]string
-
-				for _, bar := range resp.List {
-					dateStr := bar.Time.Format("2006-01-02")
-					pOpen := float64(bar.Open) / 1000.0
-					pHigh := float64(bar.High) / 1000.0
-					pLow := float64(bar.Low) / 1000.0
-					pClose := float64(bar.Close) / 1000.0
-					pVolume := float64(bar.Volume)
-					pAmount := float64(bar.Amount) / 1000.0
-
-					records = append(records, []string{
-						codeMap[tcode],
-						dateStr,
-						fmt.Sprintf("%.3f", pOpen),
-						fmt.Sprintf("%.3f", pHigh),
-						fmt.Sprintf("%.3f", pLow),
-						fmt.Sprintf("%.3f", pClose),
-						fmt.Sprintf("%.0f", pVolume),
-						fmt.Sprintf("%.3f", pAmount),
-					})
-				}
+	var outMu sync.Mutex
+	encoder := json.NewEncoder(os.Stdout)
+	emit := func(resp ServeResponse) {
+		outMu.Lock()
+		encoder.Encode(resp)
+		outMu.Unlock()
+	}
 
-				mu.Lock()
-				csvWriter.WriteAll(records)
-				mu.Unlock()
+	scanner := bufio.NewScanner(os.Stdin)
+	scanner.Buffer(make([]byte, 1024*1024), 64*1024*1024)
+	for scanner.Scan() {
+		line := scanner.Bytes()
+		if len(strings.TrimSpace(string(line))) == 0 {
+			continue
+		}
+		var req ServeRequest
+		if err := json.Unmarshal(line, &req); err != nil {
+			emit(ServeResponse{Event: "error", Error: fmt.Sprintf("bad request: %v", err)})
+			continue
+		}
+		onResult := func(res CodeResult) {
+			emit(ServeResponse{ID: req.ID, Event: "code", Code: res.Code, Rows: res.Rows, Attempts: res.Attempts, Ms: res.Ms, Error: res.Error})
+		}
+		if req.Gbbq == "" {
+			req.Gbbq = gbbqPath
+		}
+
+		switch req.Op {
+		case "list":
+			masterList, err := listStocks(pool)
+			if err == nil && req.Out != "" {
+				err = writeStockList(req.Out, masterList)
 			}
-		}()
+			if err != nil {
+				emit(ServeResponse{ID: req.ID, Event: "error", Error: err.Error()})
+				continue
+			}
+			emit(ServeResponse{ID: req.ID, Event: "done", Rows: len(masterList), Stocks: masterList})
+		case "fetch":
+			gbbq, err := loadGbbq(req.Gbbq, false)
+			if err != nil {
+				emit(ServeResponse{ID: req.ID, Event: "error", Error: fmt.Sprintf("failed to load GBBQ: %v", err)})
+				continue
+			}
+			summary, err := fetchKlines(pool, gbbq, req.KlineJob, onResult)
+			if err != nil {
+				emit(ServeResponse{ID: req.ID, Event: "error", Error: err.Error(), Summary: &summary})
+				continue
+			}
+			emit(ServeResponse{ID: req.ID, Event: "done", Rows: summary.Rows, Summary: &summary})
+		case "index":
+			summary, err := fetchIndex(pool, req.KlineJob, onResult)
+			if err != nil {
+				emit(ServeResponse{ID: req.ID, Event: "error", Error: err.Error(), Summary: &summary})
+				continue
+			}
+			emit(ServeResponse{ID: req.ID, Event: "done", Rows: summary.Rows, Summary: &summary})
+		case "reload":
+			if _, err := loadGbbq(req.Gbbq, true); err != nil {
+				emit(ServeResponse{ID: req.ID, Event: "error", Error: err.Error()})
+				continue
+			}
+			emit(ServeResponse{ID: req.ID, Event: "done"})
+		case "shutdown":
+			emit(ServeResponse{ID: req.ID, Event: "done"})
+			return
+		default:
+			emit(ServeResponse{ID: req.ID, Event: "error", Error: fmt.Sprintf("unknown op: %s", req.Op)})
+		}
 	}
-
-	wg.Wait()
-	csvWriter.Flush()
-	fmt.Printf("[Go Engine] Index download completed: %d codes.\n", len(tdxCodes))
 }
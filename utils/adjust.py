@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+from utils.gbbq import GbbqCache, decode_gbbq, tdx_prefix, GBBQ_VALUE_COLUMNS
+
+# 股本变动类 GBBQ 类别，与 Go 引擎 isEquityCategory 一致
+EQUITY_CATEGORIES = (2, 3, 5, 7, 8, 9, 10)
+
+# 指数代码前缀，与 Go 引擎 isIndex 一致：指数不做复权与股本计算
+INDEX_PREFIXES = ("sh000", "sh9", "sz399", "bj899")
+
+EQUITY_OUTPUT_COLUMNS = ["adjustFactor", "total_shares", "float_shares", "total_mv", "float_mv", "turn"]
+
+
+def _gbbq_frame(gbbq):
+    """
+    统一 GBBQ 输入为 (code, date, category, 4 列 float64) 并按 (code, date) 稳定排序。
+    支持 GbbqCache、decode_gbbq 的 DataFrame，或 .bin / .dat / 清洗后 CSV 的路径
+    """
+    if isinstance(gbbq, str):
+        if gbbq.endswith(".bin"):
+            gbbq = GbbqCache(gbbq)
+        elif gbbq.endswith(".dat"):
+            gbbq = decode_gbbq(gbbq)
+        else:
+            # round_trip 解析与 Go strconv.ParseFloat 逐位一致
+            gbbq = pd.read_csv(gbbq, dtype={"code": str}, float_precision="round_trip")
+
+    if isinstance(gbbq, GbbqCache):
+        df = gbbq.to_frame()
+        df = df.rename(columns={"date": "datetime"})
+        for col in GBBQ_VALUE_COLUMNS:
+            df[col] = df[col].astype(np.float64)
+    else:
+        df = gbbq.copy()
+        df["code"] = tdx_prefix(df["code"].astype(str).str.zfill(6))
+
+    df = df[["code", "datetime", "category"] + GBBQ_VALUE_COLUMNS]
+    return df.sort_values(["code", "datetime"], kind="stable").reset_index(drop=True)
+
+
+def compute_equity_columns(bars, gbbq):
+    """
+    批量复算复权因子、股本、市值与换手率，与 Go 引擎 buildKlineRows 的逐 bar 推演逐位一致。
+
+    bars: 未复权日线，至少包含 code（sh600000 / sh.600000）、date、close、volume，
+          价格允许为引擎输出的 float32（按 TDX 厘价取整还原为 float64 后计算）
+    gbbq: GbbqCache / decode_gbbq 的结果 / 文件路径
+
+    返回按 (code, date) 排序的新 DataFrame，附加列的类型与引擎 Arrow 输出一致
+    """
+    df = bars.drop(columns=[c for c in EQUITY_OUTPUT_COLUMNS if c in bars.columns])
+    if df.empty:
+        for col in EQUITY_OUTPUT_COLUMNS:
+            df[col] = pd.Series(dtype="float32" if col in ("adjustFactor", "turn") else "float64")
+        return df
+
+    df = df.sort_values(["code", "date"], kind="stable").reset_index(drop=True)
+    tcode = df["code"].astype(str).str.replace(".", "", regex=False).values
+    dt = pd.to_datetime(df["date"])
+    date_int = (dt.dt.year * 10000 + dt.dt.month * 100 + dt.dt.day).astype(np.int64).values
+
+    # TDX 价格为整数厘，取整还原出与 Go 端 float64(bar.Close)/1000.0 相同的双精度值
+    close = np.round(df["close"].values.astype(np.float64) * 1000.0) / 1000.0
+    volume = df["volume"].values.astype(np.float64)
+
+    n = len(df)
+    starts = np.r_[True, tcode[1:] != tcode[:-1]]
+    prev_close = np.empty(n)
+    prev_close[1:] = close[:-1]
+    prev_close[starts] = -1.0
+
+    is_idx = pd.Series(tcode).str.startswith(INDEX_PREFIXES).values
+    ev_all = _gbbq_frame(gbbq)
+
+    # 1. 除权除息：同日多条以文件顺序最后一条为准（与 Go map 覆盖语义一致），按 (code, date) 精确匹配
+    events = ev_all[ev_all["category"] == 1].drop_duplicates(["code", "datetime"], keep="last")
+    keyed = pd.DataFrame({"code": tcode, "datetime": date_int})
+    matched = keyed.merge(events, on=["code", "datetime"], how="left")
+    fh = matched["hongli_panqianliutong"].values / 10.0
+    pj = matched["peigujia_qianzongguben"].values
+    sg = matched["songgu_qianzongguben"].values / 10.0
+    pg = matched["peigu_houzongguben"].values / 10.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_ex = (prev_close - fh + pg * pj) / (1.0 + sg + pg)
+        ratio = prev_close / p_ex
+    apply = ~np.isnan(fh) & (prev_close > 0) & (p_ex > 0) & ~is_idx
+    ratio = np.where(apply, ratio, 1.0)
+
+    # 逐 code 顺序累乘，与 Go 的 adjustFactor *= ratio 运算次序相同
+    adjust_factor = pd.Series(ratio).groupby(tcode, sort=False).cumprod().values
+
+    # 2. 股本：取 date <= 当日的最后一次变动；首次变动之前沿用第一条（与 Go 初始化一致）
+    equities = ev_all[ev_all["category"].isin(EQUITY_CATEGORIES)]
+    eq_code = equities["code"].values
+    eq_date = equities["datetime"].values.astype(np.int64)
+    eq_float = equities["songgu_qianzongguben"].values * 10000.0
+    eq_total = equities["peigu_houzongguben"].values * 10000.0
+
+    total_shares = np.zeros(n)
+    float_shares = np.zeros(n)
+    if len(equities):
+        codes, code_ids = np.unique(np.concatenate([eq_code, tcode]), return_inverse=True)
+        eq_ids, bar_ids = code_ids[:len(eq_code)], code_ids[len(eq_code):]
+        # (code, date) 合成单调键，一次 searchsorted 完成全市场 as-of 匹配
+        eq_key = eq_ids.astype(np.int64) * 100_000_000 + eq_date
+        bar_key = bar_ids.astype(np.int64) * 100_000_000 + date_int
+        pos = np.searchsorted(eq_key, bar_key, side="right") - 1
+        first = np.searchsorted(eq_ids, bar_ids, side="left")
+        has_eq = (first < len(eq_ids)) & (eq_ids[np.minimum(first, len(eq_ids) - 1)] == bar_ids)
+        pick = np.where(pos >= first, pos, first)
+        pick = np.where(has_eq, pick, 0)
+        total_shares = np.where(has_eq, eq_total[pick], 0.0)
+        float_shares = np.where(has_eq, eq_float[pick], 0.0)
+
+    total_shares = np.where(is_idx, 0.0, total_shares)
+    float_shares = np.where(is_idx, 0.0, float_shares)
+
+    # 3. 市值与换手率
+    total_mv = np.where(is_idx, 0.0, close * total_shares)
+    float_mv = np.where(is_idx, 0.0, close * float_shares)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        turn = np.where(float_shares > 0, volume * 10000.0 / float_shares, 0.0)
+    turn = np.where(is_idx, 0.0, turn)
+
+    df["adjustFactor"] = adjust_factor.astype(np.float32)
+    df["total_shares"] = total_shares
+    df["float_shares"] = float_shares
+    df["total_mv"] = total_mv
+    df["float_mv"] = float_mv
+    df["turn"] = turn.astype(np.float32)
+    return df
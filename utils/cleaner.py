@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 
+from utils.data_types import to_date32
+
 class DataCleaner:
     @staticmethod
     def clean_stock_kline(df: pd.DataFrame) -> pd.DataFrame:
@@ -22,8 +24,8 @@ class DataCleaner:
         if 'isST' in df.columns:
             df['isST'] = pd.to_numeric(df['isST'], errors='coerce').fillna(0).astype('int8')
 
-        # 2. 日期格式化 YYYY-MM-DD
-        df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+        # 2. 日期统一为原生 date32（schema v2）
+        df['date'] = to_date32(df['date']).values
         
         # 3. 去重 (保留最新)
         df = df.drop_duplicates(subset=['date', 'code'], keep='last')
@@ -52,7 +54,7 @@ class DataCleaner:
             s = s / 10000.0  # 元 -> 万元
             df[col] = s.astype('float32')
             
-        df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+        df['date'] = to_date32(df['date']).values
         df = df.drop_duplicates(subset=['date', 'code'], keep='last')
         return df.sort_values(['code', 'date'])
     
@@ -70,7 +72,7 @@ class DataCleaner:
             if c in df.columns:
                 df[c] = pd.to_numeric(df[c], errors='coerce').astype('float64')
                 
-        df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+        df['date'] = to_date32(df['date']).values
         
         if 'code' in df.columns:
             df = df.drop_duplicates(subset=['date', 'code'], keep='last')
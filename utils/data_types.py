@@ -1,9 +1,16 @@
+import pandas as pd
 import pyarrow as pa
 
+# v2：date / notice_date / report_date 以原生 date32 落盘；v1 为 'YYYY-MM-DD' 字符串
+SCHEMA_VERSION = 2
+DATE_COLUMNS = ("date", "notice_date", "report_date")
+
 class AShareDataSchema:
     # === 字段常量 ===
     DATE = 'date'
     CODE = 'code'
+    # int32 证券 ID，见 utils/security_master.py
+    SID = 'sid'
     
     # 1. 个股日线 (Stock Kline)
     OPEN = 'open'
@@ -40,8 +47,9 @@ class AShareDataSchema:
     @staticmethod
     def get_stock_kline_schema():
         return pa.schema([
-            (AShareDataSchema.DATE, pa.string()),
+            (AShareDataSchema.DATE, pa.date32()),
             (AShareDataSchema.CODE, pa.string()),
+            (AShareDataSchema.SID, pa.int32()),
             (AShareDataSchema.OPEN, pa.float32()),
             (AShareDataSchema.HIGH, pa.float32()),
             (AShareDataSchema.LOW, pa.float32()),
@@ -64,8 +72,9 @@ class AShareDataSchema:
     @staticmethod
     def get_money_flow_schema():
         return pa.schema([
-            (AShareDataSchema.DATE, pa.string()),
+            (AShareDataSchema.DATE, pa.date32()),
             (AShareDataSchema.CODE, pa.string()),
+            (AShareDataSchema.SID, pa.int32()),
             (AShareDataSchema.NET_FLOW, pa.float64()),
             (AShareDataSchema.MAIN_FLOW, pa.float64()),
             (AShareDataSchema.SUPER_FLOW, pa.float64()),
@@ -73,3 +82,35 @@ class AShareDataSchema:
             (AShareDataSchema.MEDIUM_FLOW, pa.float64()),
             (AShareDataSchema.SMALL_FLOW, pa.float64())
         ])
+
+
+def to_date32(values):
+    """任意日期表示（字符串 / datetime / date）→ pandas date32 列，非法值为 NA；向量化，不逐行格式化"""
+    return pd.to_datetime(pd.Series(values), errors="coerce").astype("date32[pyarrow]")
+
+
+def to_legacy_dates(df):
+    """兼容垫片：把 v2 的 date32 日期列还原为 v1 的 'YYYY-MM-DD' 字符串，供仍按字符串比较的旧消费方使用"""
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_string_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce").dt.strftime("%Y-%m-%d")
+    return df
+
+
+def read_parquet_compat(path, columns=None, legacy_dates=True):
+    """读取 v1 / v2 任一版本的数据文件；legacy_dates=True 时日期列统一为字符串，False 时统一为 date32"""
+    df = pd.read_parquet(path, columns=columns)
+    if legacy_dates:
+        return to_legacy_dates(df)
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = to_date32(df[col]).values
+    return df
+
+
+def legacy_view_sql(source, columns):
+    """DuckDB 兼容视图：date32 日期列以 'YYYY-MM-DD' 字符串暴露，columns 为 source 的列名列表"""
+    replaced = [f"strftime({c}, '%Y-%m-%d') AS {c}" for c in DATE_COLUMNS if c in columns]
+    if not replaced:
+        return f"SELECT * FROM {source}"
+    return f"SELECT * REPLACE ({', '.join(replaced)}) FROM {source}"
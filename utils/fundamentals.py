@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+# all_stocks_f10_raw.parquet 中按报告期年内累计披露的流量类字段（利润表 / 现金流量表口径）
+CUMULATIVE_FIELDS = ["total_operate_income", "parent_netprofit", "basic_eps", "deduct_basic_eps", "mgjyxjje"]
+
+# 报告期月份 → 季度序号；非季末报告期不参与推演
+QUARTER_OF_MONTH = {3: 1, 6: 2, 9: 3, 12: 4}
+
+
+def _lag(keys, values, target):
+    """在按 key 升序的 (keys, values) 上精确查找 target，不存在时为 NaN"""
+    pos = np.searchsorted(keys, target)
+    pos_c = np.minimum(pos, len(keys) - 1)
+    hit = (pos < len(keys)) & (keys[pos_c] == target)
+    return np.where(hit, values[pos_c], np.nan)
+
+
+def compute_flow_metrics(df, fields=None):
+    """
+    年内累计字段 → 单季值 / TTM / 同比，一次排序、整数键查找完成全部字段，无 merge。
+
+    对每个字段 f 追加：
+      f_sq      单季值：Q1 即累计值，其余为本期累计 - 上一季累计（上一季缺失为 NaN）
+      f_ttm     滚动四季：年报取累计值；否则 本期累计 + 上年年报 - 上年同期累计
+      f_ttm_est 1 表示上年年报或上年同期缺失，TTM 以 累计 * 4 / 季度数 年化估算
+      f_yoy     累计值同比（%），上年同期缺失或为 0 时为 NaN
+    同一 (code, report_date) 多条时保留最后一条；返回按 (code, report_date) 排序的新 DataFrame
+    """
+    fields = [f for f in (fields or CUMULATIVE_FIELDS) if f in df.columns]
+    out = df.drop_duplicates(["code", "report_date"], keep="last")
+    out = out.sort_values(["code", "report_date"], kind="stable").reset_index(drop=True)
+
+    rd = pd.to_datetime(out["report_date"], errors="coerce")
+    quarter = rd.dt.month.map(QUARTER_OF_MONTH).values
+    valid = ~np.isnan(quarter)
+    q = np.where(valid, quarter, 0).astype(np.int64)
+
+    # (code, 季度序号) 合成单调整数键：季度序号 = 年 * 4 + 季度 - 1，前推 k 季即键值 - k
+    code_id = pd.factorize(out["code"])[0].astype(np.int64)
+    qidx = np.where(valid, rd.dt.year.fillna(0).astype(np.int64).values * 4 + q - 1, -1)
+    key = code_id * 100_000 + qidx
+    order = np.argsort(key[valid], kind="stable")
+    k_sorted = key[valid][order]
+
+    for f in fields:
+        cum = pd.to_numeric(out[f], errors="coerce").values.astype(np.float64)
+        v_sorted = cum[valid][order]
+        prev_q = _lag(k_sorted, v_sorted, key - 1)
+        prev_year_q4 = _lag(k_sorted, v_sorted, key - q)
+        prev_year_same = _lag(k_sorted, v_sorted, key - 4)
+
+        sq = np.where(q == 1, cum, cum - prev_q)
+        est = (q != 4) & (np.isnan(prev_year_q4) | np.isnan(prev_year_same))
+        ttm = np.select(
+            [q == 4, est],
+            [cum, cum * 4.0 / np.maximum(q, 1)],
+            default=cum + prev_year_q4 - prev_year_same,
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            yoy = np.where(prev_year_same != 0, (cum - prev_year_same) / np.abs(prev_year_same) * 100.0, np.nan)
+
+        out[f"{f}_sq"] = np.where(valid, sq, np.nan)
+        out[f"{f}_ttm"] = np.where(valid & ~np.isnan(cum), ttm, np.nan)
+        out[f"{f}_ttm_est"] = (valid & est & ~np.isnan(cum)).astype(np.int8)
+        out[f"{f}_yoy"] = np.where(valid, yoy, np.nan)
+
+    return out
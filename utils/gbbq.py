@@ -0,0 +1,187 @@
+import os
+import numpy as np
+import pandas as pd
+
+# gbbq.dat 单条记录：3 个 8 字节加密块 + 5 字节明文
+GBBQ_RECORD_SIZE = 29
+
+# 解密后的记录布局，与 pytdx GbbqReader 的 "<B7sIBffff" 一致
+GBBQ_RAW_DTYPE = np.dtype([
+    ("market", "u1"),
+    ("code", "S7"),
+    ("datetime", "<u4"),
+    ("category", "u1"),
+    ("hongli_panqianliutong", "<f4"),
+    ("peigujia_qianzongguben", "<f4"),
+    ("songgu_qianzongguben", "<f4"),
+    ("peigu_houzongguben", "<f4"),
+])
+
+GBBQ_VALUE_COLUMNS = [
+    "hongli_panqianliutong", "peigujia_qianzongguben",
+    "songgu_qianzongguben", "peigu_houzongguben",
+]
+
+# 二进制缓存：文件头 + 代码索引表（按代码排序）+ 按 (code, date) 排序的定长记录
+GBBQ_CACHE_MAGIC = b"GBBQ"
+GBBQ_CACHE_VERSION = 1
+GBBQ_CACHE_HEADER = np.dtype([
+    ("magic", "S4"), ("version", "<u4"), ("n_codes", "<u4"), ("n_records", "<u4"),
+])
+GBBQ_CACHE_INDEX = np.dtype([("code", "S8"), ("offset", "<u4"), ("count", "<u4")])
+GBBQ_CACHE_RECORD = np.dtype([
+    ("date", "<i4"), ("category", "<i4"),
+    ("hongli_panqianliutong", "<f4"), ("peigujia_qianzongguben", "<f4"),
+    ("songgu_qianzongguben", "<f4"), ("peigu_houzongguben", "<f4"),
+])
+
+
+def _load_keys():
+    """解密密钥表沿用 pytdx 内置的 hexdump，避免在仓库里复制一份"""
+    from pytdx.reader import GbbqReader
+    return np.frombuffer(bytes.fromhex(GbbqReader.hexdump_keys), dtype="<u4")
+
+
+def _decrypt_blocks(blocks, keys):
+    """
+    向量化 Feistel 解密：blocks 为 (N, 2) 的 uint32 数组，所有记录同一轮次一起计算，
+    轮函数与 pytdx 逐条实现逐位一致（uint32 溢出回绕由 numpy 保证）
+    """
+    num = keys[0x44 // 4] ^ blocks[:, 0]
+    numold = blocks[:, 1].copy()
+    t0, t1, t2, t3 = keys[0x448 // 4:], keys[0x48 // 4:], keys[0x848 // 4:], keys[0xC48 // 4:]
+    for j in range(16, 0, -1):
+        eax = t0[(num >> 16) & 0xFF] + t1[num >> 24]
+        eax ^= t2[(num >> 8) & 0xFF]
+        eax += t3[num & 0xFF]
+        eax ^= keys[j]
+        num, numold = numold ^ eax, num
+    numold ^= keys[0]
+    return np.stack([numold, num], axis=1)
+
+
+def tdx_prefix(codes):
+    """纯数字代码补全交易所前缀，规则与 Go 引擎 LoadGbbqCSV 保持一致"""
+    codes = pd.Series(codes, dtype=str)
+    prefix = np.where(codes.str.match(r"^(60|68)"), "sh",
+                      np.where(codes.str.match(r"^(43|83|87|88|92)"), "bj", "sz"))
+    return prefix + codes.values
+
+
+def decode_gbbq(path):
+    """
+    直接解密 gbbq.dat，返回与 pytdx GbbqReader.get_df 同列同值的 DataFrame，
+    但全部记录一次性矩阵运算，不再逐条 struct.unpack
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    count = int(np.frombuffer(content, dtype="<u4", count=1)[0])
+    raw = np.frombuffer(content, dtype=np.uint8, count=count * GBBQ_RECORD_SIZE, offset=4)
+    raw = raw.reshape(count, GBBQ_RECORD_SIZE)
+
+    keys = _load_keys()
+    clear = np.empty((count, GBBQ_RECORD_SIZE), dtype=np.uint8)
+    for i in range(3):
+        blocks = np.ascontiguousarray(raw[:, i * 8:(i + 1) * 8]).view("<u4")
+        clear[:, i * 8:(i + 1) * 8] = _decrypt_blocks(blocks, keys).astype("<u4").view(np.uint8)
+    clear[:, 24:] = raw[:, 24:]
+
+    rec = clear.reshape(-1).view(GBBQ_RAW_DTYPE)
+    df = pd.DataFrame({
+        "market": rec["market"].astype(np.int64),
+        "code": pd.Series(rec["code"]).str.decode("utf-8").str.rstrip("\x00"),
+        "datetime": rec["datetime"].astype(np.int64),
+        "category": rec["category"].astype(np.int64),
+    })
+    for col in GBBQ_VALUE_COLUMNS:
+        df[col] = rec[col].astype(np.float64)
+    return df
+
+
+def write_gbbq_cache(df, path):
+    """
+    把 decode_gbbq 的结果写成按 (code, date) 稳定排序的二进制缓存：
+    代码 → (offset, count) 索引表在前，Go 引擎与 Python 均可只取所需代码的记录
+    """
+    tdx_codes = tdx_prefix(df["code"])
+    order = np.lexsort((df["datetime"].values, tdx_codes))
+    tdx_codes = tdx_codes[order]
+
+    records = np.empty(len(df), dtype=GBBQ_CACHE_RECORD)
+    records["date"] = df["datetime"].values[order]
+    records["category"] = df["category"].values[order]
+    for col in GBBQ_VALUE_COLUMNS:
+        records[col] = df[col].values[order]
+
+    uniq, offsets, counts = np.unique(tdx_codes, return_index=True, return_counts=True)
+    index = np.empty(len(uniq), dtype=GBBQ_CACHE_INDEX)
+    index["code"] = np.char.encode(uniq.astype(str), "ascii")
+    index["offset"] = offsets
+    index["count"] = counts
+
+    header = np.array([(GBBQ_CACHE_MAGIC, GBBQ_CACHE_VERSION, len(index), len(records))], dtype=GBBQ_CACHE_HEADER)
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(index.tobytes())
+        f.write(records.tobytes())
+
+
+class GbbqCache:
+    """
+    gbbq 二进制缓存的内存映射读取器：只解析索引表，按代码切片取记录
+    """
+
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=GBBQ_CACHE_HEADER, count=1)[0]
+        if header["magic"] != GBBQ_CACHE_MAGIC or header["version"] != GBBQ_CACHE_VERSION:
+            raise ValueError(f"{path} is not a gbbq cache (v{GBBQ_CACHE_VERSION})")
+        n_codes, n_records = int(header["n_codes"]), int(header["n_records"])
+
+        index_offset = GBBQ_CACHE_HEADER.itemsize
+        self.index = np.memmap(path, dtype=GBBQ_CACHE_INDEX, mode="r", offset=index_offset, shape=(n_codes,))
+        records_offset = index_offset + n_codes * GBBQ_CACHE_INDEX.itemsize
+        if n_records:
+            self.records = np.memmap(path, dtype=GBBQ_CACHE_RECORD, mode="r", offset=records_offset, shape=(n_records,))
+        else:
+            self.records = np.empty(0, dtype=GBBQ_CACHE_RECORD)
+        self._slots = {
+            code.decode("ascii"): (int(off), int(cnt))
+            for code, off, cnt in zip(self.index["code"], self.index["offset"], self.index["count"])
+        }
+
+    @property
+    def codes(self):
+        return list(self._slots)
+
+    def lookup(self, code):
+        """返回单只代码（sh600000 或 sh.600000）的记录数组，按日期升序"""
+        slot = self._slots.get(code.replace(".", ""))
+        if slot is None:
+            return self.records[:0]
+        off, cnt = slot
+        return self.records[off:off + cnt]
+
+    def to_frame(self, codes=None):
+        """展开为 DataFrame（code 为带前缀的 TDX 代码），codes 为空时展开全部"""
+        if codes is None:
+            codes = self.codes
+        parts, names = [], []
+        for c in codes:
+            rec = self.lookup(c)
+            if len(rec):
+                parts.append(np.asarray(rec))
+                names.append(np.full(len(rec), c.replace(".", ""), dtype=object))
+        if not parts:
+            return pd.DataFrame(columns=["code"] + list(GBBQ_CACHE_RECORD.names))
+        rec = np.concatenate(parts)
+        df = pd.DataFrame({name: rec[name] for name in GBBQ_CACHE_RECORD.names})
+        df.insert(0, "code", np.concatenate(names))
+        return df
+
+
+def load_gbbq(path):
+    """按扩展名加载：.bin 返回 GbbqCache，其余（gbbq.dat）直接解密为 DataFrame"""
+    if os.path.splitext(path)[1].lower() == ".bin":
+        return GbbqCache(path)
+    return decode_gbbq(path)
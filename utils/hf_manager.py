@@ -1,4 +1,4 @@
-from huggingface_hub import HfApi
+from huggingface_hub import HfApi, hf_hub_download
 import os
 
 class HFManager:
@@ -14,3 +14,17 @@ class HFManager:
             repo_id=self.repo_id,
             repo_type="dataset"
         )
+
+    def download_file(self, path_in_repo, local_dir="."):
+        """下载数据集中的单个文件，文件不存在或网络失败时返回 None"""
+        try:
+            return hf_hub_download(
+                repo_id=self.repo_id,
+                filename=path_in_repo,
+                repo_type="dataset",
+                local_dir=local_dir,
+                token=self.api.token
+            )
+        except Exception as e:
+            print(f"⚠️ HF download skipped for {path_in_repo}: {e}")
+            return None
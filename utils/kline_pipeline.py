@@ -0,0 +1,68 @@
+import os
+import json
+import polars as pl
+
+from utils.security_master import encode_codes
+
+# 分片 Parquet 的列类型，与 DataCleaner.clean_stock_kline 的落盘结果保持一致
+F32_COLS = ["open", "high", "low", "close", "adjustFactor", "turn", "pctChg", "peTTM", "pbMRQ"]
+F64_COLS = ["volume", "amount", "total_shares", "float_shares", "total_mv", "float_mv"]
+
+
+def _st_map(master_path):
+    """stock_list_master.json → {code: isST}"""
+    if not master_path or not os.path.exists(master_path):
+        return {}
+    with open(master_path, "r", encoding="utf-8") as f:
+        return {x["code"]: 1 if "ST" in x["code_name"] else 0 for x in json.load(f)}
+
+
+def build_kline_part(engine_path, start, end, out_path, master_path="stock_list_master.json"):
+    """
+    Go 引擎 Arrow IPC 产物 → 分片 Parquet 的单条惰性列式流水线：
+    日期只解析一次并以 Date 类型过滤，去重后单次排序，按 code 窗口计算 pctChg，最后一次性写出。
+    返回写出的行数（0 表示无数据、不落盘）
+    """
+    if not os.path.exists(engine_path):
+        return 0
+
+    if engine_path.endswith(".parquet"):
+        lf = pl.scan_parquet(engine_path)
+    else:
+        lf = pl.scan_ipc(engine_path)
+
+    start_d = pl.lit(start).str.to_date("%Y-%m-%d")
+    end_d = pl.lit(end).str.to_date("%Y-%m-%d")
+
+    lf = (
+        lf
+        # 自愈清洗门禁：畸变日期（如 200846-07-02）解析为空或落在区间外，统一剔除
+        .with_columns(pl.col("date").str.strptime(pl.Date, "%Y-%m-%d", strict=False).alias("date"))
+        .filter(pl.col("date").is_not_null() & pl.col("date").is_between(start_d, end_d))
+        .unique(subset=["code", "date"], keep="last", maintain_order=True)
+        .sort(["code", "date"])
+        .with_columns(
+            ((pl.col("close") / pl.col("close").shift(1).over("code") - 1) * 100).fill_null(0.0).alias("pctChg"),
+            # 🚀 降维占位：peTTM 与 pbMRQ 属于基本面，留在 finalize 阶段通过 DuckDB 结合东财财报全量 ASOF 注入
+            pl.lit(0.0).alias("peTTM"),
+            pl.lit(0.0).alias("pbMRQ"),
+        )
+        .with_columns(
+            pl.col("code").replace_strict(_st_map(master_path), default=0, return_dtype=pl.Int8).alias("isST"),
+            # int32 证券 ID，下游合并、联表与排序走整数键
+            pl.col("code").map_batches(lambda s: pl.Series(encode_codes(s.to_numpy()), dtype=pl.Int32), return_dtype=pl.Int32).alias("sid"),
+        )
+    )
+
+    # date 保持原生 Date 落盘（schema v2 的 date32），不再逐行格式化回字符串
+    schema = lf.collect_schema()
+    lf = lf.with_columns(
+        [pl.col(c).cast(pl.Float32) for c in F32_COLS if c in schema]
+        + [pl.col(c).cast(pl.Float64) for c in F64_COLS if c in schema]
+    )
+
+    df = lf.collect()
+    if df.is_empty():
+        return 0
+    df.write_parquet(out_path)
+    return df.height
@@ -0,0 +1,72 @@
+import os
+import json
+
+MANIFEST_NAME = "merge_manifest.json"
+
+
+def _fp(rows, min_date, max_date, h_xor, h_sum, columns):
+    return {
+        "rows": int(rows),
+        "min_date": None if min_date is None else str(min_date),
+        "max_date": None if max_date is None else str(max_date),
+        "columns": columns,
+        "hash": f"{h_xor or 0:016x}-{int(h_sum or 0):x}",
+    }
+
+
+def fingerprint(con, select_sql, date_col="date"):
+    """
+    DuckDB 单次扫描计算分区内容指纹：行数、日期范围、列结构与逐行哈希的异或/求和聚合。
+    行哈希与行序无关，COPY 时的 ORDER BY 不影响结果；任一单元格变化都会改变哈希
+    """
+    schema = con.execute(f"DESCRIBE SELECT * FROM ({select_sql})").fetchall()
+    date_aggs = f"min({date_col}), max({date_col})" if date_col else "NULL, NULL"
+    row = con.execute(f"""
+        SELECT count(*), {date_aggs}, bit_xor(hash(t)), sum(hash(t) >> 32)
+        FROM ({select_sql}) t
+    """).fetchone()
+    return _fp(*row, [f"{name}:{dtype}" for name, dtype, *_ in schema])
+
+
+def fingerprint_by(con, table, key, date_col="date"):
+    """
+    按分区键分组一次扫描算出全部分区的指纹 {key 值: 指纹}，键列本身不计入哈希，
+    结果与对单个分区调用 fingerprint 一致；无数据的分区不出现在结果中
+    """
+    schema = con.execute(f"DESCRIBE SELECT * EXCLUDE ({key}) FROM {table}").fetchall()
+    # 显式列的 row(...) 与子查询整行的哈希相同，分组后仍能与单分区指纹对齐
+    row_expr = "row(" + ", ".join(f'"{name}"' for name, *_ in schema) + ")"
+    rows = con.execute(f"""
+        SELECT {key}, count(*), min({date_col}), max({date_col}), bit_xor(hash({row_expr})), sum(hash({row_expr}) >> 32)
+        FROM {table}
+        GROUP BY {key}
+    """).fetchall()
+    columns = [f"{name}:{dtype}" for name, dtype, *_ in schema]
+    return {k: _fp(*row, columns) for k, *row in rows}
+
+
+class MergeManifest:
+    """
+    已发布分区的内容清单 {文件名: 指纹}。merge_and_push 只重写/上传指纹变化的分区，
+    且仅在上传成功后登记，失败重跑时已成功的分区自动跳过
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f).get("partitions", {})
+            except Exception as e:
+                print(f"⚠️ Failed to parse merge manifest {path}: {e}")
+
+    def unchanged(self, name, fp):
+        return self.entries.get(name) == fp
+
+    def record(self, name, fp):
+        self.entries[name] = fp
+
+    def save(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"partitions": self.entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
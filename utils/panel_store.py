@@ -0,0 +1,161 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from utils.security_master import encode_codes, decode_sids
+
+META_NAME = "meta.json"
+PANEL_DTYPE = np.float32
+# 证券轴预留列数按此对齐：新上市标的直接占用空闲列，不触发整文件重写
+COL_ALIGN = 1024
+
+
+class PanelStore:
+    """
+    date × security 宽表存储：每个字段一个行优先 float32 裸文件（行 = 交易日，列 = 证券），
+    所有字段共享 dates.npy / sids.npy 两条轴。追加新交易日只在文件末尾扩展行，
+    读取时以 np.memmap 映射，任意字段、任意日期区间的切片都不经过 Parquet 解码
+    """
+
+    def __init__(self, root, fields=None):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        meta_path = os.path.join(root, META_NAME)
+        self.meta = {"fields": [], "capacity": 0}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        for name in fields or []:
+            if name not in self.meta["fields"]:
+                self.meta["fields"].append(name)
+        self.dates = self._load_axis("dates.npy", "datetime64[D]")
+        self.sids = self._load_axis("sids.npy", np.int32)
+        self._col = {int(s): i for i, s in enumerate(self.sids)}
+
+    def _load_axis(self, name, dtype):
+        path = os.path.join(self.root, name)
+        return np.load(path) if os.path.exists(path) else np.array([], dtype=dtype)
+
+    def _path(self, name):
+        return os.path.join(self.root, f"{name}.f32")
+
+    @property
+    def fields(self):
+        return list(self.meta["fields"])
+
+    @property
+    def codes(self):
+        return decode_sids(self.sids, "dot")
+
+    def field(self, name, mode="r"):
+        """字段的 (交易日数, 证券数) 只读 memmap 视图"""
+        if name not in self.meta["fields"]:
+            raise KeyError(f"unknown panel field: {name}")
+        if len(self.dates) == 0:
+            return np.empty((0, len(self.sids)), dtype=PANEL_DTYPE)
+        mm = np.memmap(self._path(name), dtype=PANEL_DTYPE, mode=mode, shape=(len(self.dates), self.meta["capacity"]))
+        return mm[:, :len(self.sids)]
+
+    def loc(self, name, start=None, end=None, codes=None):
+        """按日期区间与代码切片为 DataFrame（index = date，columns = code）"""
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start).date(), "D"), "left")
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end).date(), "D"), "right")
+        cols = np.arange(len(self.sids))
+        if codes is not None:
+            wanted = encode_codes([codes] if isinstance(codes, str) else codes)
+            cols = np.array([self._col[s] for s in wanted.tolist() if s in self._col], dtype=np.int64)
+        block = np.asarray(self.field(name)[lo:hi][:, cols])
+        return pd.DataFrame(block, index=pd.DatetimeIndex(self.dates[lo:hi], name="date"), columns=decode_sids(self.sids[cols], "dot"))
+
+    def _grow(self, capacity):
+        """
+        证券轴超出预留列时按新容量重写全部字段文件（罕见，按 COL_ALIGN 成块扩容）：
+        先把所有字段写成 .tmp，再统一换入并立即落盘新容量，旧 meta 不会以旧列宽读取新文件
+        """
+        old = self.meta["capacity"]
+        staged = []
+        for name in self.meta["fields"]:
+            path = self._path(name)
+            if not os.path.exists(path) or len(self.dates) == 0 or old == 0:
+                continue
+            src = np.memmap(path, dtype=PANEL_DTYPE, mode="r", shape=(len(self.dates), old))
+            tmp = path + ".tmp"
+            dst = np.memmap(tmp, dtype=PANEL_DTYPE, mode="w+", shape=(len(self.dates), capacity))
+            dst[:, old:] = np.nan
+            dst[:, :old] = src
+            dst.flush()
+            del src, dst
+            staged.append((tmp, path))
+        for tmp, path in staged:
+            os.replace(tmp, path)
+        self.meta["capacity"] = capacity
+        self._save_meta()
+
+    def _save_meta(self):
+        tmp = os.path.join(self.root, META_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(tmp, os.path.join(self.root, META_NAME))
+
+    def append(self, dates, codes, values):
+        """
+        写入长表记录：dates / codes 等长，values 为 {字段: 等长数组}。
+        晚于末日的新交易日追加为新行；已有交易日原地覆盖（当年数据可每日整体重写以吸收修订）；
+        早于首日且不在轴上的日期无法插入，计数后丢弃。返回 (写入行数, 新增交易日数)
+        """
+        days = pd.to_datetime(pd.Series(dates)).values.astype("datetime64[D]")
+        sids = encode_codes(codes) if not np.issubdtype(np.asarray(codes).dtype, np.integer) else np.asarray(codes, dtype=np.int32)
+        for name in values:
+            if name not in self.meta["fields"]:
+                self.meta["fields"].append(name)
+
+        # 1. 日期轴：只在末端追加
+        last = self.dates[-1] if len(self.dates) else np.datetime64("NaT")
+        new_days = np.unique(days if len(self.dates) == 0 else days[days > last])
+        old_n = len(self.dates)
+        all_dates = np.concatenate([self.dates, new_days])
+        rows = np.searchsorted(all_dates, days)
+        ok = (rows < len(all_dates)) & (all_dates[np.minimum(rows, len(all_dates) - 1)] == days) & (sids >= 0)
+        if (~ok).any():
+            print(f"⚠️ Panel append dropped {int((~ok).sum()):,} rows outside the date axis")
+
+        # 2. 证券轴：新标的占用下一空闲列，容量不足时成块扩容
+        for s in pd.unique(sids[ok]).tolist():
+            if s not in self._col:
+                self._col[s] = len(self._col)
+        n_cols = len(self._col)
+        if n_cols > self.meta["capacity"]:
+            self._grow(-(-int(n_cols * 1.25) // COL_ALIGN) * COL_ALIGN)
+        capacity = self.meta["capacity"]
+        cols = np.array([self._col.get(s, -1) for s in sids.tolist()], dtype=np.int64)
+
+        # 3. 逐字段扩展文件行数并散写
+        n = len(all_dates)
+        for name in self.meta["fields"]:
+            path = self._path(name)
+            existed = os.path.exists(path) and old_n > 0
+            if n == 0:
+                continue
+            with open(path, "ab"):
+                pass
+            os.truncate(path, n * capacity * np.dtype(PANEL_DTYPE).itemsize)
+            mm = np.memmap(path, dtype=PANEL_DTYPE, mode="r+", shape=(n, capacity))
+            if existed:
+                mm[old_n:] = np.nan
+            else:
+                mm[:] = np.nan
+            if name in values:
+                v = np.asarray(values[name], dtype=PANEL_DTYPE)
+                mm[rows[ok], cols[ok]] = v[ok]
+            mm.flush()
+            del mm
+
+        # 4. 数据落盘后再更新轴与元信息：新行 / 新列只在轴写入后才可见；
+        #    扩容（_grow）已在重写文件后单独落盘容量，中途失败时旧轴按新列宽读取仍与数据一致
+        self.dates = all_dates
+        self.sids = np.array(sorted(self._col, key=self._col.get), dtype=np.int32)
+        np.save(os.path.join(self.root, "dates.npy"), self.dates)
+        np.save(os.path.join(self.root, "sids.npy"), self.sids)
+        self._save_meta()
+        return int(ok.sum()), len(new_days)
@@ -0,0 +1,154 @@
+import os
+import numpy as np
+import pandas as pd
+
+from utils.fundamentals import compute_flow_metrics, CUMULATIVE_FIELDS
+from utils.security_master import encode_codes
+from utils.data_types import to_date32
+
+PIT_STORE_NAME = "f10_pit.parquet"
+PIT_KEY = ["code", "report_date"]
+# 判定“数据被修订”的原始字段；派生的 _ttm 列随版本一并保存
+PIT_VALUE_FIELDS = ["bps"] + CUMULATIVE_FIELDS
+PIT_DATE_COLUMNS = ["report_date", "notice_date", "update_date", "avail_date"]
+PIT_META_COLUMNS = ["code", "sid", "name", "report_date", "notice_date", "update_date", "avail_date", "version"]
+
+# (sid, 距 1970-01-01 天数) 合成单调键；天数 < 1e5 可覆盖到 2243 年
+_DAY_SPAN = 100_000
+
+
+def _days(values):
+    return pd.to_datetime(pd.Series(values), errors="coerce").values.astype("datetime64[D]").astype(np.int64)
+
+
+def _value_hash(df):
+    return pd.util.hash_pandas_object(df[PIT_VALUE_FIELDS].astype(np.float64), index=False).values
+
+
+def _normalize(df):
+    df = df.copy()
+    for col in PIT_DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif col in ("notice_date", "update_date"):
+            df[col] = pd.NaT
+    for col in PIT_VALUE_FIELDS:
+        if col not in df.columns:
+            df[col] = np.nan
+    return df
+
+
+def append_snapshot(store, snapshot, fetch_date):
+    """
+    把一次全量 F10 快照增量并入点时（PIT）库，只追加新报告期与数值被修订的报告期：
+      - 新报告期：avail_date = 公告日（缺失时依次回退 update_date、抓取日），version = 1
+      - 修订：avail_date = update_date（须晚于上一版本可得日，否则取抓取日），version + 1
+    同一快照内的单季 / TTM 由 compute_flow_metrics 推演，版本保存的是当时可知的派生值
+    """
+    snap = _normalize(snapshot)
+    snap["report_date"] = snap["report_date"].dt.strftime("%Y-%m-%d")
+    snap = compute_flow_metrics(snap, CUMULATIVE_FIELDS)
+    snap["report_date"] = pd.to_datetime(snap["report_date"])
+    snap = snap.dropna(subset=["report_date"])
+    snap["sid"] = encode_codes(snap["code"])
+    if "name" not in snap.columns:
+        snap["name"] = ""
+    fetch_ts = pd.Timestamp(fetch_date)
+    value_cols = PIT_VALUE_FIELDS + [f"{f}_ttm" for f in CUMULATIVE_FIELDS]
+
+    if store is None or store.empty:
+        snap["avail_date"] = snap["notice_date"].fillna(snap["update_date"]).fillna(fetch_ts)
+        snap["version"] = 1
+        return snap[PIT_META_COLUMNS + value_cols].reset_index(drop=True)
+
+    store = _normalize(store)
+    latest = store.sort_values("version", kind="stable").drop_duplicates(PIT_KEY, keep="last")
+    latest = latest.assign(_hash_prev=_value_hash(latest), avail_date_prev=latest["avail_date"], version_prev=latest["version"])
+    latest = latest[PIT_KEY + ["_hash_prev", "avail_date_prev", "version_prev"]]
+
+    snap["_hash"] = _value_hash(snap)
+    m = snap.merge(latest, on=PIT_KEY, how="left")
+    is_new = m["_hash_prev"].isna()
+    changed = ~is_new & (m["_hash"] != m["_hash_prev"])
+    fresh = m[is_new | changed].copy()
+    if fresh.empty:
+        return store
+
+    first_avail = fresh["notice_date"].fillna(fresh["update_date"]).fillna(fetch_ts)
+    restated_avail = fresh["update_date"].where(fresh["update_date"] > fresh["avail_date_prev"], fetch_ts)
+    fresh["avail_date"] = np.where(is_new[fresh.index], first_avail, restated_avail)
+    fresh["avail_date"] = pd.to_datetime(fresh["avail_date"])
+    fresh["version"] = fresh["version_prev"].fillna(0).astype(np.int64) + 1
+    print(f"🗂️ PIT store: +{int(is_new.sum())} new reports, +{int(changed.sum())} restatements")
+    return pd.concat([store, fresh[PIT_META_COLUMNS + value_cols]], ignore_index=True)
+
+
+def load_pit_store(path):
+    return pd.read_parquet(path) if path and os.path.exists(path) else pd.DataFrame()
+
+
+def save_pit_store(store, path):
+    out = store.sort_values(["sid", "report_date", "version"], kind="stable").reset_index(drop=True)
+    for col in PIT_DATE_COLUMNS:
+        out[col] = to_date32(out[col]).values
+    out.to_parquet(path, index=False)
+
+
+class PitStore:
+    """
+    点时查询：任一日期 d 上，每只股票可见的是 avail_date <= d 的最新报告期的最新版本。
+    预先把版本流压缩为按 (sid, avail_date) 排序的状态时间线，批量查询只需一次 searchsorted
+    """
+
+    def __init__(self, store):
+        if isinstance(store, str):
+            store = load_pit_store(store)
+        self.store = _normalize(store) if not store.empty else store
+        self._build()
+
+    def _build(self):
+        if self.store.empty:
+            self.timeline = self.store
+            self._keys = np.empty(0, dtype=np.int64)
+            return
+        t = self.store.sort_values(["sid", "avail_date", "report_date", "version"], kind="stable").reset_index(drop=True)
+        # 旧报告期的迟到修订不改变“最新报告期”，只保留推进状态的版本
+        newest = t.groupby("sid")["report_date"].cummax()
+        t = t[t["report_date"] >= newest]
+        t = t.drop_duplicates(["sid", "avail_date"], keep="last").reset_index(drop=True)
+        self.timeline = t
+        self._sid = t["sid"].values.astype(np.int64)
+        self._keys = self._sid * _DAY_SPAN + _days(t["avail_date"])
+
+    def get_pit(self, codes, dates, fields=None):
+        """
+        批量点时查询：codes（任意代码形态或 int sid）与 dates 等长，返回与输入逐行对齐的 DataFrame，
+        含 report_date、avail_date 及 fields 列；查询日之前无可得报告时为空值
+        """
+        fields = list(fields or [c for c in self.timeline.columns if c not in PIT_META_COLUMNS])
+        codes = np.asarray(codes)
+        if np.issubdtype(codes.dtype, np.integer):
+            q_sid = codes.astype(np.int64)
+        else:
+            # 百万级查询只对去重后的代码做字符串编码
+            inv, uniq = pd.factorize(codes)
+            q_sid = encode_codes(uniq).astype(np.int64)[inv]
+        q_key = q_sid * _DAY_SPAN + _days(dates)
+
+        pos = np.searchsorted(self._keys, q_key, side="right") - 1
+        pos_c = np.clip(pos, 0, max(len(self._keys) - 1, 0))
+        hit = (pos >= 0) & (len(self._keys) > 0)
+        if len(self._keys):
+            hit &= self._sid[pos_c] == q_sid
+
+        out = {}
+        for col in ["report_date", "avail_date"] + fields:
+            if len(self._keys) == 0:
+                out[col] = np.full(len(q_key), np.nan)
+                continue
+            vals = self.timeline[col].values[pos_c]
+            if np.issubdtype(vals.dtype, np.datetime64):
+                out[col] = np.where(hit, vals, np.datetime64("NaT"))
+            else:
+                out[col] = np.where(hit, vals.astype(np.float64), np.nan)
+        return pd.DataFrame(out)
@@ -0,0 +1,160 @@
+import os
+import json
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+def file_digests(path):
+    """单次流式读取同时算出 sha256（LFS 口径）与 git blob sha1（HF 普通文件口径）"""
+    sha256 = hashlib.sha256()
+    sha1 = hashlib.sha1(f"blob {os.path.getsize(path)}\0".encode())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            sha256.update(chunk)
+            sha1.update(chunk)
+    return {"sha256": sha256.hexdigest(), "git_sha1": sha1.hexdigest()}
+
+
+class LocalBackend:
+    """发布到本地目录：离线基准测试与联调用，行为与 HF 后端一致（按批原子落盘）"""
+
+    def __init__(self, root, max_workers=8):
+        self.root = root
+        self.name = f"local:{os.path.abspath(root)}"
+        self.max_workers = max_workers
+
+    def remote_digests(self, paths):
+        out = {}
+        for p in paths:
+            full = os.path.join(self.root, p)
+            if os.path.exists(full):
+                out[p] = file_digests(full)
+        return out
+
+    def commit(self, files, message):
+        def copy_one(item):
+            local, remote = item
+            dst = os.path.join(self.root, remote)
+            os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+            shutil.copyfile(local, dst + ".partial")
+            return dst
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            staged = list(pool.map(copy_one, files.items()))
+        # 整批拷贝完成后再统一改名，中途中断不会留下半批可见文件
+        for dst in staged:
+            os.replace(dst + ".partial", dst)
+
+
+class HFBackend:
+    """发布到 Hugging Face 数据集：一批文件一次 create_commit，LFS 分块由 huggingface_hub 并行上传"""
+
+    def __init__(self, token, repo_id, max_workers=8):
+        from huggingface_hub import HfApi
+        self.api = HfApi(token=token)
+        self.repo_id = repo_id
+        self.name = f"hf:{repo_id}"
+        self.max_workers = max_workers
+
+    def remote_digests(self, paths):
+        out = {}
+        try:
+            infos = self.api.get_paths_info(self.repo_id, list(paths), repo_type="dataset")
+        except Exception as e:
+            print(f"⚠️ HF remote listing failed, treating all files as changed: {e}")
+            return out
+        for info in infos:
+            lfs = getattr(info, "lfs", None)
+            if lfs is not None:
+                sha = lfs.get("sha256") if isinstance(lfs, dict) else getattr(lfs, "sha256", None)
+                out[info.path] = {"sha256": sha}
+            elif getattr(info, "blob_id", None):
+                out[info.path] = {"git_sha1": info.blob_id}
+        return out
+
+    def commit(self, files, message):
+        from huggingface_hub import CommitOperationAdd
+        ops = [CommitOperationAdd(path_in_repo=remote, path_or_fileobj=local) for local, remote in files.items()]
+        self.api.create_commit(
+            repo_id=self.repo_id,
+            repo_type="dataset",
+            operations=ops,
+            commit_message=message,
+            num_threads=self.max_workers,
+        )
+
+
+class Publisher:
+    """
+    批量、可续传的发布器：
+    1. 并行计算本地文件摘要，与远端（及断点日志）比对，内容相同的文件跳过；
+    2. 变化文件按 batch_size 分组，每组一次多文件提交；
+    3. 每组提交成功即写入断点日志，中断后重跑只补传剩余批次
+    """
+
+    def __init__(self, backend, journal_path=None, batch_size=200, max_workers=8):
+        self.backend = backend
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.journal = self._load_journal()
+        # 本次运行已确认与远端一致的 remote 路径（含跳过的文件），供调用方登记清单
+        self.done = set()
+
+    def _load_journal(self):
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return {}
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("files", {}) if data.get("target") == self.backend.name else {}
+        except Exception:
+            return {}
+
+    def _save_journal(self):
+        if not self.journal_path:
+            return
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            json.dump({"target": self.backend.name, "files": self.journal}, f, indent=1)
+
+    def publish(self, targets, message):
+        """targets: {本地路径: 远端路径}。返回 (已提交的远端路径列表, 跳过的远端路径列表)"""
+        if not targets:
+            return [], []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            local_digests = dict(zip(targets, pool.map(file_digests, targets)))
+
+        pending = {l: r for l, r in targets.items() if self.journal.get(r) != local_digests[l]["sha256"]}
+        remote = self.backend.remote_digests(pending.values()) if pending else {}
+
+        changed, skipped = {}, []
+        for local, path in targets.items():
+            digest = local_digests[local]
+            rd = remote.get(path, {})
+            same = local not in pending or any(rd.get(k) and rd[k] == digest[k] for k in ("sha256", "git_sha1"))
+            if same:
+                skipped.append(path)
+                self.done.add(path)
+                self.journal[path] = digest["sha256"]
+            else:
+                changed[local] = path
+
+        items = list(changed.items())
+        batches = [dict(items[i:i + self.batch_size]) for i in range(0, len(items), self.batch_size)]
+        committed = []
+        for n, batch in enumerate(batches, 1):
+            suffix = f" ({n}/{len(batches)})" if len(batches) > 1 else ""
+            print(f"🚀 Publishing {len(batch)} files to {self.backend.name}{suffix}...")
+            self.backend.commit(batch, message + suffix)
+            for local, path in batch.items():
+                self.journal[path] = local_digests[local]["sha256"]
+                self.done.add(path)
+                committed.append(path)
+            self._save_journal()
+
+        self._save_journal()
+        print(f"✅ Published {len(committed)} changed files, skipped {len(skipped)} identical files")
+        return committed, skipped
@@ -1,7 +1,40 @@
 import pandas as pd
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
 import json
 import os
 
+
+def _row_group_stats(meta, columns):
+    """汇总各 row group 的列统计：全部 row group 都带统计时才给出 min/max 与 null_count"""
+    out = {}
+    for i, col in enumerate(columns):
+        mins, maxs, nulls = [], [], 0
+        has_min_max = has_null_count = True
+        for rg in range(meta.num_row_groups):
+            st = meta.row_group(rg).column(i).statistics
+            if st is None:
+                has_min_max = has_null_count = False
+                break
+            if st.has_min_max:
+                mins.append(st.min)
+                maxs.append(st.max)
+            elif meta.row_group(rg).num_rows > (st.null_count if st.has_null_count else 0):
+                has_min_max = False
+            if st.has_null_count:
+                nulls += st.null_count
+            else:
+                has_null_count = False
+        out[col] = {
+            "has_min_max": has_min_max and bool(mins),
+            "min": min(mins) if mins else None,
+            "max": max(maxs) if maxs else None,
+            "has_null_count": has_null_count,
+            "null_count": nulls,
+        }
+    return out
+
 class QualityControl:
     def __init__(self):
         self.report = {"errors": [], "stats": {}}
@@ -52,12 +85,93 @@ class QualityControl:
                 nulls = int(df[col].isnull().sum())
                 if nulls > 0: anomaly_details[f"null_{col}"] = nulls
 
+        self._commit(name, stats, anomaly_details)
+
+    def _commit(self, name, stats, anomaly_details):
         stats["anomalies"] = anomaly_details
         stats["anomaly_count"] = sum(anomaly_details.values())
         stats["anomaly_types"] = list(anomaly_details.keys())
 
         self.report["stats"][name] = stats
 
+    def check_parquet(self, file_path, name, critical_cols=[]):
+        """
+        与 check_dataframe 口径一致的流式质检：直接对 Parquet 文件做聚合，不载入 pandas。
+        行数、字段、日期范围、非浮点列空值取自 row-group 统计；统计缺失时与
+        high<low、负成交量、浮点列 NaN、标的数量一起在 DuckDB 的单次扫描中完成
+        """
+        meta = pq.ParquetFile(file_path).metadata
+        arrow_schema = meta.schema.to_arrow_schema()
+        columns = list(arrow_schema.names)
+        stats = {
+            "total_rows": meta.num_rows,
+            "columns": columns,
+            "anomalies": {},
+            "anomaly_count": 0,
+            "file_size_mb": round(os.path.getsize(file_path) / (1024 * 1024), 2)
+        }
+
+        if meta.num_rows == 0:
+            self.report["errors"].append(f"{name} is empty!")
+            return
+
+        col_stats = _row_group_stats(meta, columns)
+        aggs = {}
+
+        if "date" in columns:
+            if "date" in col_stats and col_stats["date"]["has_min_max"]:
+                stats["start_date"] = str(col_stats["date"]["min"])
+                stats["end_date"] = str(col_stats["date"]["max"])
+            else:
+                aggs["start_date"] = "CAST(min(date) AS VARCHAR)"
+                aggs["end_date"] = "CAST(max(date) AS VARCHAR)"
+
+        if "code" in columns:
+            aggs["unique_codes"] = "count(DISTINCT code)"
+
+        if "high" in columns and "low" in columns:
+            aggs["high_lt_low"] = "count(*) FILTER (WHERE high > 0 AND low > 0 AND high < low)"
+
+        if "volume" in columns:
+            vol = col_stats.get("volume")
+            # 全部 row group 的最小值非负时无需扫描
+            if not (vol and vol["has_min_max"] and vol["min"] >= 0):
+                aggs["neg_volume"] = "count(*) FILTER (WHERE volume < 0)"
+
+        for col in critical_cols:
+            if col not in columns:
+                continue
+            # pandas isnull 同时计入浮点 NaN，row-group 的 null_count 不含 NaN，浮点列需扫描
+            if pa.types.is_floating(arrow_schema.field(col).type):
+                aggs[f"null_{col}"] = f'count(*) FILTER (WHERE "{col}" IS NULL OR isnan("{col}"))'
+            elif col in col_stats and col_stats[col]["has_null_count"]:
+                aggs[f"null_{col}"] = col_stats[col]["null_count"]
+            else:
+                aggs[f"null_{col}"] = f'count(*) FILTER (WHERE "{col}" IS NULL)'
+
+        sql_aggs = {k: v for k, v in aggs.items() if isinstance(v, str)}
+        values = {k: v for k, v in aggs.items() if not isinstance(v, str)}
+        if sql_aggs:
+            con = duckdb.connect()
+            row = con.execute(
+                f"SELECT {', '.join(sql_aggs.values())} FROM read_parquet('{file_path}')"
+            ).fetchone()
+            con.close()
+            values.update(zip(sql_aggs.keys(), row))
+
+        for key in ("start_date", "end_date"):
+            if key in values:
+                stats[key] = values.pop(key)
+        if "unique_codes" in values:
+            stats["unique_codes"] = int(values.pop("unique_codes"))
+
+        anomaly_details = {}
+        for key in ["high_lt_low", "neg_volume"] + [f"null_{c}" for c in critical_cols]:
+            err = int(values.get(key) or 0)
+            if err > 0: anomaly_details[key] = err
+
+        self._commit(name, stats, anomaly_details)
+
     def save_report(self, path):
         dir_name = os.path.dirname(path)
         if dir_name:
@@ -0,0 +1,449 @@
+import os
+import re
+import json
+import hashlib
+import datetime
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils.security_master import encode_codes, decode_sids
+from utils.row_index import row_index_name, read_indexed
+from utils.merge_manifest import MergeManifest, MANIFEST_NAME
+from utils.sina_flow import FLOW_FIELDS
+
+# 已发布的按年分区数据集
+DATASETS = {
+    "kline": "stock_kline_{}.parquet",
+    "money_flow": "stock_money_flow_{}.parquet",
+    "sector_kline": "sector_kline_{}.parquet",
+    "index_kline": "index_kline_{}.parquet",
+}
+FIRST_YEAR = 2005
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stockA")
+DEFAULT_CACHE_BYTES = 20 * 1024 ** 3
+
+ADJUST_MODES = ("qfq", "hfq")
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+
+
+class FileCache:
+    """本地下载缓存：按最近访问时间（mtime）做 LRU，总大小超过 max_bytes 时淘汰最久未用的文件"""
+
+    def __init__(self, root, max_bytes=DEFAULT_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def touch(self, path):
+        os.utime(path, None)
+
+    def evict(self, keep=()):
+        keep = {os.path.abspath(p) for p in keep}
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            if ".cache" in dirpath.split(os.sep):
+                continue
+            for n in names:
+                if n.endswith(".parquet"):
+                    p = os.path.join(dirpath, n)
+                    st = os.stat(p)
+                    files.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in files)
+        for _, size, p in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if os.path.abspath(p) in keep:
+                continue
+            os.remove(p)
+            total -= size
+
+
+class DatasetReader:
+    """
+    按年分区数据集的读取入口：解析所需年份文件，把代码 / 日期谓词与列裁剪下推到 Parquet 扫描。
+    文件按 (sid, date) 排序落盘，行组 min/max 统计可让单股查询只解码命中的行组。
+    source 为本地目录（如 output/ 或 --publish-dir）时直接读取；否则视为 HF 数据集 repo_id，按需下载到本地缓存
+    """
+
+    def __init__(self, source=None, cache_dir=None, max_cache_bytes=None, token=None):
+        self.source = source or os.getenv("STOCKA_DATA_DIR") or os.getenv("HF_REPO")
+        self.local = bool(self.source) and os.path.isdir(self.source)
+        self.token = token or os.getenv("HF_TOKEN")
+        cache_root = cache_dir or os.getenv("STOCKA_CACHE_DIR") or DEFAULT_CACHE_DIR
+        self.cache = None if self.local else FileCache(cache_root, max_cache_bytes or DEFAULT_CACHE_BYTES)
+        # 复权缓存按数据源隔离：不同目录 / 数据集共用 cache_root 时互不污染
+        source_key = os.path.abspath(self.source) if self.local else f"hf:{self.source}"
+        slug = re.sub(r"[^0-9A-Za-z]+", "_", source_key).strip("_")[-40:]
+        self.adjust_dir = os.path.join(cache_root, "adjusted", f"{slug}_{hashlib.sha1(source_key.encode()).hexdigest()[:8]}")
+        self._anchors = {}
+        self._indexes = {}
+        self._fps = {}
+
+    def _fetch(self, name):
+        if self.local:
+            path = os.path.join(self.source, name)
+            return path if os.path.exists(path) else None
+        from huggingface_hub import hf_hub_download
+        cached = os.path.join(self.cache.root, name)
+        try:
+            # 远端未变化时只做一次元数据校验，不重复下载
+            path = hf_hub_download(repo_id=self.source, filename=name, repo_type="dataset",
+                                   local_dir=self.cache.root, token=self.token)
+        except Exception as e:
+            if not os.path.exists(cached):
+                print(f"⚠️ {name} unavailable: {e}")
+                return None
+            path = cached
+        self.cache.touch(path)
+        return path
+
+    def resolve(self, dataset, start=None, end=None):
+        """日期区间 → 需要读取的本地年份文件（不存在的年份跳过）"""
+        tpl = DATASETS.get(dataset, dataset)
+        y_lo = _to_date(start).year if start else FIRST_YEAR
+        y_hi = _to_date(end).year if end else datetime.date.today().year
+        paths = [p for p in (self._fetch(tpl.format(y)) for y in range(y_lo, y_hi + 1)) if p]
+        if self.cache:
+            self.cache.evict(keep=paths)
+        return paths
+
+    def _scan(self, path, sids, start, end, fields):
+        dset = ds.dataset(path, format="parquet")
+        names = dset.schema.names
+        cols = None if not fields else [c for c in dict.fromkeys(["date", "code"] + list(fields)) if c in names]
+        return _normalize_dates(dset.to_table(columns=cols, filter=_build_filter(dset.schema, sids, start, end)))
+
+    def _read(self, dataset, sids, start, end, fields):
+        if sids is not None:
+            indexed = self._read_indexed(dataset, sids, start, end, fields)
+            if indexed is not None:
+                return indexed
+        tables = [self._scan(path, sids, start, end, fields) for path in self.resolve(dataset, start, end)]
+        return pa.concat_tables(tables, promote_options="permissive") if tables else pa.table({})
+
+    def _row_index(self, tpl):
+        if tpl not in self._indexes:
+            path = self._fetch(row_index_name(tpl))
+            self._indexes[tpl] = pd.read_parquet(path) if path else None
+        return self._indexes[tpl]
+
+    def _read_indexed(self, dataset, sids, start, end, fields):
+        """
+        行组索引快路径：只打开含目标代码的年份文件，按索引直接读取命中的行组与行区间。
+        索引未覆盖的年份、或文件行数与索引不符（文件已重写而索引未更新）的年份回退为谓词下推扫描
+        """
+        tpl = DATASETS.get(dataset, dataset)
+        idx = self._row_index(tpl)
+        if idx is None:
+            return None
+        y_lo = _to_date(start).year if start else FIRST_YEAR
+        y_hi = _to_date(end).year if end else datetime.date.today().year
+        covered = set(idx["year"].unique().tolist())
+        hits = idx[idx["sid"].isin(sids) & idx["year"].between(y_lo, y_hi)]
+        by_year = dict(tuple(hits.groupby("year")))
+
+        tables, used = [], []
+        for y in range(y_lo, y_hi + 1):
+            if y in covered and y not in by_year:
+                continue
+            path = self._fetch(tpl.format(y))
+            if not path:
+                continue
+            used.append(path)
+            part = by_year.get(y)
+            pf = pq.ParquetFile(path)
+            stale = part is not None and (pf.metadata.num_rows != int(part["file_rows"].iloc[0])
+                                          or pf.metadata.num_row_groups != int(part["file_row_groups"].iloc[0]))
+            if part is None or stale:
+                tables.append(self._scan(path, sids, start, end, fields))
+                continue
+            names = pf.schema_arrow.names
+            cols = None if not fields else [c for c in dict.fromkeys(["date", "code"] + list(fields)) if c in names]
+            table = _normalize_dates(read_indexed(pf, part.sort_values("row_start"), cols))
+            if start:
+                table = table.filter(pc.greater_equal(table["date"], pa.scalar(_to_date(start), pa.date32())))
+            if end:
+                table = table.filter(pc.less_equal(table["date"], pa.scalar(_to_date(end), pa.date32())))
+            tables.append(table)
+        if self.cache:
+            self.cache.evict(keep=used)
+        # 无任何命中时交回扫描路径，保证空结果也带完整列结构
+        return pa.concat_tables(tables, promote_options="permissive") if tables else None
+
+    def load(self, dataset, codes=None, start=None, end=None, fields=None, output="pandas", adjust=None, cache=False):
+        """
+        读取 [start, end] 区间内指定代码的记录。codes 接受任意代码形态（sh.600000 / 600000 / BK1043）；
+        fields 为空时读全部列，否则只解码 date、code 与所列字段。output: pandas / polars / arrow。
+        adjust 为 qfq / hfq 时返回复权后的 OHLC 与成交量（仅个股 K 线）；cache=True 时走按最新因子与分区指纹失效的本地复权缓存，返回列与 cache=False 相同
+        """
+        sids = None if codes is None else sorted(set(encode_codes([codes] if isinstance(codes, str) else codes).tolist()))
+        if adjust:
+            if adjust not in ADJUST_MODES:
+                raise ValueError(f"unknown adjust mode: {adjust}")
+            if cache:
+                if sids is None:
+                    raise ValueError("cached adjusted reads require explicit codes")
+                result = self._adjusted_cached(sids, start, end, adjust)
+                if fields:
+                    result = result.select([c for c in dict.fromkeys(["date", "code"] + list(fields)) if c in result.column_names])
+            else:
+                need = None if not fields else list(fields) + ["sid", "adjustFactor"]
+                df = self._read(dataset, sids, start, end, need).to_pandas()
+                if "sid" not in df.columns and not df.empty:
+                    df["sid"] = encode_codes(df["code"])
+                anchors = self.latest_factors(df["sid"].unique().tolist()) if adjust == "qfq" and not df.empty else None
+                df = adjust_prices(df, adjust, anchors)
+                if fields:
+                    df = df[[c for c in dict.fromkeys(["date", "code"] + list(fields)) if c in df.columns]]
+                result = pa.Table.from_pandas(df, preserve_index=False)
+        else:
+            result = self._read(dataset, sids, start, end, fields)
+
+        if output == "arrow":
+            return result
+        if output == "polars":
+            import polars as pl
+            return pl.from_arrow(result)
+        return result.to_pandas()
+
+    def latest_factors(self, sids):
+        """
+        各代码全历史最新一期复权因子（前复权锚点）：自今年起向前逐年只投影 sid / date / adjustFactor，
+        找齐即停；同一 reader 内记忆化
+        """
+        need = sorted(set(int(s) for s in sids) - self._anchors.keys())
+        for year in range(datetime.date.today().year, FIRST_YEAR - 1, -1):
+            if not need:
+                break
+            paths = self.resolve("kline", f"{year}-01-01", f"{year}-12-31")
+            if not paths:
+                continue
+            df = self._scan(paths[0], need, None, None, ["sid", "adjustFactor"]).to_pandas()
+            if df.empty:
+                continue
+            last = df.sort_values(["sid", "date"], kind="stable").groupby("sid").tail(1)
+            self._anchors.update(zip(last["sid"].tolist(), last["adjustFactor"].astype(np.float64).tolist()))
+            need = [s for s in need if s not in self._anchors]
+        return {int(s): self._anchors.get(int(s)) for s in sids}
+
+    def _partition_fps(self, dataset):
+        """
+        {年份: 分区内容指纹}：取自源端 merge_manifest.json（合并时逐年计算的内容哈希）；
+        源端无清单时退化为本地年份文件的 (大小, 修改时间)
+        """
+        tpl = DATASETS.get(dataset, dataset)
+        if tpl not in self._fps:
+            pattern = re.compile(re.escape(tpl).replace(re.escape("{}"), r"(\d{4})"))
+            fps = {}
+            path = self._fetch(MANIFEST_NAME)
+            if path:
+                for name, fp in MergeManifest(path).entries.items():
+                    m = pattern.fullmatch(name)
+                    if m:
+                        fps[int(m.group(1))] = f"{fp.get('rows')}:{fp.get('hash')}"
+            else:
+                for p in self.resolve(dataset):
+                    m = pattern.fullmatch(os.path.basename(p))
+                    if m:
+                        st = os.stat(p)
+                        fps[int(m.group(1))] = f"{st.st_size}:{st.st_mtime_ns}"
+            self._fps[tpl] = fps
+        return self._fps[tpl]
+
+    def _adjusted_cached(self, sids, start, end, mode):
+        """
+        逐代码的全历史复权序列缓存于 adjusted/{源}/{mode}/{sid}.parquet，文件元数据记录生成时的最新因子
+        与所覆盖各年份分区的内容指纹：
+          - 最新因子变化（除权）：整段重算
+          - 某年份分区指纹变化（当年重写、历史修订）：只重算该年份的行
+          - 其余年份直接沿用缓存
+        缓存保存与原始文件相同的全部列，返回结果与 cache=False 一致
+        """
+        anchors = self.latest_factors(sids)
+        fps = self._partition_fps("kline")
+        cache_dir = os.path.join(self.adjust_dir, mode)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        kept, todo = {}, {}
+        for s in sids:
+            if anchors.get(s) is None:
+                continue
+            path = os.path.join(cache_dir, f"{s}.parquet")
+            old_fps, cached = {}, None
+            if os.path.exists(path):
+                meta = pq.read_schema(path).metadata or {}
+                if meta.get(b"anchor") == repr(anchors[s]).encode():
+                    old_fps = json.loads(meta.get(b"partitions", b"{}"))
+                    cached = pq.read_table(path).to_pandas()
+            changed = [y for y in fps if old_fps.get(str(y)) != fps[y]]
+            if cached is not None:
+                years = pd.to_datetime(cached["date"]).dt.year
+                cached = cached[years.isin(fps) & ~years.isin(changed)]
+            kept[s] = (cached, bool(changed) or cached is None)
+            for y in changed:
+                todo.setdefault(y, []).append(s)
+
+        fresh = {}
+        for y, year_sids in sorted(todo.items()):
+            raw = self._read("kline", year_sids, f"{y}-01-01", f"{y}-12-31", None).to_pandas()
+            if raw.empty:
+                continue
+            if "sid" not in raw.columns:
+                raw["sid"] = encode_codes(raw["code"])
+            for s, part in adjust_prices(raw, mode, anchors).groupby("sid", sort=False):
+                fresh.setdefault(int(s), []).append(part)
+
+        frames = []
+        for s, (cached, dirty) in kept.items():
+            parts = ([cached] if cached is not None and not cached.empty else []) + fresh.get(s, [])
+            if not parts:
+                continue
+            df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+            if dirty:
+                df = self._save_adjusted(cache_dir, s, df, anchors[s], fps)
+            frames.append(df)
+
+        if not frames:
+            return pa.table({})
+        df = pd.concat(frames, ignore_index=True)
+        if start:
+            df = df[df["date"] >= _to_date(start)]
+        if end:
+            df = df[df["date"] <= _to_date(end)]
+        return pa.Table.from_pandas(df.sort_values(["sid", "date"], kind="stable"), preserve_index=False)
+
+    def _save_adjusted(self, cache_dir, sid, df, anchor, fps):
+        df = df.sort_values("date", kind="stable").reset_index(drop=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"anchor": repr(anchor).encode(),
+            b"partitions": json.dumps({str(y): v for y, v in fps.items()}).encode(),
+        })
+        path = os.path.join(cache_dir, f"{sid}.parquet")
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return df
+
+
+def adjust_prices(df, mode, anchors=None):
+    """
+    复权换算（原地修改并返回 df）。df 需含 adjustFactor（Go 引擎自上市起累乘的后复权因子）：
+      hfq  价格 * 因子，成交量 / 因子
+      qfq  价格 * 因子 / 该代码最新因子，成交量反向换算；anchors 为 {sid: 最新因子}
+    """
+    if df.empty:
+        return df
+    factor = df["adjustFactor"].astype(np.float64)
+    ratio = factor if mode == "hfq" else factor / df["sid"].map(anchors).astype(np.float64)
+    for col in PRICE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float64) * ratio
+    if "volume" in df.columns:
+        df["volume"] = df["volume"].astype(np.float64) / ratio
+    return df
+
+
+def _to_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def _build_filter(schema, sids, start, end):
+    """按文件实际 schema 组装谓词：有 sid 列用 int 范围 + 集合（范围部分可命中行组统计），v1 文件回退 code；日期兼容 v1 字符串"""
+    expr = None
+
+    def _and(e):
+        return e if expr is None else expr & e
+
+    if sids is not None:
+        if "sid" in schema.names:
+            key = ds.field("sid")
+            expr = _and((key >= sids[0]) & (key <= sids[-1]))
+            expr = _and(key == sids[0]) if len(sids) == 1 else _and(key.isin(sids))
+        else:
+            expr = _and(ds.field("code").isin(list(decode_sids(sids, "dot")) + list(decode_sids(sids, "pure"))))
+
+    is_str = pa.types.is_string(schema.field("date").type) or pa.types.is_large_string(schema.field("date").type)
+    if start:
+        d = _to_date(start)
+        expr = _and(ds.field("date") >= (d.isoformat() if is_str else d))
+    if end:
+        d = _to_date(end)
+        expr = _and(ds.field("date") <= (d.isoformat() if is_str else d))
+    return expr
+
+
+def _normalize_dates(table):
+    """v1 字符串日期统一转为 date32，跨年拼接时 schema 一致"""
+    if "date" in table.column_names and pa.types.is_string(table.schema.field("date").type):
+        idx = table.column_names.index("date")
+        table = table.set_column(idx, "date", pc.cast(pc.strptime(table["date"], "%Y-%m-%d", "s"), pa.date32()))
+    return table
+
+
+_default_reader = None
+
+
+def _reader(reader):
+    global _default_reader
+    if reader is not None:
+        return reader
+    if _default_reader is None:
+        _default_reader = DatasetReader()
+    return _default_reader
+
+
+def load_kline(codes=None, start=None, end=None, fields=None, output="pandas", reader=None, adjust=None, cache=False):
+    return _reader(reader).load("kline", codes, start, end, fields, output, adjust, cache)
+
+
+def load_money_flow(codes=None, start=None, end=None, fields=None, output="pandas", reader=None):
+    return _reader(reader).load("money_flow", codes, start, end, fields, output)
+
+
+def load_sector_kline(codes=None, start=None, end=None, fields=None, output="pandas", reader=None):
+    return _reader(reader).load("sector_kline", codes, start, end, fields, output)
+
+
+def load_index_kline(codes=None, start=None, end=None, fields=None, output="pandas", reader=None):
+    return _reader(reader).load("index_kline", codes, start, end, fields, output)
+
+
+def year_frame(con, kline_path, flow_path, exprs):
+    """
+    单个年度 K 线文件（左连接同年资金流）→ 按 (sid, date) 排序的 Arrow 长表，字段统一 float32。
+    exprs 为 {输出列名: 以 k. 引用 K 线列的 SQL 表达式}；资金流列取 sina_flow.FLOW_FIELDS 的全部输出列。
+    在该年文件上无法绑定的表达式 / 列（早年缺失字段）直接跳过。con 需已注册 code_sid 宏
+    """
+    k_src = f"read_parquet('{kline_path}')"
+    sid = "k.sid" if _bindable(con, "k.sid", k_src, "k") else "code_sid(k.code)"
+    selects = [f"CAST({e} AS FLOAT) AS \"{n}\"" for n, e in exprs.items() if _bindable(con, e, k_src, "k")]
+    join = ""
+    if flow_path:
+        f_src = f"read_parquet('{flow_path}')"
+        f_sid = "f.sid" if _bindable(con, "f.sid", f_src, "f") else "code_sid(f.code)"
+        selects += [f"CAST(f.{c} AS FLOAT) AS \"{c}\"" for c in FLOW_FIELDS.values() if _bindable(con, f"f.{c}", f_src, "f")]
+        join = f"LEFT JOIN {f_src} f ON {sid} = {f_sid} AND CAST(k.date AS DATE) = CAST(f.date AS DATE)"
+    return con.execute(f"""
+        SELECT {sid} AS sid, CAST(k.date AS DATE) AS date, {', '.join(selects)}
+        FROM {k_src} k {join}
+        ORDER BY 1, 2
+    """).fetch_arrow_table()
+
+
+def _bindable(con, expr, source, alias):
+    """只做绑定不扫描数据：表达式引用的列在文件中都存在时为 True"""
+    try:
+        con.execute(f"DESCRIBE SELECT {expr} FROM {source} {alias}")
+        return True
+    except duckdb.BinderException:
+        return False
@@ -0,0 +1,122 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 目标行组行数：约 60~70 只股票的一整年日线；行组只在代码边界切分，单只代码不会跨行组
+ROW_GROUP_ROWS = 16384
+ROW_INDEX_COLUMNS = ["year", "sid", "row_group", "row_start", "row_end", "file_rows", "file_row_groups"]
+
+
+def row_index_name(name_tpl):
+    """stock_kline_{}.parquet → rowindex_stock_kline.parquet（不匹配按年文件的 glob）"""
+    return "rowindex_" + name_tpl.replace("_{}", "")
+
+
+def _runs(sid, offset, row_group):
+    """有序 sid 数组 → 每个代码的 [row_start, row_end) 区间（文件级行号）"""
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(sid)) + 1])
+    ends = np.concatenate([starts[1:], [len(sid)]])
+    return pd.DataFrame({
+        "sid": sid[starts].astype(np.int32),
+        "row_group": np.int32(row_group),
+        "row_start": (starts + offset).astype(np.int64),
+        "row_end": (ends + offset).astype(np.int64),
+    })
+
+
+def _is_sorted(pf):
+    """只读 sid / date 两列校验文件是否按 (sid, date) 有序"""
+    cols = ["sid"] + (["date"] if "date" in pf.schema_arrow.names else [])
+    keys = pf.read(columns=cols)
+    d_sid = np.diff(keys["sid"].to_numpy())
+    if "date" not in cols:
+        return bool((d_sid >= 0).all())
+    d_date = np.diff(keys["date"].to_numpy().astype("datetime64[D]").astype(np.int64))
+    return bool(((d_sid > 0) | ((d_sid == 0) & (d_date > 0))).all())
+
+
+def cluster_row_groups(path, target_rows=ROW_GROUP_ROWS):
+    """
+    流式重写按 (sid, date) 排序的 Parquet：行组在满 target_rows 后的第一个代码边界处切分，
+    同时产出 sid → (行组, 行区间) 索引。文件无 sid 列时原样保留并返回 None
+    """
+    pf = pq.ParquetFile(path)
+    if "sid" not in pf.schema_arrow.names:
+        return None
+    batches = pf.iter_batches(batch_size=65536)
+    if not _is_sorted(pf):
+        # 索引假设文件按 (sid, date) 有序；上游写出乱序时先整体排序，不产出被切碎的索引
+        print(f"⚠️ {os.path.basename(path)} is not sorted by (sid, date), sorting before clustering")
+        keys = [("sid", "ascending")] + ([("date", "ascending")] if "date" in pf.schema_arrow.names else [])
+        batches = pf.read().sort_by(keys).to_batches(max_chunksize=65536)
+    tmp = path + ".tmp"
+    entries, buf, written, rg = [], None, 0, 0
+
+    def flush(table):
+        nonlocal written, rg
+        writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        entries.append(_runs(table["sid"].to_numpy(), written, rg))
+        written += table.num_rows
+        rg += 1
+
+    with pq.ParquetWriter(tmp, pf.schema_arrow, compression="zstd") as writer:
+        for batch in batches:
+            buf = pa.Table.from_batches([batch]) if buf is None else pa.concat_tables([buf, pa.Table.from_batches([batch])])
+            while buf.num_rows >= target_rows:
+                sid = buf["sid"].to_numpy()
+                bounds = np.flatnonzero(np.diff(sid[target_rows - 1:])) + target_rows
+                if not len(bounds):
+                    break
+                flush(buf.slice(0, int(bounds[0])))
+                buf = buf.slice(int(bounds[0]))
+        if buf is not None and buf.num_rows:
+            flush(buf)
+    os.replace(tmp, path)
+
+    index = pd.concat(entries, ignore_index=True) if entries else pd.DataFrame(columns=ROW_INDEX_COLUMNS[1:5])
+    if index["sid"].duplicated().any():
+        raise ValueError(f"{path}: securities span multiple row groups after clustering")
+    # 文件级行数 / 行组数用于读取端校验索引是否与文件同步
+    index["file_rows"] = np.int64(written)
+    index["file_row_groups"] = np.int32(rg)
+    return index
+
+
+def update_row_index(index_path, years):
+    """
+    把本次重写年份的索引并入数据集级索引文件：years 为 {年份: cluster_row_groups 的返回值}，
+    同年份旧条目整体替换，其余年份保留
+    """
+    old = pd.read_parquet(index_path) if os.path.exists(index_path) else pd.DataFrame(columns=ROW_INDEX_COLUMNS)
+    fresh = [df.assign(year=np.int16(y)) for y, df in years.items() if df is not None]
+    if not fresh:
+        return False
+    old = old[~old["year"].isin(list(years))]
+    out = pd.concat([old] + fresh, ignore_index=True)[ROW_INDEX_COLUMNS]
+    if out.duplicated(["year", "sid"]).any():
+        raise ValueError(f"{index_path}: expected exactly one row-index entry per (year, sid)")
+    out = out.astype({"year": np.int16, "sid": np.int32, "row_group": np.int32,
+                      "row_start": np.int64, "row_end": np.int64, "file_rows": np.int64, "file_row_groups": np.int32})
+    # 按 (sid, year) 排序：单只代码跨年份的条目相邻，读取端按 sid 过滤只命中一个行组
+    out.sort_values(["sid", "year"], kind="stable").to_parquet(index_path, index=False, row_group_size=65536)
+    return True
+
+
+def read_indexed(pf, entries, columns=None):
+    """
+    按索引条目直接定位行组并截取行区间：只解码命中的行组，不依赖 footer 统计做裁剪。
+    entries 为同一文件的索引行（row_group / row_start / row_end），返回按条目顺序拼接的表
+    """
+    meta = pf.metadata
+    rg_offsets = np.concatenate([[0], np.cumsum([meta.row_group(i).num_rows for i in range(meta.num_row_groups)])])
+    groups = sorted(set(entries["row_group"].tolist()))
+    table = pf.read_row_groups(groups, columns=columns)
+    # 行组拼接后的起始行号，用于把文件级行号换算为表内行号
+    base = {g: int(b) for g, b in zip(groups, np.concatenate([[0], np.cumsum([meta.row_group(g).num_rows for g in groups])]))}
+    take = np.concatenate([
+        np.arange(r.row_start, r.row_end) - rg_offsets[r.row_group] + base[r.row_group]
+        for r in entries.itertuples()
+    ]) if len(entries) else np.array([], dtype=np.int64)
+    return table.take(pa.array(take, type=pa.int64()))
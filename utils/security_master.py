@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+# sid = 市场号 * 1_000_000 + 数字代码，int32 即可容纳；无需查表即可在任意环节独立编码，跨批次稳定
+EXCHANGE_IDS = {"sh": 1, "sz": 2, "bj": 3}
+SECTOR_EXCHANGE = 4
+EXCHANGE_PREFIXES = {v: k for k, v in EXCHANGE_IDS.items()}
+SID_BASE = 1_000_000
+INVALID_SID = -1
+
+SECURITY_MASTER_COLUMNS = ["sid", "code", "tdx_code", "pure_code", "name", "kind"]
+
+
+def _bare_exchange(digits):
+    """无市场前缀的 6 位代码（F10 / 主营 / 预告 / 成分股）按号段推断市场"""
+    first = digits.str[:1]
+    return pd.Series(
+        np.select(
+            [digits.str.startswith("92"), first.isin(["6", "9", "5"]), first.isin(["4", "8"])],
+            [EXCHANGE_IDS["bj"], EXCHANGE_IDS["sh"], EXCHANGE_IDS["bj"]],
+            EXCHANGE_IDS["sz"],
+        ),
+        index=digits.index,
+    )
+
+
+def encode_codes(codes):
+    """
+    任意形态代码 → int32 sid 数组：sh.600000 / sh600000 / SH600000 / 600000 / BK1043 / 90.BK1043。
+    无法识别的代码编码为 -1
+    """
+    s = pd.Series(codes, dtype="object").astype(str).str.lower().str.replace(".", "", regex=False)
+    digits = s.str.extract(r"(\d+)$", expand=False)
+    num = pd.to_numeric(digits, errors="coerce")
+
+    exchange = s.str[:2].map(EXCHANGE_IDS)
+    bare = s.str.fullmatch(r"\d{6}")
+    exchange = exchange.where(~bare, _bare_exchange(digits.fillna("")))
+    exchange = exchange.where(~s.str.contains("bk", regex=False), SECTOR_EXCHANGE)
+
+    sid = exchange * SID_BASE + num
+    valid = sid.notna() & (num < SID_BASE)
+    return np.where(valid, sid.fillna(0), INVALID_SID).astype(np.int32)
+
+
+def decode_sids(sids, style="dot"):
+    """
+    sid 数组 → 代码字符串数组。style: dot（sh.600000，K 线/资金流口径）、tdx（sh600000，Go 引擎口径）、
+    pure（600000，F10/主营/预告口径）；板块恒为 BK1043，-1 解码为空串
+    """
+    sids = np.asarray(sids, dtype=np.int64)
+    exchange = pd.Series(sids // SID_BASE)
+    num = pd.Series(sids % SID_BASE).astype(str)
+
+    is_sector = exchange == SECTOR_EXCHANGE
+    pure = num.str.zfill(6).where(~is_sector, num.str.zfill(4))
+    prefix = exchange.map(EXCHANGE_PREFIXES).fillna("")
+    if style == "dot":
+        out = prefix + "." + pure
+    elif style == "tdx":
+        out = prefix + pure
+    elif style == "pure":
+        out = pure
+    else:
+        raise ValueError(f"unknown sid style: {style}")
+
+    out = out.where(~is_sector, "BK" + pure)
+    return out.where(sids >= 0, "").values
+
+
+# DuckDB 端等价编码，供小表（财报、主营、预告）及缺少 sid 列的历史分片在视图中即时补齐
+SID_SQL_MACROS = f"""
+    CREATE OR REPLACE TEMP MACRO _sid_norm(c) AS lower(replace(CAST(c AS VARCHAR), '.', ''));
+    CREATE OR REPLACE TEMP MACRO _sid_digits(c) AS regexp_extract(_sid_norm(c), '(\\d+)$', 1);
+    CREATE OR REPLACE TEMP MACRO code_sid(c) AS COALESCE(CAST(
+        CASE
+            WHEN contains(_sid_norm(c), 'bk') THEN {SECTOR_EXCHANGE}
+            WHEN left(_sid_norm(c), 2) = 'sh' THEN {EXCHANGE_IDS['sh']}
+            WHEN left(_sid_norm(c), 2) = 'sz' THEN {EXCHANGE_IDS['sz']}
+            WHEN left(_sid_norm(c), 2) = 'bj' THEN {EXCHANGE_IDS['bj']}
+            WHEN NOT regexp_full_match(_sid_norm(c), '\\d{{6}}') THEN NULL
+            WHEN left(_sid_norm(c), 2) = '92' THEN {EXCHANGE_IDS['bj']}
+            WHEN left(_sid_norm(c), 1) IN ('6', '9', '5') THEN {EXCHANGE_IDS['sh']}
+            WHEN left(_sid_norm(c), 1) IN ('4', '8') THEN {EXCHANGE_IDS['bj']}
+            ELSE {EXCHANGE_IDS['sz']}
+        END * {SID_BASE} + TRY_CAST(_sid_digits(c) AS INTEGER) AS INTEGER), {INVALID_SID});
+"""
+
+
+def register_sid_macros(con):
+    """在 DuckDB 连接上注册 code_sid(code) 宏，与 encode_codes 逐值一致"""
+    for stmt in SID_SQL_MACROS.split(";"):
+        if stmt.strip():
+            con.execute(stmt)
+
+
+def build_security_master(stocks=None, indexes=None, sectors=None):
+    """
+    汇总个股 / 指数 / 板块三类标的为统一证券主表，每个 sid 一行，附带三种代码形态。
+    各输入为至少含 code、name（板块列表的名称列也为 name）的 DataFrame
+    """
+    frames = []
+    for df, kind in ((stocks, "stock"), (indexes, "index"), (sectors, "sector")):
+        if df is None or df.empty:
+            continue
+        name_col = "code_name" if "code_name" in df.columns else "name"
+        frames.append(pd.DataFrame({"code": df["code"].astype(str).values, "name": df[name_col].values, "kind": kind}))
+    if not frames:
+        return pd.DataFrame(columns=SECURITY_MASTER_COLUMNS)
+
+    master = pd.concat(frames, ignore_index=True)
+    master["sid"] = encode_codes(master["code"])
+    master = master[master["sid"] >= 0].drop_duplicates("sid", keep="first").sort_values("sid")
+    master["code"] = decode_sids(master["sid"], "dot")
+    master["tdx_code"] = decode_sids(master["sid"], "tdx")
+    master["pure_code"] = decode_sids(master["sid"], "pure")
+    return master[SECURITY_MASTER_COLUMNS].reset_index(drop=True)
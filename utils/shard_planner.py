@@ -0,0 +1,71 @@
+import os
+import json
+import math
+import heapq
+
+# 单分片固定开销（checkout、依赖安装、Go 编译、连接池测速），秒
+SHARD_OVERHEAD_SECONDS = 90.0
+# 分片内 K 线（Go 连接池）与资金流（aiohttp）的有效并发度，用于把单码耗时折算为墙钟时间
+KLINE_PARALLELISM = 16.0
+FLOW_PARALLELISM = 32.0
+# 无任何历史统计时的单码墙钟成本，秒
+DEFAULT_CODE_COST = 0.1
+# 每次重试的额外墙钟开销（重新排队、换源重连、限流器退避），秒；kline_ms 已含失败尝试本身的耗时
+RETRY_PENALTY_SECONDS = 2.0
+# 历史统计的指数滑动平均系数：新一次运行的权重
+STATS_ALPHA = 0.5
+
+def load_code_stats(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def update_code_stats(old, new, alpha=STATS_ALPHA):
+    """逐码逐字段做指数滑动平均；只在一侧出现的代码/字段原样保留"""
+    merged = dict(old)
+    for code, stat in new.items():
+        prev = old.get(code, {})
+        merged[code] = {
+            k: (round(alpha * v + (1 - alpha) * prev[k], 3) if k in prev else v)
+            for k, v in stat.items()
+        }
+        for k, v in prev.items():
+            merged[code].setdefault(k, v)
+    return merged
+
+def code_cost(stat):
+    """
+    单码在分片内占用的墙钟秒数：K 线与资金流两阶段串行，各自按并发度摊薄；
+    attempts（重试次数的滑动平均）> 1 的代码按每次重试追加固定开销，易失败的代码提前装箱、分散到各片
+    """
+    retries = max(stat.get("attempts", 1) - 1, 0)
+    kline = stat.get("kline_ms", 0) / 1000.0 + retries * RETRY_PENALTY_SECONDS
+    return kline / KLINE_PARALLELISM + stat.get("flow_ms", 0) / 1000.0 / FLOW_PARALLELISM
+
+def estimate_costs(codes, stats):
+    """有历史的代码取实测成本，新代码取已知成本的中位数；完全无历史时统一取默认值"""
+    known = sorted(code_cost(stats[c]) for c in codes if c in stats)
+    fallback = known[len(known) // 2] if known else DEFAULT_CODE_COST
+    return {c: code_cost(stats[c]) if c in stats else fallback for c in codes}
+
+def plan_shards(codes, stats, target_seconds, max_shards, min_shards=1):
+    """
+    LPT 装箱：分片数由目标墙钟时间推出（不超过 max_shards），代码按成本降序依次放入当前最轻的分片，
+    使最慢分片（决定整条流水线时延）尽量短。返回 (分片代码列表, 每片预估墙钟秒数)
+    """
+    costs = estimate_costs(codes, stats)
+    total = sum(costs.values())
+    budget = max(target_seconds - SHARD_OVERHEAD_SECONDS, 1.0)
+    n = min(max(math.ceil(total / budget), min_shards), max_shards, max(len(codes), 1))
+
+    heap = [(0.0, i) for i in range(n)]
+    shards = [[] for _ in range(n)]
+    loads = [0.0] * n
+    for code in sorted(codes, key=lambda c: (-costs[c], c)):
+        load, i = heapq.heappop(heap)
+        shards[i].append(code)
+        loads[i] = load + costs[code]
+        heapq.heappush(heap, (loads[i], i))
+
+    return shards, [SHARD_OVERHEAD_SECONDS + load for load in loads]
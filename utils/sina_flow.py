@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import datetime
+import random
+import asyncio
+import aiohttp
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+from utils.data_types import to_date32
+
+SINA_FLOW_URL = "https://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/MoneyFlow.ssl_qsfx_lscjfb"
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+# 新浪字段 → 入库列名；数值列以外的字段不解码
+FLOW_FIELDS = {
+    'netamount': 'net_amount',
+    'r0_net': 'main_net', 'r1_net': 'super_net',
+    'r2_net': 'large_net', 'r3_net': 'medium_net',
+    'r4_net': 'small_net',
+}
+
+
+def _to_float(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class FlowBatch:
+    """列式累加器：各股票的解析结果直接追加到列数组，最后一次性构造 DataFrame"""
+
+    def __init__(self):
+        self.columns = {"date": [], "code": [], **{col: [] for col in FLOW_FIELDS.values()}}
+
+    def extend(self, code, rows, start, end):
+        n = 0
+        for row in rows:
+            date = row.get('opendate')
+            if not date or date < start or date > end:
+                continue
+            self.columns["date"].append(date)
+            self.columns["code"].append(code)
+            for src, dst in FLOW_FIELDS.items():
+                self.columns[dst].append(_to_float(row.get(src)))
+            n += 1
+        return n
+
+    def to_frame(self):
+        return pd.DataFrame(self.columns)
+
+
+# 增量模式首页条数：日常运行距上次水位通常只差几个交易日
+INCREMENTAL_PAGE_SIZE = 30
+
+
+async def _fetch_page(session, code, page, num, retries):
+    """单页请求，HTTP 错误与异常按指数退避重试；返回解析后的行列表，失败返回 None"""
+    params = {"page": page, "num": num, "sort": "opendate", "asc": 0, "daima": code.replace(".", "")}
+    for attempt in range(retries):
+        try:
+            async with session.get(SINA_FLOW_URL, params=params) as resp:
+                if resp.status == 200:
+                    text = await resp.text()
+                    data = json.loads(text) if text.strip() not in ("", "null") else []
+                    return data or []
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            pass
+        # 新浪限流（456/5xx）与网络抖动：0.5s 起指数退避并加随机抖动，避免同批请求同时重试
+        await asyncio.sleep(0.5 * (2 ** attempt) + random.random() * 0.5)
+    return None
+
+
+async def _fetch_code(session, code, num, retries, watermark=None):
+    """
+    单只股票抓取。无水位时一次拉满 num 条；有水位时先取一小页（按日期倒序），
+    整页都比水位新时按几何倍增继续向前翻页：每次取“第 2 页、页长 = 已取条数”，
+    恰好接在已取数据之后，直到触及水位、返回短页或累计达到 num 条；任一页失败按整只失败处理
+    """
+    if watermark is None:
+        return await _fetch_page(session, code, 1, num, retries)
+
+    rows = await _fetch_page(session, code, 1, INCREMENTAL_PAGE_SIZE, retries)
+    if rows is None or len(rows) < INCREMENTAL_PAGE_SIZE:
+        return rows
+    page = rows
+    while len(rows) < num and min(r.get('opendate') or "" for r in page) > watermark:
+        size = len(rows)
+        page = await _fetch_page(session, code, 2, size, retries)
+        if page is None:
+            return None
+        rows = rows + page
+        if len(page) < size:
+            break
+    return rows
+
+
+async def fetch_flows_async(codes, start, end, concurrency=32, retries=3, num=10000, timeout=10, watermarks=None, stats=None):
+    """
+    asyncio 并发抓取新浪资金流：共享 keep-alive 连接池，信号量限制在途请求数。
+    watermarks 为 {code: 已入库最新日期}，命中的代码只抓取水位日及之后的数据。
+    stats 传入 dict 时按代码记录耗时与行数 {code: {"flow_ms", "flow_rows"}}。
+    返回 (列式 DataFrame, 失败代码列表)
+    """
+    watermarks = watermarks or {}
+    batch = FlowBatch()
+    failed = []
+    sem = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=client_timeout) as session:
+        async def worker(code):
+            async with sem:
+                t0 = time.monotonic()
+                rows = await _fetch_code(session, code, num, retries, watermarks.get(code))
+                return code, rows, int((time.monotonic() - t0) * 1000)
+
+        tasks = [asyncio.create_task(worker(c)) for c in codes]
+        for fut in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            code, rows, ms = await fut
+            n = 0
+            if rows is None:
+                failed.append(code)
+            else:
+                n = batch.extend(code, rows, max(start, watermarks.get(code, start)), end)
+            if stats is not None:
+                stats[code] = {"flow_ms": ms, "flow_rows": n}
+
+    return batch.to_frame(), sorted(failed)
+
+
+def fetch_flows(codes, start, end, concurrency=32, retries=3, watermarks=None, stats=None):
+    """同步入口：供 fetch_worker 等脚本直接调用"""
+    return asyncio.run(fetch_flows_async(
+        codes, start, end, concurrency=concurrency, retries=retries, watermarks=watermarks, stats=stats
+    ))
+
+
+def load_flow_store(path, codes, start, end):
+    """
+    读取已入库的 stock_money_flow_{y}.parquet 中本分片代码的数据（已清洗口径），
+    返回 (已入库 DataFrame, {code: 最新日期} 水位)；文件不存在时返回空
+    """
+    if not path or not os.path.exists(path):
+        return pd.DataFrame(), {}
+    # schema v2 的 date 为 date32，v1 为字符串：过滤边界按文件实际类型给出，水位统一为字符串
+    if pa.types.is_date(pq.read_schema(path).field("date").type):
+        lo, hi = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+    else:
+        lo, hi = start, end
+    stored = pq.read_table(
+        path, filters=[("code", "in", list(codes)), ("date", ">=", lo), ("date", "<=", hi)]
+    ).to_pandas()
+    if stored.empty:
+        return stored, {}
+    return stored, {c: str(d) for c, d in stored.groupby("code")["date"].max().items()}
+
+
+def merge_flow_store(stored, fresh):
+    """
+    已入库数据与增量数据拼接，同日同码以新抓取的为准；抓取失败的代码原样保留入库数据。
+    两者均为 DataCleaner.clean_money_flow 之后的口径
+    """
+    if stored.empty:
+        return fresh
+    # v1 入库文件的字符串日期与新抓取的 date32 对齐后再去重
+    stored = stored.assign(date=to_date32(stored["date"]).values)
+    merged = pd.concat([stored, fresh], ignore_index=True)
+    merged = merged.drop_duplicates(subset=["date", "code"], keep="last")
+    return merged.sort_values(["code", "date"])
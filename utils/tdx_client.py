@@ -0,0 +1,115 @@
+import os
+import json
+import queue
+import subprocess
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def read_engine_output(path):
+    """
+    读取 Go 引擎产物：.arrow 走 IPC 内存映射零解析，.parquet 直接列式读取，其余按旧版 CSV 处理
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame()
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".arrow":
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.to_pandas()
+    if ext == ".parquet":
+        return pq.read_table(path).to_pandas()
+    return pd.read_csv(path)
+
+
+class TdxEngineClient:
+    """
+    常驻 Go 引擎客户端：启动 ./tdx_fetcher -mode=serve，经 stdin/stdout 的 JSON 行协议下发请求，
+    整个进程生命周期内复用同一组 TDX 温连接与已解析的 GBBQ，避免每次调用都重新拨号、重新加载
+    """
+
+    def __init__(self, binary="./tdx_fetcher", gbbq="gbbq_clean.csv", concurrency=32, hosts=None, retries=3, timeout=None):
+        self.timeout = timeout
+        self._next_id = 0
+        self._events = queue.Queue()
+        cmd = [binary, "-mode=serve", f"-gbbq={gbbq}", f"-concurrency={concurrency}", f"-retries={retries}"]
+        if hosts:
+            cmd.append(f"-hosts={','.join(hosts)}")
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+        )
+        # 后台线程持续读取响应帧，主线程可按超时等待
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        for line in self.proc.stdout:
+            line = line.strip()
+            if line:
+                self._events.put(json.loads(line))
+        self._events.put(None)
+
+    def _request(self, op, on_code=None, **payload):
+        self._next_id += 1
+        req_id = self._next_id
+        self.proc.stdin.write(json.dumps({"id": req_id, "op": op, **payload}) + "\n")
+        self.proc.stdin.flush()
+
+        while True:
+            try:
+                event = self._events.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"Go engine did not answer '{op}' within {self.timeout}s")
+            if event is None:
+                raise RuntimeError(f"Go engine exited during '{op}' (code {self.proc.poll()})")
+            if event.get("id") != req_id:
+                continue
+            if event["event"] == "code":
+                if on_code:
+                    on_code(event)
+            elif event["event"] == "error":
+                raise RuntimeError(f"Go engine '{op}' failed: {event.get('error')}")
+            else:
+                return event
+
+    def list_stocks(self, out="stock_list_master.json"):
+        """获取 A 股列表，同时落盘 out（传 None 则只返回不落盘）"""
+        return self._request("list", out=out or "").get("stocks", [])
+
+    def fetch_klines(self, codes, out, fmt="arrow", since="", state="", state_out="", failed_out="", on_code=None):
+        """抓取个股 K 线写入 out，返回任务汇总 {codes, rows, retried, failed}；failed_out 非空时落盘重试后仍失败的代码"""
+        event = self._request(
+            "fetch", on_code=on_code, codes=list(codes), out=out, format=fmt,
+            since=since, state=state, state_out=state_out, failed_out=failed_out,
+        )
+        return event.get("summary", {})
+
+    def fetch_index(self, codes, out, fmt="arrow", failed_out="", on_code=None):
+        """抓取指数 K 线写入 out，返回任务汇总"""
+        event = self._request("index", on_code=on_code, codes=list(codes), out=out, format=fmt, failed_out=failed_out)
+        return event.get("summary", {})
+
+    def reload_gbbq(self, gbbq=""):
+        self._request("reload", gbbq=gbbq)
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                self._request("shutdown")
+            except (RuntimeError, TimeoutError, OSError):
+                pass
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()